@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析鏡像 - 將新的檢測記錄、檢測物件和用戶反饋增量追加到按日分區的 Parquet，
+大範圍報表從鏡像讀取，不與應用爭用 SQLite 文件
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 鏡像的數據集：查詢（按記錄ID遞增讀取）和 Parquet 欄位類型；day 為分區欄位，不寫入文件
+_DETECTION_SQL = '''
+    SELECT id, timestamp, substr(timestamp, 1, 10) AS day, detection_mode, total_detections,
+           total_price, image_digest, created_at
+    FROM detection_history
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+_ITEM_SQL = '''
+    SELECT i.record_id, h.timestamp, substr(h.timestamp, 1, 10) AS day, h.detection_mode,
+           i.item_index, i.category_id, c.name AS category, i.confidence, i.relative_area,
+           i.weight, i.price, i.model_source
+    FROM detection_items AS i
+    JOIN detection_history AS h ON h.id = i.record_id
+    LEFT JOIN categories AS c ON c.id = i.category_id
+    WHERE i.record_id BETWEEN ? AND ?
+'''
+_FEEDBACK_SQL = '''
+    SELECT id, timestamp, substr(timestamp, 1, 10) AS day, feedback_type, content,
+           CASE WHEN json_valid(user_rating)
+                THEN CAST(json_extract(user_rating, '$.overall') AS REAL) END AS rating,
+           user_rating, created_at
+    FROM user_feedback
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+
+DATASETS = {
+    'detections': (('id', 'int64'), ('timestamp', 'string'), ('day', 'string'), ('detection_mode', 'string'),
+                   ('total_detections', 'int64'), ('total_price', 'float64'), ('image_digest', 'string'),
+                   ('created_at', 'string')),
+    'items': (('record_id', 'int64'), ('timestamp', 'string'), ('day', 'string'), ('detection_mode', 'string'),
+              ('item_index', 'int64'), ('category_id', 'int64'), ('category', 'string'),
+              ('confidence', 'float64'), ('relative_area', 'float64'), ('weight', 'float64'),
+              ('price', 'float64'), ('model_source', 'string')),
+    'feedback': (('id', 'int64'), ('timestamp', 'string'), ('day', 'string'), ('feedback_type', 'string'),
+                 ('content', 'string'), ('rating', 'float64'), ('user_rating', 'string'),
+                 ('created_at', 'string'))
+}
+
+# 同步的來源表：水位（最後同步的記錄ID）按來源記錄；items 與 detections 同批同步
+_SOURCES = {'detections': ('detections', 'items'), 'feedback': ('feedback',)}
+
+# 分區文件名記錄所含的記錄ID範圍
+_PART_FILE = re.compile(r'^part-(\d+)-(\d+)\.parquet$')
+_STATE_FILE = '_sync_state.json'
+
+
+def _load_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("分析鏡像需要安裝 pyarrow: pip install pyarrow") from e
+    return pa, pq
+
+
+def _part_name(first_id: int, last_id: int) -> str:
+    return f"part-{first_id:012d}-{last_id:012d}.parquet"
+
+
+class AnalyticsMirror:
+    """按日分區的 Parquet 鏡像（root/<數據集>/day=YYYY-MM-DD/part-<首ID>-<末ID>.parquet）
+
+    只追加新記錄（按ID水位），已同步記錄之後的修改（如重新計價）不會回寫；
+    保留策略刪除 SQLite 中的舊記錄不影響鏡像，鏡像可作為完整的歷史數據。
+    """
+
+    def __init__(self, db_manager, root: str = "data/analytics", chunk_size: int = 50000):
+        self.db_manager = db_manager
+        self.root = root
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, db_manager, **overrides):
+        """按性能配置創建鏡像"""
+        from src.performance_config import get_performance_config
+
+        config = get_performance_config().get_analytics_mirror_config()
+        config.pop('interval')
+        config.update(overrides)
+        return cls(db_manager, **config)
+
+    def _dataset_dir(self, dataset: str) -> str:
+        return os.path.join(self.root, dataset)
+
+    def _load_state(self) -> Dict[str, int]:
+        try:
+            with open(os.path.join(self.root, _STATE_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self, state: Dict[str, int]):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, _STATE_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+
+    def _partitions(self, dataset: str) -> List[str]:
+        directory = self._dataset_dir(dataset)
+        if not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                if name.startswith('day=')]
+
+    @staticmethod
+    def _part_files(partition: str) -> List[tuple]:
+        """分區中的文件 [(首ID, 末ID, 路徑)]"""
+        files = []
+        for name in os.listdir(partition):
+            match = _PART_FILE.match(name)
+            if match:
+                files.append((int(match.group(1)), int(match.group(2)), os.path.join(partition, name)))
+        return sorted(files)
+
+    def _cleanup(self, dataset: str, watermark: int):
+        """清理中斷留下的文件：水位之後的文件（未提交的同步）、被合併文件覆蓋的舊文件、臨時文件"""
+        for partition in self._partitions(dataset):
+            for name in os.listdir(partition):
+                if name.startswith('.'):
+                    os.remove(os.path.join(partition, name))
+            files = self._part_files(partition)
+            for first, last, path in files:
+                covered = any(other_first <= first and last <= other_last and other_path != path
+                              for other_first, other_last, other_path in files)
+                if first > watermark or covered:
+                    os.remove(path)
+
+    def _write_partitions(self, dataset: str, rows: List[tuple], first_id: int, last_id: int
+                          ) -> List[Tuple[str, str]]:
+        """按日分組寫入臨時文件，返回 [(臨時路徑, 最終路徑)]；由調用方統一改名"""
+        pa, pq = _load_pyarrow()
+        columns = DATASETS[dataset]
+        day_index = [name for name, _ in columns].index('day')
+        schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in columns
+                            if name != 'day'])
+
+        by_day = defaultdict(list)
+        for row in rows:
+            by_day[row[day_index]].append(row)
+
+        written = []
+        for day, day_rows in by_day.items():
+            partition = os.path.join(self._dataset_dir(dataset), f"day={day}")
+            os.makedirs(partition, exist_ok=True)
+            file_name = _part_name(first_id, last_id)
+            temp_path = os.path.join(partition, f".{file_name}.tmp")
+            table = pa.Table.from_pydict(
+                {column: [row[index] for row in day_rows]
+                 for index, (column, _) in enumerate(columns) if index != day_index},
+                schema=schema)
+            pq.write_table(table, temp_path)
+            written.append((temp_path, os.path.join(partition, file_name)))
+        return written
+
+    def _sync_source(self, source: str, state: Dict[str, int],
+                     progress: Optional[Callable[[Dict], None]] = None) -> int:
+        watermark = state.get(source, 0)
+        for dataset in _SOURCES[source]:
+            self._cleanup(dataset, watermark)
+
+        synced = 0
+        while True:
+            with self.db_manager.connections.connection() as conn:
+                if source == 'detections':
+                    rows = conn.execute(_DETECTION_SQL, (watermark, self.chunk_size)).fetchall()
+                    # 檢測物件與所屬記錄在同一事務中寫入，記錄可見時物件也已可見
+                    items = conn.execute(_ITEM_SQL, (rows[0][0], rows[-1][0])).fetchall() if rows else []
+                else:
+                    rows = conn.execute(_FEEDBACK_SQL, (watermark, self.chunk_size)).fetchall()
+            if not rows:
+                return synced
+
+            first_id, last_id = watermark + 1, rows[-1][0]
+            written = self._write_partitions(_SOURCES[source][0], rows, first_id, last_id)
+            if source == 'detections' and items:
+                written += self._write_partitions('items', items, first_id, last_id)
+            for temp_path, path in written:
+                os.replace(temp_path, path)
+            # 水位在文件就位後才推進；中途退出時，下次同步會清理水位之後的文件並重做
+            watermark = state[source] = last_id
+            self._save_state(state)
+
+            synced += len(rows)
+            if progress is not None:
+                progress({'source': source, 'rows': synced, 'watermark': watermark})
+            if len(rows) < self.chunk_size:
+                return synced
+
+    def sync(self, progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """把上次同步之後的新記錄追加到鏡像，返回 {detections, feedback, elapsed}"""
+        start_time = time.time()
+        with self._lock:
+            state = self._load_state()
+            stats = {source: self._sync_source(source, state, progress) for source in _SOURCES}
+        stats['elapsed'] = time.time() - start_time
+        return stats
+
+    def compact(self, min_files: int = 8) -> int:
+        """合併文件數達到 min_files 的分區（頻繁同步會產生很多小文件），返回合併的分區數"""
+        pa, pq = _load_pyarrow()
+        compacted = 0
+        with self._lock:
+            state = self._load_state()
+            for source, datasets in _SOURCES.items():
+                for dataset in datasets:
+                    self._cleanup(dataset, state.get(source, 0))
+            for dataset in DATASETS:
+                for partition in self._partitions(dataset):
+                    files = self._part_files(partition)
+                    if len(files) < min_files:
+                        continue
+                    table = pa.concat_tables([pq.read_table(path) for _, _, path in files])
+                    name = _part_name(files[0][0], max(last for _, last, _ in files))
+                    temp_path = os.path.join(partition, f".{name}.tmp")
+                    pq.write_table(table, temp_path)
+                    os.replace(temp_path, os.path.join(partition, name))
+                    # 刪除舊文件前退出時，下次同步的清理會刪除被覆蓋的文件
+                    for _, _, path in files:
+                        if os.path.basename(path) != name:
+                            os.remove(path)
+                    compacted += 1
+        return compacted
+
+    def dataset(self, name: str):
+        """以 pyarrow.dataset 打開鏡像的數據集（day 為分區欄位）"""
+        pa, _ = _load_pyarrow()
+        import pyarrow.dataset as ds
+
+        partitioning = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+        directory = self._dataset_dir(name)
+        if not os.path.isdir(directory):
+            schema = pa.schema([(column, pa.type_for_alias(type_name)) for column, type_name in DATASETS[name]])
+            return ds.dataset(pa.table({column: [] for column in schema.names}, schema=schema))
+        return ds.dataset(directory, format='parquet', partitioning=partitioning)
+
+    def read(self, name: str, since: Optional[str] = None, until: Optional[str] = None,
+             columns: Optional[List[str]] = None):
+        """讀取數據集為 pyarrow.Table（since / until 為 ISO 時間字符串，按日分區裁剪）"""
+        import pyarrow.dataset as ds
+
+        condition = None
+        for expression in ((ds.field('day') >= since[:10]) & (ds.field('timestamp') >= since) if since else None,
+                           (ds.field('day') <= until[:10]) & (ds.field('timestamp') < until) if until else None):
+            if expression is not None:
+                condition = expression if condition is None else condition & expression
+        return self.dataset(name).to_table(columns=columns, filter=condition)
+
+    def detection_series(self, bucket: str = 'day', since: Optional[str] = None,
+                         until: Optional[str] = None) -> List[Dict]:
+        """按時間分桶統計檢測記錄（欄位與 DatabaseManager.get_detection_series 相同）"""
+        import pyarrow.compute as pc
+
+        table = self.read('detections', since, until, ['timestamp', 'day', 'total_detections', 'total_price'])
+        if bucket == 'hour':
+            keys = pc.binary_join_element_wise(pc.utf8_slice_codeunits(table['timestamp'], 0, 13), ':00', '')
+        elif bucket == 'day':
+            keys = table['day']
+        elif bucket == 'week':
+            days = pc.strptime(table['day'], format='%Y-%m-%d', unit='s')
+            keys = pc.strftime(pc.floor_temporal(days, unit='week', week_starts_monday=True), format='%Y-%m-%d')
+        else:
+            raise ValueError(f"不支持的分桶: {bucket}")
+
+        grouped = table.append_column('bucket', keys).group_by('bucket').aggregate([
+            ('bucket', 'count'), ('total_detections', 'sum'), ('total_price', 'sum')
+        ]).sort_by('bucket')
+        series, cumulative = [], 0.0
+        for row in grouped.to_pylist():
+            value = row['total_price_sum'] or 0.0
+            cumulative += value
+            series.append({'bucket': row['bucket'], 'records': row['bucket_count'],
+                           'detections': row['total_detections_sum'] or 0, 'total_value': value,
+                           'cumulative_value': cumulative})
+        return series
+
+    def category_totals(self, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict]:
+        """按類別統計物件數量、總重量和總價值（按總價值降序）"""
+        table = self.read('items', since, until, ['category_id', 'category', 'weight', 'price'])
+        grouped = table.group_by(['category_id', 'category']).aggregate([
+            ('category_id', 'count'), ('weight', 'sum'), ('price', 'sum')
+        ])
+        totals = [{'category_id': row['category_id'], 'category': row['category'],
+                   'item_count': row['category_id_count'], 'total_weight': row['weight_sum'] or 0.0,
+                   'total_value': row['price_sum'] or 0.0} for row in grouped.to_pylist()]
+        return sorted(totals, key=lambda row: row['total_value'], reverse=True)
+
+    def query(self, sql: str):
+        """用 DuckDB 執行 SQL（可查詢 detections、items、feedback 三個視圖），返回 pandas.DataFrame"""
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("SQL 查詢需要安裝 duckdb: pip install duckdb") from e
+
+        conn = duckdb.connect()
+        try:
+            for name in DATASETS:
+                pattern = os.path.join(self._dataset_dir(name), '*', '*.parquet').replace("'", "''")
+                if os.path.isdir(self._dataset_dir(name)):
+                    conn.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{pattern}', "
+                                 f"hive_partitioning = true)")
+            return conn.execute(sql).fetchdf()
+        finally:
+            conn.close()
+
+
+class MirrorScheduler:
+    """在背景線程中定期同步分析鏡像"""
+
+    def __init__(self, mirror: AnalyticsMirror, interval: float = 300.0):
+        self.mirror = mirror
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_stats: Optional[Dict] = None
+        self.last_sync: Optional[float] = None
+
+    def start(self):
+        """啟動背景線程（啟動後先同步一次）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="analytics-mirror", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.last_stats = self.mirror.sync()
+                self.last_sync = time.time()
+            except Exception as e:
+                print(f"⚠️ 同步分析鏡像失敗: {e}")
+            self._stop.wait(self.interval)
+
+    def is_fresh(self, max_age: Optional[float] = None) -> bool:
+        """最近一次同步是否在 max_age 秒內成功（預設為兩個同步間隔）"""
+        if self.last_sync is None:
+            return False
+        max_age = 2 * self.interval if max_age is None else max_age
+        return time.time() - self.last_sync <= max_age
+
+    def stop(self):
+        """停止背景線程"""
+        self._stop.set()
+
+
+def start_mirror_scheduler(db_manager) -> Optional[MirrorScheduler]:
+    """按配置啟動分析鏡像同步（ANALYTICS_MIRROR_INTERVAL 為 0 時不啟動）"""
+    from src.performance_config import get_performance_config
+
+    config = get_performance_config().get_analytics_mirror_config()
+    if config['interval'] <= 0:
+        return None
+    scheduler = MirrorScheduler(AnalyticsMirror.from_config(db_manager), config['interval'])
+    scheduler.start()
+    return scheduler
+
+
+def main():
+    """命令行入口"""
+    import argparse
+    from src.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="同步和查詢 Parquet 分析鏡像")
+    parser.add_argument('command', choices=['sync', 'compact', 'report', 'query'], help="操作")
+    parser.add_argument('sql', nargs='?', help="query 的 SQL（視圖: detections, items, feedback）")
+    parser.add_argument('--db-path', default="data/recycling_app.db", help="數據庫路徑")
+    parser.add_argument('--root', help="鏡像目錄")
+    parser.add_argument('--bucket', choices=['hour', 'day', 'week'], default='day', help="report 的時間粒度")
+    parser.add_argument('--since', help="開始時間（ISO 格式，含）")
+    parser.add_argument('--until', help="結束時間（ISO 格式，不含）")
+    args = parser.parse_args()
+
+    overrides = {'root': args.root} if args.root else {}
+    mirror = AnalyticsMirror.from_config(DatabaseManager(args.db_path), **overrides)
+
+    if args.command == 'sync':
+        def report(progress):
+            print(f"📦 {progress['source']}: 已同步 {progress['rows']} 條記錄（ID ≤ {progress['watermark']}）")
+
+        stats = mirror.sync(progress=report)
+        print(f"✅ 同步完成: {stats['detections']} 條檢測記錄、{stats['feedback']} 條反饋，"
+              f"耗時 {stats['elapsed']:.1f} 秒")
+    elif args.command == 'compact':
+        print(f"✅ 已合併 {mirror.compact()} 個分區")
+    elif args.command == 'report':
+        for row in mirror.detection_series(args.bucket, args.since, args.until):
+            print(f"{row['bucket']}  記錄 {row['records']:>8}  物件 {row['detections']:>8}  "
+                  f"價值 ${row['total_value']:>12.2f}  累計 ${row['cumulative_value']:>12.2f}")
+    else:
+        if not args.sql:
+            parser.error("query 需要 SQL")
+        print(mirror.query(args.sql).to_string())
+
+
+if __name__ == "__main__":
+    main()
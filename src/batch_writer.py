@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+背景批量寫入 - 有界隊列 + 背景線程累積成批寫入，失敗時退避重試並逐條寫入
+"""
+
+import atexit
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class BatchWriter:
+    """背景批量寫入的共用實現（延後寫入和性能指標記錄共用）
+
+    子類實現 _write_batch(items)：在一個事務中寫入一組記錄，失敗時拋出異常。
+    一批寫入失敗時先按指數退避重試；仍然失敗則逐條寫入，找出無法寫入的記錄，
+    其餘記錄照常寫入。逐條寫入也失敗的記錄重新放回隊列，超過重試輪數後才丟棄。
+    """
+
+    thread_name = "batch-writer"
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.5, max_queue: int = 5000,
+                 max_retries: int = 3, retry_backoff: float = 0.2, max_requeues: int = 3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_requeues = max_requeues
+        # 隊列元素為 (記錄, 已重新入隊次數)
+        self._queue: "queue.Queue[Tuple[Any, int]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0, 'written': 0, 'failed': 0, 'dropped': 0, 'retries': 0, 'requeued': 0,
+            'batches': 0, 'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0
+        }
+
+    def _write_batch(self, items: List[Any]):
+        """在一個事務中寫入一組記錄（子類實現）"""
+        raise NotImplementedError
+
+    def _partition(self, items: List[Any]) -> List[List[Any]]:
+        """把一批記錄分成分別寫入的組（每組一個事務，預設整批一組）"""
+        return [items]
+
+    def _count(self, key: str, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                    self._thread.start()
+                    atexit.register(self.close)
+
+    def _enqueue(self, item: Any) -> bool:
+        """放入隊列，隊列已滿時返回 False（由調用方決定同步寫入或丟棄）"""
+        self._ensure_started()
+        self._count('submitted')
+        try:
+            self._queue.put_nowait((item, 0))
+            return True
+        except queue.Full:
+            return False
+
+    def _drain(self, first: Optional[Tuple[Any, int]] = None) -> List[Tuple[Any, int]]:
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_with_retry(self, items: List[Any]):
+        """寫入一組記錄，失敗時按指數退避重試，重試用盡後拋出最後的異常"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._write_lock:
+                    self._write_batch(items)
+                return
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+                self._count('retries')
+                time.sleep(self.retry_backoff * (2 ** attempt))
+
+    def _write_sync(self, items: List[Any]):
+        """同步寫入（調用方線程），重試後仍失敗時拋出異常，由調用方處理"""
+        self._write_with_retry(items)
+        self._count('written', len(items))
+
+    def _write(self, entries: List[Tuple[Any, int]]):
+        """背景寫入一批記錄（不拋出異常）"""
+        if not entries:
+            return
+        start_time = time.perf_counter()
+        written = 0
+        for group in self._partition(entries):
+            items = [item for item, _ in group]
+            try:
+                self._write_with_retry(items)
+                written += len(items)
+            except Exception as e:
+                print(f"⚠️ 批量寫入失敗（{len(items)} 條記錄），改為逐條寫入: {e}")
+                written += self._write_each(group)
+
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        with self._stats_lock:
+            self._stats['written'] += written
+            self._stats['batches'] += 1
+            self._stats['last_flush_ms'] = elapsed_ms
+            self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed_ms)
+            self._stats['total_flush_ms'] += elapsed_ms
+
+    def _write_each(self, group: List[Tuple[Any, int]]) -> int:
+        """逐條寫入，失敗的記錄重新入隊（次數用盡或隊列已滿時丟棄），返回成功條數"""
+        written = 0
+        for item, requeues in group:
+            try:
+                with self._write_lock:
+                    self._write_batch([item])
+                written += 1
+            except Exception as e:
+                if not self._requeue(item, requeues):
+                    self._count('failed')
+                    print(f"⚠️ 記錄寫入失敗，已丟棄: {e}")
+        return written
+
+    def _requeue(self, item: Any, requeues: int) -> bool:
+        if requeues >= self.max_requeues:
+            return False
+        try:
+            self._queue.put_nowait((item, requeues + 1))
+        except queue.Full:
+            return False
+        self._count('requeued')
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # 稍等片刻（最多 1 秒）以累積一批再寫入
+            self._stop.wait(min(1.0, self.flush_interval))
+            self._write(self._drain(first))
+
+    def flush(self):
+        """立即寫入隊列中的所有記錄"""
+        while not self._queue.empty():
+            self._write(self._drain())
+
+    def close(self):
+        """停止背景線程並寫入剩餘記錄"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def get_stats(self) -> Dict:
+        """獲取寫入統計（queue_depth = 待寫入記錄數，flush 耗時單位 ms）"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量導入 - 流式解析大型 JSON / JSONL 文件，分批事務寫入檢測歷史和用戶反饋
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+from src.database_manager import detection_item_rows
+
+_SEPARATORS = re.compile(r'[\s,]*')
+
+# 導入期間暫時刪除、結束後重建的索引所屬的表
+_INDEXED_TABLES = {
+    'detections': ('detection_history', 'detection_items'),
+    'feedback': ('user_feedback',)
+}
+
+
+def iter_json_records(path: str, skip: int = 0, chunk_size: int = 1 << 20) -> Iterator[Optional[Dict]]:
+    """逐條讀取 JSON 陣列或 JSONL 文件中的記錄，不把整個文件載入內存
+
+    JSONL 中無法解析的行返回 None（仍計入位置，便於續跑時跳過）；
+    skip 為跳過的記錄數，JSONL 跳過時不解析。
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        head = f.read(chunk_size)
+        if not head.lstrip().startswith('['):
+            # JSONL：每行一條記錄
+            f.seek(0)
+            position = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                position += 1
+                if position <= skip:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+            return
+
+        # JSON 陣列：用 raw_decode 從當前位置逐個解析元素，讀取新內容時丟棄已解析的部分
+        decoder = json.JSONDecoder()
+        buffer = head
+        pos = head.index('[') + 1
+        eof = False
+        position = 0
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer) and not eof:
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+                continue
+            if pos == len(buffer) or buffer[pos] == ']':
+                return
+            try:
+                record, pos_end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # 記錄跨越了緩衝區邊界，讀取更多內容後重試
+                more = '' if eof else f.read(chunk_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            pos = pos_end
+            position += 1
+            if position > skip:
+                yield record
+
+
+def _json_text(value) -> Optional[str]:
+    return json.dumps(value, ensure_ascii=False) if value is not None else None
+
+
+def _feedback_row(record: Dict) -> tuple:
+    return (
+        record.get('timestamp') or datetime.now().isoformat(),
+        record.get('type') or record.get('feedback_type') or '其他',
+        record.get('content') or '',
+        _json_text(record.get('detection_results')),
+        _json_text(record.get('user_rating'))
+    )
+
+
+def _detection_row(record: Dict) -> tuple:
+    results = record.get('detection_results')
+    return (
+        record.get('timestamp') or datetime.now().isoformat(),
+        record.get('image_path'),
+        record.get('detection_mode'),
+        record.get('total_detections', len(results) if isinstance(results, list) else None),
+        _json_text(results),
+        record.get('total_price'),
+        record.get('image_digest')
+    )
+
+
+class BulkImporter:
+    """高吞吐量導入器
+
+    使用專用連接（導入用的 pragma 不影響連接池），每批記錄和進度在同一個事務中提交，
+    中斷或出錯後從最後提交的批次繼續；可在導入期間刪除二級索引，結束後一次重建。
+    """
+
+    def __init__(self, db_manager, batch_size: int = 5000, pragmas: Optional[Dict[str, object]] = None,
+                 defer_indexes: bool = True):
+        self.db_manager = db_manager
+        self.db_path = db_manager.db_path
+        self.batch_size = batch_size
+        self.pragmas = dict(pragmas or {})
+        self.defer_indexes = defer_indexes
+
+    @classmethod
+    def from_config(cls, db_manager, **overrides):
+        """按性能配置創建導入器"""
+        from src.performance_config import get_performance_config
+
+        config = get_performance_config().get_bulk_import_config()
+        config.update(overrides)
+        return cls(db_manager, **config)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.pragmas.get('busy_timeout', 30000) / 1000)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        return conn
+
+    @staticmethod
+    def _checkpoint_key(path: str) -> str:
+        return f"bulk_import:{os.path.abspath(path)}"
+
+    def _load_checkpoint(self, conn, path: str) -> Optional[Dict]:
+        row = conn.execute('SELECT value FROM system_settings WHERE key = ?',
+                           (self._checkpoint_key(path),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save_checkpoint(self, conn, path: str, state: Dict):
+        conn.execute('''
+            INSERT OR REPLACE INTO system_settings (key, value, updated_at)
+            VALUES (?, ?, ?)
+        ''', (self._checkpoint_key(path), json.dumps(state), datetime.now().isoformat()))
+
+    def _drop_indexes(self, conn, dataset: str) -> List[str]:
+        """刪除數據集相關表的二級索引，返回重建用的 SQL"""
+        tables = _INDEXED_TABLES[dataset]
+        placeholders = ','.join('?' * len(tables))
+        indexes = conn.execute(f'''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+        ''', tables).fetchall()
+        for name, _ in indexes:
+            conn.execute(f'DROP INDEX IF EXISTS {name}')
+        conn.commit()
+        return [sql for _, sql in indexes]
+
+    def _insert_feedback(self, conn, records: List[Dict]):
+        # 與檢測記錄一樣分配新的ID（不保留舊ID），分析鏡像按ID水位同步時不會遺漏導入的反饋
+        conn.executemany('''
+            INSERT INTO user_feedback
+            (timestamp, feedback_type, content, detection_results, user_rating)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [_feedback_row(record) for record in records])
+
+    def _insert_detections(self, conn, records: List[Dict], item_rows: List[List[tuple]]):
+        # 在寫事務中預先分配連續的ID，executemany 後仍能寫入對應的檢測物件
+        # （不重用已刪除記錄的ID，與 AUTOINCREMENT 一致）
+        first_id = conn.execute('''
+            SELECT MAX(COALESCE((SELECT MAX(id) FROM detection_history), 0),
+                       COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'detection_history'), 0)) + 1
+        ''').fetchone()[0]
+        record_ids = range(first_id, first_id + len(records))
+        conn.executemany('''
+            INSERT INTO detection_history
+            (id, timestamp, image_path, detection_mode, total_detections, detection_results, total_price,
+             image_digest)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(record_id, *_detection_row(record)) for record_id, record in zip(record_ids, records)])
+        self.db_manager.write_detection_items(conn, list(zip(record_ids, item_rows)), replace=False)
+
+    def _write_batch(self, conn, dataset: str, records: List[Dict], path: str, state: Dict):
+        # 類別ID可能需要分配（經連接池寫入），必須在開始導入事務之前完成
+        item_rows = ([detection_item_rows(record.get('detection_results')
+                                          if isinstance(record.get('detection_results'), list) else [])
+                      for record in records] if dataset == 'detections' else None)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if dataset == 'detections':
+                self._insert_detections(conn, records, item_rows)
+            else:
+                self._insert_feedback(conn, records)
+            self._save_checkpoint(conn, path, state)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def import_file(self, path: str, dataset: str, resume: bool = True,
+                    progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """導入 JSON / JSONL 文件，返回統計 {rows, invalid, position, completed, elapsed, rows_per_sec}
+
+        同一文件（大小和修改時間不變）已完成導入時直接返回；resume=False 時從頭開始。
+        """
+        if dataset not in _INDEXED_TABLES:
+            raise ValueError(f"未知的數據集: {dataset}")
+
+        file_state = os.stat(path)
+        fingerprint = {'size': file_state.st_size, 'mtime': file_state.st_mtime}
+        stats = {'rows': 0, 'invalid': 0, 'position': 0, 'completed': False}
+        start_time = time.time()
+
+        conn = self._connect()
+        conn.isolation_level = None  # 手動管理事務
+        dropped_indexes: List[str] = []
+        try:
+            state = self._load_checkpoint(conn, path) if resume else None
+            if state is None or state.get('fingerprint') != fingerprint:
+                if state is not None:
+                    print(f"⚠️ {path} 已變更，從頭開始導入")
+                state = {'fingerprint': fingerprint, 'position': 0, 'rows': 0, 'completed': False}
+            elif state.get('completed'):
+                stats.update(position=state['position'], completed=True, elapsed=0.0, rows_per_sec=0.0)
+                return stats
+            stats['position'] = state['position']
+
+            if self.defer_indexes:
+                # 進程中途退出時，下次啟動的 DatabaseManager 會以 IF NOT EXISTS 重建索引
+                dropped_indexes = self._drop_indexes(conn, dataset)
+
+            batch: List[Dict] = []
+            for record in iter_json_records(path, skip=state['position']):
+                state['position'] += 1
+                if not isinstance(record, dict):
+                    stats['invalid'] += 1
+                else:
+                    batch.append(record)
+                if len(batch) >= self.batch_size:
+                    state['rows'] += len(batch)
+                    self._write_batch(conn, dataset, batch, path, state)
+                    stats['rows'] += len(batch)
+                    stats['position'] = state['position']
+                    batch = []
+                    if progress is not None:
+                        elapsed = time.time() - start_time
+                        progress(dict(stats, elapsed=elapsed, rows_per_sec=stats['rows'] / elapsed if elapsed else 0.0))
+
+            state['rows'] += len(batch)
+            state['completed'] = True
+            self._write_batch(conn, dataset, batch, path, state)
+            stats['rows'] += len(batch)
+            stats['position'] = state['position']
+            stats['completed'] = True
+        finally:
+            if dropped_indexes:
+                start_index = time.time()
+                for sql in dropped_indexes:
+                    conn.execute(sql.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1)
+                                 if 'IF NOT EXISTS' not in sql else sql)
+                print(f"🔧 已重建 {len(dropped_indexes)} 個索引，耗時 {time.time() - start_index:.1f} 秒")
+            conn.close()
+
+        stats['elapsed'] = time.time() - start_time
+        stats['rows_per_sec'] = stats['rows'] / stats['elapsed'] if stats['elapsed'] else 0.0
+        return stats
+
+
+def main():
+    """命令行入口"""
+    import argparse
+    from src.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="批量導入檢測歷史或用戶反饋（JSON 陣列或 JSONL）")
+    parser.add_argument('dataset', choices=sorted(_INDEXED_TABLES), help="數據集")
+    parser.add_argument('files', nargs='+', help="要導入的文件")
+    parser.add_argument('--db-path', default="data/recycling_app.db", help="數據庫路徑")
+    parser.add_argument('--batch-size', type=int, help="每個事務寫入的記錄數")
+    parser.add_argument('--restart', action='store_true', help="忽略檢查點，從頭開始")
+    parser.add_argument('--keep-indexes', action='store_true', help="導入期間保留索引（應用同時運行時使用）")
+    args = parser.parse_args()
+
+    overrides = {'defer_indexes': not args.keep_indexes}
+    if args.batch_size:
+        overrides['batch_size'] = args.batch_size
+    importer = BulkImporter.from_config(DatabaseManager(args.db_path), **overrides)
+
+    def report(stats):
+        print(f"📥 已導入 {stats['rows']} 條記錄（{stats['rows_per_sec']:.0f} 條/秒）")
+
+    for path in args.files:
+        stats = importer.import_file(path, args.dataset, resume=not args.restart, progress=report)
+        print(f"✅ {path}: 導入 {stats['rows']} 條記錄，無效 {stats['invalid']} 條，"
+              f"耗時 {stats['elapsed']:.1f} 秒（{stats['rows_per_sec']:.0f} 條/秒）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+類別註冊表 - 檢測器、價格計算器和數據庫共用的類別名稱映射與整數ID
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# 價格資料庫中的回收物類別（計價的標準類別）
+PRICE_CATEGORIES = (
+    "塑膠瓶", "鋁罐", "鐵罐", "紙類", "玻璃瓶", "寶特瓶", "塑膠袋", "紙箱",
+    "金屬", "電子廢棄物", "HDPEM", "PET", "PP", "PS", "PVC"
+)
+
+# 類別名稱映射 (模型檢測的類別名稱 -> 價格資料庫中的名稱) - 改進版
+CLASS_MAPPING = {
+    # 自定義模型類別
+    "AluCan": "鋁罐",
+    "PlasticBottle": "塑膠瓶",
+    "IronCan": "鐵罐",
+    "Paper": "紙類",
+    "GlassBottle": "玻璃瓶",
+
+    # 通用模型檢測到的類別
+    "plastic": "塑膠瓶",
+    "bottle": "塑膠瓶",
+    "can": "金屬罐",
+    "glass": "玻璃瓶",
+    "paper": "紙類",
+    "metal": "金屬",
+
+    # 中文類別（直接映射）
+    "玻璃瓶": "玻璃瓶",
+    "塑膠瓶": "塑膠瓶",
+    "鋁罐": "鋁罐",
+    "鐵罐": "鐵罐",
+    "紙類": "紙類",
+    "金屬": "金屬",
+
+    # 塑膠類型
+    "HDPEM": "HDPEM",
+    "PET": "PET",
+    "PP": "PP",
+    "PS": "PS",
+    "PVC": "PVC",
+
+    # 其他映射
+    "金屬罐": "金屬",
+    "寶特瓶": "塑膠瓶",
+    "塑膠袋": "塑膠袋",
+    "紙箱": "紙箱",
+    "電子廢棄物": "電子廢棄物",
+
+    # 常見誤判類別的修正映射
+    "electronics": "電子廢棄物",
+    "electronic": "電子廢棄物",
+    "device": "電子廢棄物",
+    "phone": "電子廢棄物",
+    "laptop": "電子廢棄物",
+    "computer": "電子廢棄物",
+    "tv": "電子廢棄物",
+    "television": "電子廢棄物",
+    "monitor": "電子廢棄物",
+    "screen": "電子廢棄物",
+    "cable": "電子廢棄物",
+    "wire": "電子廢棄物",
+    "battery": "電子廢棄物",
+    "charger": "電子廢棄物",
+    "adapter": "電子廢棄物",
+
+    # 金屬相關映射
+    "steel": "金屬",
+    "iron": "金屬",
+    "aluminum": "金屬",
+    "copper": "金屬",
+    "brass": "金屬",
+    "bronze": "金屬",
+    "tin": "金屬",
+    "zinc": "金屬",
+    "nickel": "金屬",
+    "chrome": "金屬",
+    "stainless": "金屬",
+    "alloy": "金屬",
+
+    # 塑膠相關映射
+    "polymer": "塑膠瓶",
+    "polyethylene": "塑膠瓶",
+    "polypropylene": "塑膠瓶",
+    "polystyrene": "塑膠瓶",
+    "polyvinyl": "塑膠瓶",
+    "nylon": "塑膠瓶",
+    "acrylic": "塑膠瓶",
+    "resin": "塑膠瓶",
+
+    # 玻璃相關映射
+    "ceramic": "玻璃瓶",
+    "porcelain": "玻璃瓶",
+    "crystal": "玻璃瓶",
+    "mirror": "玻璃瓶",
+
+    # 紙類相關映射
+    "cardboard": "紙箱",
+    "newspaper": "紙類",
+    "magazine": "紙類",
+    "book": "紙類",
+    "notebook": "紙類",
+    "envelope": "紙類",
+    "folder": "紙類",
+    "box": "紙箱"
+}
+
+# 回收物關鍵詞映射（高準確率版）
+RECYCLING_KEYWORDS = {
+    # 塑膠類（高信心度）
+    "bottle": "塑膠瓶",
+    "plastic": "塑膠瓶",
+    "container": "塑膠容器",
+    "bag": "塑膠袋",
+    "cup": "塑膠杯",
+    "straw": "吸管",
+    "hdpe": "HDPE",    # 高密度聚乙烯
+    "pet": "PET",        # 聚對苯二甲酸乙二醇酯
+    "pp": "PP",          # 聚丙烯
+    "ps": "PS",          # 聚苯乙烯
+    "pvc": "PVC",        # 聚氯乙烯
+
+    # 金屬類（高信心度）
+    "can": "金屬罐",
+    "aluminum": "鋁罐",
+    "steel": "鐵罐",
+    "metal": "金屬",
+    "wire": "銅線",
+    "scrap": "廢金屬",
+
+    # 紙類（高信心度）
+    "paper": "紙類",
+    "cardboard": "紙箱",
+    "newspaper": "報紙",
+    "magazine": "雜誌",
+    "book": "書籍",
+    "box": "紙箱",
+
+    # 玻璃類（需要更明確的指示）
+    "glass": "玻璃瓶",
+    "jar": "玻璃罐",
+    "wine": "玻璃瓶",  # 酒瓶通常是玻璃
+    "beer": "玻璃瓶",   # 啤酒瓶通常是玻璃
+
+    # 電子類（高信心度）
+    "phone": "電子廢棄物",
+    "laptop": "電子廢棄物",
+    "computer": "電子廢棄物",
+    "battery": "廢電池",
+    "electronics": "電子廢棄物",
+
+    # 其他（高信心度）
+    "tire": "廢輪胎",
+    "wood": "廢木材",
+    "fabric": "廢紡織品",
+    "ceramic": "廢陶瓷",
+    "oil": "廢機油"
+}
+
+# 高信心度關鍵詞（只匹配這些詞才分類為回收物）
+HIGH_CONFIDENCE_KEYWORDS = frozenset({
+    "bottle", "can", "paper", "glass", "plastic", "metal",
+    "cardboard", "newspaper", "book", "phone", "laptop",
+    "battery", "tire", "wood", "fabric", "ceramic", "container",
+    "box", "jar", "cup", "bag", "wire", "scrap", "wine", "water"
+})
+
+# 直接映射常見的檢測結果
+DIRECT_MAPPING = {
+    "glass": "玻璃瓶",
+    "bottle": "塑膠瓶",
+    "can": "金屬罐",
+    "box": "紙箱",
+    "paper": "紙類",
+    "plastic": "塑膠瓶",
+    "metal": "金屬",
+    "container": "塑膠容器",
+    "jar": "玻璃罐",
+    "cup": "塑膠杯",
+    "bag": "塑膠袋"
+}
+
+# ID 0 保留給未知類別
+UNKNOWN_CATEGORY_ID = 0
+
+
+class CategoryRegistry:
+    """類別名稱 <-> 緊湊整數ID，並預先編譯到價格類別的映射
+
+    ID 在進程內只增不減；綁定數據庫後由 categories 表分配，多個進程共用同一套ID。
+    其他進程新增的類別在查詢不到時從數據庫重新載入。
+    """
+
+    def __init__(self, class_mapping: Optional[Dict[str, str]] = None):
+        self._mapping = dict(CLASS_MAPPING if class_mapping is None else class_mapping)
+        self._lock = threading.Lock()
+        self._store = None
+        self._names: List[Optional[str]] = [None]
+        self._ids: Dict[str, int] = {}
+        self._mapped: List[int] = [UNKNOWN_CATEGORY_ID]
+        self._mapped_array = None
+        self.version = 0
+
+        # 從映射表編譯：價格類別優先，然後是各表中出現的其他名稱
+        with self._lock:
+            for name in self._compiled_names():
+                if name not in self._ids:
+                    self._add(name)
+
+    def _compiled_names(self) -> List[str]:
+        names = list(PRICE_CATEGORIES)
+        names.extend(self._mapping.values())
+        names.extend(RECYCLING_KEYWORDS.values())
+        names.extend(DIRECT_MAPPING.values())
+        names.extend(self._mapping.keys())
+        return names
+
+    def _place(self, name: str, category_id: int):
+        while len(self._names) <= category_id:
+            self._names.append(None)
+            self._mapped.append(UNKNOWN_CATEGORY_ID)
+        self._names[category_id] = name
+        self._ids[name] = category_id
+
+    def _link(self, name: str, category_id: int, allocated: Optional[Dict[str, int]] = None):
+        target = self._mapping.get(name, name)
+        if target == name:
+            self._mapped[category_id] = category_id
+        else:
+            target_id = self._ids.get(target)
+            self._mapped[category_id] = (target_id if target_id is not None
+                                         else self._add(target, allocated))
+
+    def _add(self, name: str, allocated: Optional[Dict[str, int]] = None) -> int:
+        """添加新名稱（調用方需持有鎖；綁定存儲時ID須已在鎖外分配好）"""
+        category_id = allocated[name] if allocated is not None else len(self._names)
+        self._place(name, category_id)
+        self._link(name, category_id, allocated)
+        self._mapped_array = None
+        self.version += 1
+        return category_id
+
+    def bind(self, store) -> bool:
+        """綁定持久化存儲（需提供 load_categories / allocate_categories）
+
+        現有名稱改用存儲中的ID；已綁定時返回 False。
+        """
+        while True:
+            if self._store is not None:
+                return False
+            # 數據庫讀寫在鎖外進行，不阻塞其他線程查詢/添加類別
+            names = set(self._ids)
+            stored = {name: category_id for category_id, name in store.load_categories()}
+            missing = [name for name in names if name not in stored]
+            if missing:
+                stored.update(store.allocate_categories(missing))
+
+            with self._lock:
+                if self._store is not None:
+                    return False
+                if not set(self._ids) <= stored.keys():
+                    # 期間有新名稱加入，重新分配
+                    continue
+
+                self._names = [None]
+                self._ids = {}
+                self._mapped = [UNKNOWN_CATEGORY_ID]
+                for name, category_id in sorted(stored.items(), key=lambda item: item[1]):
+                    self._place(name, category_id)
+                self._store = store
+                for name, category_id in list(self._ids.items()):
+                    self._link(name, category_id)
+                self._mapped_array = None
+                self.version += 1
+                return True
+
+    def _reload(self, store) -> bool:
+        """從存儲載入其他進程新增的類別（調用方需持有鎖），有新類別時返回 True"""
+        stored = {name: category_id for category_id, name in store.load_categories()}
+        added = [(name, category_id) for name, category_id in stored.items() if name not in self._ids]
+        if not added:
+            return False
+        for name, category_id in added:
+            self._place(name, category_id)
+        for name, category_id in added:
+            target = self._mapping.get(name, name)
+            if target == name or target in self._ids:
+                self._link(name, category_id)
+        self._mapped_array = None
+        self.version += 1
+        return True
+
+    def _refresh(self, category_id: int) -> bool:
+        """ID 未知時從存儲重新載入，載入後已知則返回 True"""
+        store = self._store
+        if store is None or category_id < 0:
+            return False
+        with self._lock:
+            if category_id >= len(self._names) or self._names[category_id] is None:
+                self._reload(store)
+            return category_id < len(self._names) and self._names[category_id] is not None
+
+    def intern(self, name: str) -> int:
+        """獲取名稱的ID，未見過的名稱會分配新ID"""
+        if name is None:
+            raise ValueError("類別名稱不能為空")
+        category_id = self._ids.get(name)
+        if category_id is not None:
+            return category_id
+        while True:
+            store = self._store
+            allocated = None
+            if store is not None:
+                # 先在鎖外寫入數據庫分配ID（連同映射目標），再在鎖內發布
+                names = [name]
+                target = self._mapping.get(name, name)
+                if target != name and target not in self._ids:
+                    names.append(target)
+                allocated = store.allocate_categories(names)
+            with self._lock:
+                category_id = self._ids.get(name)
+                if category_id is not None:
+                    return category_id
+                if self._store is store:
+                    if store is not None and allocated[name] != len(self._names):
+                        # 分配到的ID不是下一個位置：其他進程已新增類別，先載入
+                        self._reload(store)
+                        category_id = self._ids.get(name)
+                        if category_id is not None:
+                            return category_id
+                    return self._add(name, allocated)
+            # 分配期間綁定了存儲，按新存儲重新分配
+
+    def get_id(self, name: str) -> Optional[int]:
+        """查詢名稱的ID（不分配）"""
+        return self._ids.get(name)
+
+    def ids(self, names: Iterable[str]) -> np.ndarray:
+        """批量獲取ID，每個不同的名稱只解析一次"""
+        unique: Dict[str, int] = {}
+        codes = [unique.setdefault(name, len(unique)) for name in names]
+        unique_ids = np.array([self.intern(name) for name in unique], dtype=np.intp)
+        return unique_ids[np.asarray(codes, dtype=np.intp)] if codes else unique_ids
+
+    def name(self, category_id: int) -> Optional[str]:
+        """ID 對應的名稱（未知時從存儲重新載入）"""
+        if 0 <= category_id < len(self._names) and self._names[category_id] is not None:
+            return self._names[category_id]
+        if self._refresh(category_id):
+            return self._names[category_id]
+        return None
+
+    def map_name(self, name: str) -> str:
+        """檢測類別名稱 -> 價格資料庫中的名稱（未映射時返回原名稱）"""
+        return self._mapping.get(name, name)
+
+    def mapped_id(self, category_id: int) -> int:
+        """檢測類別ID -> 價格類別ID（未知ID從存儲重新載入，仍未知時返回未知類別）"""
+        if not (0 <= category_id < len(self._names) and self._names[category_id] is not None):
+            if not self._refresh(category_id):
+                return UNKNOWN_CATEGORY_ID
+        return self._mapped[category_id]
+
+    def mapped_ids(self, category_ids) -> np.ndarray:
+        """批量將檢測類別ID映射到價格類別ID"""
+        category_ids = np.asarray(category_ids, dtype=np.intp)
+        if category_ids.size and category_ids.max() >= len(self._names):
+            self._refresh(int(category_ids.max()))
+        mapped = self._mapped_array
+        if mapped is None:
+            mapped = self._mapped_array = np.array(self._mapped, dtype=np.intp)
+        return mapped[category_ids]
+
+    def items(self) -> List[tuple]:
+        """所有 (ID, 名稱)"""
+        return [(category_id, name) for category_id, name in enumerate(self._names) if name is not None]
+
+    def __len__(self) -> int:
+        """ID 上界（可用作陣列長度）"""
+        return len(self._names)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_category_registry() -> CategoryRegistry:
+    """獲取全局類別註冊表"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CategoryRegistry()
+    return _registry
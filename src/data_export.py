@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+數據匯出 - 分批流式讀取檢測歷史和用戶反饋，寫出 CSV / JSONL / Parquet
+"""
+
+import csv
+import io
+import json
+import os
+import re
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from src.database_manager import STORED_DETECTIONS
+from src.detection_codec import stored_json
+
+# 可匯出的數據集：表名、欄位、JSON 欄位、「模式」篩選欄位、Parquet 欄位類型、
+# 查詢表達式（與欄位名不同時）
+DATASETS = {
+    'detections': {
+        'table': 'detection_history',
+        'columns': ('id', 'timestamp', 'image_path', 'detection_mode', 'total_detections',
+                    'detection_results', 'total_price', 'created_at', 'image_digest'),
+        'json_columns': ('detection_results',),
+        'mode_column': 'detection_mode',
+        'types': ('int64', 'string', 'string', 'string', 'int64', 'string', 'float64', 'string', 'string'),
+        'expressions': {'detection_results': STORED_DETECTIONS}
+    },
+    'feedback': {
+        'table': 'user_feedback',
+        'columns': ('id', 'timestamp', 'feedback_type', 'content', 'detection_results',
+                    'user_rating', 'created_at'),
+        'json_columns': ('detection_results', 'user_rating'),
+        'mode_column': 'feedback_type',
+        'types': ('int64', 'string', 'string', 'string', 'string', 'string', 'string')
+    }
+}
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+# 文件名只保留字母、數字（含中文）、底線、連字號和點，其他字符（含路徑分隔符）替換為底線
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w.-]+')
+
+MIME_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+
+def iter_chunks(db_manager, dataset: str, since: Optional[str] = None, until: Optional[str] = None,
+                mode: Optional[str] = None, chunk_size: int = 1000) -> Iterator[List[tuple]]:
+    """按 (timestamp, id) 順序分批讀取記錄，每批借用一次連接（不長時間佔用讀事務）
+
+    since / until 為 ISO 時間字符串（含 since，不含 until）；mode 篩選檢測模式或反饋類型。
+    """
+    spec = DATASETS[dataset]
+    expressions = spec.get('expressions', {})
+    select = ', '.join(expressions.get(column, column) for column in spec['columns'])
+    # 二進制編碼的檢測結果轉為 JSON 文本
+    decode_indexes = [spec['columns'].index(column) for column in expressions]
+    conditions, params = [], []
+    if since:
+        conditions.append('timestamp >= ?')
+        params.append(since)
+    if until:
+        conditions.append('timestamp < ?')
+        params.append(until)
+    if mode:
+        conditions.append(f"{spec['mode_column']} = ?")
+        params.append(mode)
+
+    last: Optional[Tuple[str, int]] = None
+    while True:
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if last is not None:
+            page_conditions.append('(timestamp, id) > (?, ?)')
+            page_params.extend(last)
+        sql = f'''
+            SELECT {select} FROM {spec['table']}
+            {'WHERE ' + ' AND '.join(page_conditions) if page_conditions else ''}
+            ORDER BY timestamp, id
+            LIMIT ?
+        '''
+        with db_manager.connections.connection() as conn:
+            rows = conn.execute(sql, page_params + [chunk_size]).fetchall()
+        if not rows:
+            return
+        last = (rows[-1][1], rows[-1][0])
+        if decode_indexes:
+            rows = [tuple(stored_json(value) if index in decode_indexes else value
+                          for index, value in enumerate(row)) for row in rows]
+        yield rows
+        if len(rows) < chunk_size:
+            return
+
+
+def write_csv(chunks: Iterator[List[tuple]], columns, output: IO[bytes]) -> int:
+    """寫出 CSV（UTF-8 帶 BOM，方便 Excel 開啟；JSON 欄位保持原始文本）"""
+    text = io.TextIOWrapper(output, encoding='utf-8-sig', newline='', write_through=True)
+    try:
+        writer = csv.writer(text)
+        writer.writerow(columns)
+        count = 0
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+        text.flush()
+        return count
+    finally:
+        # 不關閉調用方的文件
+        text.detach()
+
+
+def write_jsonl(chunks: Iterator[List[tuple]], columns, output: IO[bytes], json_columns=()) -> int:
+    """寫出 JSON Lines（JSON 欄位展開為嵌套對象）"""
+    json_indexes = [columns.index(column) for column in json_columns]
+    count = 0
+    for rows in chunks:
+        lines = []
+        for row in rows:
+            record = dict(zip(columns, row))
+            for index in json_indexes:
+                value = row[index]
+                try:
+                    record[columns[index]] = json.loads(value) if value else None
+                except ValueError:
+                    pass
+            lines.append(json.dumps(record, ensure_ascii=False))
+        output.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        count += len(rows)
+    return count
+
+
+def write_parquet(chunks: Iterator[List[tuple]], columns, output: IO[bytes], types) -> int:
+    """寫出 Parquet（每批一個 row group；需要 pyarrow）"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("匯出 Parquet 需要安裝 pyarrow: pip install pyarrow") from e
+
+    # 固定結構，避免某批某欄全為空時推斷出不同的類型
+    schema = pa.schema([(column, pa.type_for_alias(type_name)) for column, type_name in zip(columns, types)])
+    count = 0
+    with pq.ParquetWriter(output, schema) as writer:
+        for rows in chunks:
+            writer.write_table(pa.Table.from_pydict(
+                {column: [row[index] for row in rows] for index, column in enumerate(columns)},
+                schema=schema))
+            count += len(rows)
+    return count
+
+
+def export_data(db_manager, dataset: str, fmt: str, output: IO[bytes], since: Optional[str] = None,
+                until: Optional[str] = None, mode: Optional[str] = None, chunk_size: int = 1000) -> int:
+    """將數據集匯出到二進制文件對象，返回匯出的記錄數"""
+    if dataset not in DATASETS:
+        raise ValueError(f"未知的數據集: {dataset}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的格式: {fmt}")
+
+    spec = DATASETS[dataset]
+    chunks = iter_chunks(db_manager, dataset, since, until, mode, chunk_size)
+    if fmt == 'csv':
+        return write_csv(chunks, spec['columns'], output)
+    if fmt == 'jsonl':
+        return write_jsonl(chunks, spec['columns'], output, spec['json_columns'])
+    return write_parquet(chunks, spec['columns'], output, spec['types'])
+
+
+def export_to_file(db_manager, dataset: str, fmt: str, path: str, **filters) -> int:
+    """將數據集匯出到文件（先寫臨時文件，完成後改名，失敗時不留下不完整的文件）"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, 'wb') as output:
+            count = export_data(db_manager, dataset, fmt, output, **filters)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return count
+
+
+def export_filename(dataset: str, fmt: str, filters: Optional[Dict] = None) -> str:
+    """匯出文件的預設名稱（篩選條件可能來自用戶輸入，移除路徑分隔符和 ..）"""
+    parts = [dataset]
+    for key in ('since', 'until', 'mode'):
+        value = (filters or {}).get(key)
+        if value:
+            parts.append(str(value)[:10] if key != 'mode' else str(value))
+    name = _UNSAFE_FILENAME_CHARS.sub('_', '_'.join(parts).replace(':', ''))
+    name = re.sub(r'(?:\.{2,}|_)+', '_', name).strip('._') or dataset
+    return f'{name}.{fmt}'
+
+
+def export_path(directory: str, file_name: str) -> str:
+    """匯出目錄下的文件路徑；解析後不在目錄內時拋出 ValueError"""
+    root = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(root, file_name))
+    if os.path.dirname(path) != root:
+        raise ValueError(f"匯出文件名無效: {file_name}")
+    return path
+
+
+def main():
+    """命令行入口"""
+    import argparse
+    from src.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="匯出檢測歷史或用戶反饋")
+    parser.add_argument('dataset', choices=sorted(DATASETS), help="數據集")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="輸出格式")
+    parser.add_argument('--output', help="輸出文件（預設按數據集和篩選條件命名）")
+    parser.add_argument('--db-path', default="data/recycling_app.db", help="數據庫路徑")
+    parser.add_argument('--since', help="開始時間（ISO 格式，含）")
+    parser.add_argument('--until', help="結束時間（ISO 格式，不含）")
+    parser.add_argument('--mode', help="檢測模式或反饋類型")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="每批讀取的記錄數")
+    args = parser.parse_args()
+
+    filters = {'since': args.since, 'until': args.until, 'mode': args.mode}
+    output = args.output or export_filename(args.dataset, args.format, filters)
+    count = export_to_file(DatabaseManager(args.db_path), args.dataset, args.format, output,
+                           chunk_size=args.chunk_size, **filters)
+    print(f"✅ 已匯出 {count} 條記錄到 {output}")
+
+
+if __name__ == "__main__":
+    main()
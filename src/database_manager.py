@@ -7,94 +7,535 @@
 import sqlite3
 import json
 import os
-import numpy as np
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Set, Tuple
+
+from src.category_registry import get_category_registry
+from src.db_connection import get_connection_manager
+from src.detection_codec import decode_stored, dumps, encode_for_storage
+from src.performance_config import get_performance_config
+
+
+def _optional_float(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def detection_item_rows(detection_results) -> List[tuple]:
+    """將一條檢測記錄的結果列表展開為 detection_items 的行（不含 record_id）
+
+    舊記錄沒有 category_id 時按類別名稱查詢；會分配新類別ID，需在寫入事務之外調用。
+    """
+    registry = get_category_registry()
+    rows = []
+    for item_index, item in enumerate(detection_results or []):
+        if not isinstance(item, dict):
+            continue
+        category_id = item.get('category_id')
+        if category_id is None:
+            name = item.get('original_class_name') or item.get('class_name')
+            category_id = registry.mapped_id(registry.intern(name)) if name else 0
+        bbox = list(item.get('bbox') or [])
+        bbox = [float(value) for value in bbox[:4]] if len(bbox) >= 4 else [None] * 4
+        price_info = item.get('price_info') or {}
+        rows.append((
+            item_index,
+            int(category_id),
+            _optional_float(item.get('confidence')),
+            *bbox,
+            _optional_float(item.get('relative_area')),
+            _optional_float(price_info.get('weight')),
+            _optional_float(price_info.get('price')),
+            item.get('source')
+        ))
+    return rows
+
+
+def _json_or(default):
+    """JSON 欄位解碼器：空值返回 default"""
+    return lambda value: json.loads(value) if value else default
+
+
+class LazyRow(Mapping):
+    """只讀的記錄行：JSON 欄位在第一次訪問時才解碼"""
+    
+    __slots__ = ('_keys', '_values', '_decoders', '_decoded')
+    
+    def __init__(self, keys: Tuple[str, ...], values: tuple, decoders: Dict[str, Callable]):
+        self._keys = keys
+        self._values = values
+        self._decoders = decoders
+        self._decoded: Dict[str, Any] = {}
+    
+    def __getitem__(self, key: str):
+        if key in self._decoded:
+            return self._decoded[key]
+        try:
+            value = self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+        decoder = self._decoders.get(key)
+        if decoder is not None:
+            value = self._decoded[key] = decoder(value)
+        return value
+    
+    def __iter__(self):
+        return iter(self._keys)
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def __repr__(self) -> str:
+        return f"LazyRow({dict(self)!r})"
+
+
+# 分頁查詢的欄位（鍵名與舊版返回的字典相同）和解碼器
+_FEEDBACK_COLUMNS = ('id', 'timestamp', 'feedback_type', 'content', 'detection_results', 'user_rating', 'created_at')
+_FEEDBACK_KEYS = ('id', 'timestamp', 'type', 'content', 'detection_results', 'user_rating', 'created_at')
+_FEEDBACK_DECODERS = {'detection_results': _json_or(None), 'user_rating': _json_or(None)}
+
+# 檢測結果存於 detection_blob（二進制）或 detection_results（JSON 文本）之一
+STORED_DETECTIONS = 'COALESCE(detection_blob, detection_results)'
+_HISTORY_KEYS = ('id', 'timestamp', 'image_path', 'detection_mode', 'total_detections',
+                 'detection_results', 'total_price', 'created_at', 'image_digest')
+_HISTORY_COLUMNS = tuple(STORED_DETECTIONS if key == 'detection_results' else key for key in _HISTORY_KEYS)
+_HISTORY_DECODERS = {'detection_results': decode_stored}
+
+# 分頁游標：上一頁最後一行的 (created_at, id)
+PageCursor = Tuple[str, int]
+
+# 時間序列分析的分桶表達式（按 ISO 時間字符串截取；週以星期一的日期表示）
+ANALYTICS_BUCKETS = {
+    'hour': "substr({0}, 1, 13) || ':00'",
+    'day': "substr({0}, 1, 10)",
+    'week': "date(substr({0}, 1, 10), 'weekday 0', '-6 days')"
+}
+# 每日匯總表只能提供按日和按週的數據（小時序列只包含明細記錄）
+_ROLLUP_BUCKETS = ('day', 'week')
+
 
 class DatabaseManager:
     def __init__(self, db_path: str = "data/recycling_app.db"):
         """初始化數據庫管理器"""
         self.db_path = db_path
         self.ensure_data_directory()
+        # 共享的長連接池（WAL 模式），同一數據庫文件的所有 DatabaseManager 共用
+        self.connections = get_connection_manager(db_path)
+        # 檢測結果的存儲格式：'binary'（緊湊編碼）或 'json'
+        self.detection_format = get_performance_config().get_database_config()['detection_format']
         self.init_database()
-    
-    def _serialize_for_json(self, obj):
-        """序列化對象為JSON兼容格式"""
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, dict):
-            return {key: self._serialize_for_json(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [self._serialize_for_json(item) for item in obj]
-        else:
-            return obj
+        
+        # 類別ID由 categories 表分配，同一數據庫的所有進程共用同一套ID
+        if not get_category_registry().bind(self):
+            self._sync_categories()
+        
+        # 時間序列分析結果緩存：(查詢, 分桶, 範圍) -> (數據版本, 結果)
+        self._analytics_cache: "OrderedDict[tuple, Tuple[int, List[Dict]]]" = OrderedDict()
+        self._analytics_cache_size = get_performance_config().get_database_config()['analytics_cache_size']
+        self._analytics_lock = threading.Lock()
+        self._analytics_stats = {'hits': 0, 'misses': 0}
+        
+        # 將舊記錄的 JSON 結果遷移到 detection_items
+        self.migrate_detection_items()
     
     def ensure_data_directory(self):
         """確保數據目錄存在"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
     
     def init_database(self):
-        """初始化數據庫表"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # 創建用戶反饋表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_feedback (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    feedback_type TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    detection_results TEXT,
-                    user_rating TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # 創建檢測歷史表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS detection_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    image_path TEXT,
-                    detection_mode TEXT,
-                    total_detections INTEGER,
-                    detection_results TEXT,
-                    total_price REAL,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        """初始化數據庫表（每個進程只執行一次）"""
+        self.connections.run_once('schema', self._create_tables)
+    
+    def _create_tables(self, conn):
+        """創建數據庫表"""
+        cursor = conn.cursor()
+        
+        # 創建用戶反饋表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_feedback (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                feedback_type TEXT NOT NULL,
+                content TEXT NOT NULL,
+                detection_results TEXT,
+                user_rating TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 創建檢測歷史表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detection_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                image_path TEXT,
+                detection_mode TEXT,
+                total_detections INTEGER,
+                detection_results TEXT,
+                total_price REAL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                detection_blob BLOB,
+                image_digest TEXT,
+                scan_job_id INTEGER
+            )
+        ''')
+        # 舊數據庫補上二進制檢測結果、圖片摘要和批量掃描任務欄位
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(detection_history)')}
+        if 'detection_blob' not in columns:
+            cursor.execute('ALTER TABLE detection_history ADD COLUMN detection_blob BLOB')
+        if 'image_digest' not in columns:
+            cursor.execute('ALTER TABLE detection_history ADD COLUMN image_digest TEXT')
+        if 'scan_job_id' not in columns:
+            cursor.execute('ALTER TABLE detection_history ADD COLUMN scan_job_id INTEGER')
+        
+        # 創建檢測物件表（每條檢測記錄的每個物件一行，用於按類別統計）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detection_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                record_id INTEGER NOT NULL REFERENCES detection_history (id),
+                item_index INTEGER NOT NULL,
+                category_id INTEGER NOT NULL,
+                confidence REAL,
+                bbox_x1 REAL,
+                bbox_y1 REAL,
+                bbox_x2 REAL,
+                bbox_y2 REAL,
+                relative_area REAL,
+                weight REAL,
+                price REAL,
+                model_source TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_detection_items_record
+            ON detection_items (record_id)
+        ''')
+        # 覆蓋索引：按類別統計數量、重量和價值時只需掃描索引
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_detection_items_category
+            ON detection_items (category_id, weight, price)
+        ''')
+        
+        # 創建類別表（類別名稱 <-> 整數ID）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS categories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        
+        # 創建系統設置表
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS system_settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 創建性能指標表（每個請求的各階段耗時）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS performance_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                detection_mode TEXT,
+                image_width INTEGER,
+                image_height INTEGER,
+                detection_count INTEGER,
+                cache_hit INTEGER,
+                queue_ms REAL,
+                preprocess_ms REAL,
+                detect_ms REAL,
+                pricing_ms REAL,
+                total_ms REAL,
+                model_version TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_performance_metrics_timestamp
+            ON performance_metrics (timestamp)
+        ''')
+        
+        # 按時間倒序分頁（keyset）的索引
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_detection_history_created
+            ON detection_history (created_at, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_feedback_created
+            ON user_feedback (created_at, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_feedback_type_created
+            ON user_feedback (feedback_type, created_at, id)
+        ''')
+        # 按時間範圍匯出和統計的索引
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_detection_history_timestamp
+            ON detection_history (timestamp, id)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_feedback_timestamp
+            ON user_feedback (timestamp, id)
+        ''')
+        # 按圖片查找檢測記錄
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_detection_history_image_digest
+            ON detection_history (image_digest)
+        ''')
+        # 批量掃描任務查找已保存的結果（只索引任務產生的記錄）
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_detection_history_scan_job
+            ON detection_history (scan_job_id) WHERE scan_job_id IS NOT NULL
+        ''')
+        
+        # 每日匯總表（保留期限之前的明細記錄刪除前匯總到這裡）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detection_daily (
+                day TEXT NOT NULL,
+                detection_mode TEXT NOT NULL,
+                record_count INTEGER NOT NULL,
+                detections_sum INTEGER NOT NULL,
+                value_sum REAL NOT NULL,
+                PRIMARY KEY (day, detection_mode)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detection_category_daily (
+                day TEXT NOT NULL,
+                category_id INTEGER NOT NULL,
+                item_count INTEGER NOT NULL,
+                total_weight REAL NOT NULL,
+                total_value REAL NOT NULL,
+                PRIMARY KEY (day, category_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS feedback_daily (
+                day TEXT NOT NULL,
+                feedback_type TEXT NOT NULL,
+                feedback_count INTEGER NOT NULL,
+                rating_count INTEGER NOT NULL,
+                rating_sum REAL NOT NULL,
+                PRIMARY KEY (day, feedback_type)
+            )
+        ''')
+        
+        self._create_statistics_tables(conn)
+        self._create_analytics_tables(conn)
+        conn.commit()
+    
+    def _create_statistics_tables(self, conn):
+        """創建統計匯總表和維護它們的觸發器，首次創建時從現有數據回填"""
+        # 觸發器和回填在同一個寫事務中，期間不會有其他寫入遺漏
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS statistics_summary (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                feedback_count INTEGER NOT NULL DEFAULT 0,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                rating_sum REAL NOT NULL DEFAULT 0,
+                detection_count INTEGER NOT NULL DEFAULT 0,
+                detections_count INTEGER NOT NULL DEFAULT 0,
+                detections_sum INTEGER NOT NULL DEFAULT 0,
+                value_sum REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS feedback_type_counts (
+                feedback_type TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            )
+        ''')
+        
+        # 回填（只在匯總行不存在時執行）
+        cursor.execute('''
+            INSERT INTO statistics_summary
+            (id, feedback_count, rating_count, rating_sum,
+             detection_count, detections_count, detections_sum, value_sum)
+            SELECT 1, f.feedback_count, f.rating_count, f.rating_sum,
+                   d.detection_count, d.detections_count, d.detections_sum, d.value_sum
+            FROM (
+                SELECT COUNT(*) AS feedback_count, COUNT(rating) AS rating_count,
+                       COALESCE(SUM(rating), 0) AS rating_sum
+                FROM (
+                    SELECT CASE WHEN json_valid(user_rating)
+                                THEN CAST(json_extract(user_rating, '$.overall') AS REAL) END AS rating
+                    FROM user_feedback
                 )
-            ''')
-            
-            # 創建系統設置表
+            ) AS f, (
+                SELECT COUNT(*) AS detection_count, COUNT(total_detections) AS detections_count,
+                       COALESCE(SUM(total_detections), 0) AS detections_sum,
+                       COALESCE(SUM(total_price), 0) AS value_sum
+                FROM detection_history
+            ) AS d
+            WHERE NOT EXISTS (SELECT 1 FROM statistics_summary)
+        ''')
+        if cursor.rowcount:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS system_settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT NOT NULL,
-                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
+                INSERT OR REPLACE INTO feedback_type_counts (feedback_type, count)
+                SELECT feedback_type, COUNT(*) FROM user_feedback GROUP BY feedback_type
             ''')
-            
+        
+        rating = "CASE WHEN json_valid({0}.user_rating) THEN CAST(json_extract({0}.user_rating, '$.overall') AS REAL) END"
+        # executescript 會先提交事務，因此逐條創建觸發器
+        triggers = [
+            f'''
+                CREATE TRIGGER IF NOT EXISTS trg_feedback_stats_insert AFTER INSERT ON user_feedback
+                BEGIN
+                    UPDATE statistics_summary SET
+                        feedback_count = feedback_count + 1,
+                        rating_count = rating_count + ({rating.format('NEW')} IS NOT NULL),
+                        rating_sum = rating_sum + COALESCE({rating.format('NEW')}, 0)
+                    WHERE id = 1;
+                    INSERT INTO feedback_type_counts (feedback_type, count) VALUES (NEW.feedback_type, 1)
+                    ON CONFLICT (feedback_type) DO UPDATE SET count = count + 1;
+                END
+            ''',
+            f'''
+                CREATE TRIGGER IF NOT EXISTS trg_feedback_stats_delete AFTER DELETE ON user_feedback
+                BEGIN
+                    UPDATE statistics_summary SET
+                        feedback_count = feedback_count - 1,
+                        rating_count = rating_count - ({rating.format('OLD')} IS NOT NULL),
+                        rating_sum = rating_sum - COALESCE({rating.format('OLD')}, 0)
+                    WHERE id = 1;
+                    UPDATE feedback_type_counts SET count = count - 1 WHERE feedback_type = OLD.feedback_type;
+                    DELETE FROM feedback_type_counts WHERE feedback_type = OLD.feedback_type AND count <= 0;
+                END
+            ''',
+            f'''
+                CREATE TRIGGER IF NOT EXISTS trg_feedback_stats_update
+                AFTER UPDATE OF feedback_type, user_rating ON user_feedback
+                BEGIN
+                    UPDATE statistics_summary SET
+                        rating_count = rating_count - ({rating.format('OLD')} IS NOT NULL)
+                                                    + ({rating.format('NEW')} IS NOT NULL),
+                        rating_sum = rating_sum - COALESCE({rating.format('OLD')}, 0)
+                                                + COALESCE({rating.format('NEW')}, 0)
+                    WHERE id = 1;
+                    UPDATE feedback_type_counts SET count = count - 1 WHERE feedback_type = OLD.feedback_type;
+                    DELETE FROM feedback_type_counts WHERE feedback_type = OLD.feedback_type AND count <= 0;
+                    INSERT INTO feedback_type_counts (feedback_type, count) VALUES (NEW.feedback_type, 1)
+                    ON CONFLICT (feedback_type) DO UPDATE SET count = count + 1;
+                END
+            ''',
+            f'''
+                CREATE TRIGGER IF NOT EXISTS trg_detection_stats_insert AFTER INSERT ON detection_history
+                BEGIN
+                    UPDATE statistics_summary SET
+                        detection_count = detection_count + 1,
+                        detections_count = detections_count + (NEW.total_detections IS NOT NULL),
+                        detections_sum = detections_sum + COALESCE(NEW.total_detections, 0),
+                        value_sum = value_sum + COALESCE(NEW.total_price, 0)
+                    WHERE id = 1;
+                END
+            ''',
+            f'''
+                CREATE TRIGGER IF NOT EXISTS trg_detection_stats_delete AFTER DELETE ON detection_history
+                BEGIN
+                    UPDATE statistics_summary SET
+                        detection_count = detection_count - 1,
+                        detections_count = detections_count - (OLD.total_detections IS NOT NULL),
+                        detections_sum = detections_sum - COALESCE(OLD.total_detections, 0),
+                        value_sum = value_sum - COALESCE(OLD.total_price, 0)
+                    WHERE id = 1;
+                END
+            ''',
+            f'''
+                CREATE TRIGGER IF NOT EXISTS trg_detection_stats_update
+                AFTER UPDATE OF total_detections, total_price ON detection_history
+                BEGIN
+                    UPDATE statistics_summary SET
+                        detections_count = detections_count - (OLD.total_detections IS NOT NULL)
+                                                            + (NEW.total_detections IS NOT NULL),
+                        detections_sum = detections_sum - COALESCE(OLD.total_detections, 0)
+                                                        + COALESCE(NEW.total_detections, 0),
+                        value_sum = value_sum - COALESCE(OLD.total_price, 0) + COALESCE(NEW.total_price, 0)
+                    WHERE id = 1;
+                END
+            '''
+        ]
+        for trigger in triggers:
+            cursor.execute(trigger)
+    
+    def _create_analytics_tables(self, conn):
+        """創建按日的數據版本表和維護它的觸發器（分析緩存據此判斷哪些時間範圍有變更）"""
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analytics_watermarks (
+                day TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        
+        bump = '''
+            INSERT INTO analytics_watermarks (day, version) VALUES (substr({0}.timestamp, 1, 10), 1)
+            ON CONFLICT (day) DO UPDATE SET version = version + 1;
+        '''
+        # detection_items 總是與所屬的檢測記錄在同一事務中寫入或重算，只需跟蹤 detection_history
+        triggers = [
+            f'''
+                CREATE TRIGGER IF NOT EXISTS trg_analytics_watermark_insert AFTER INSERT ON detection_history
+                BEGIN {bump.format('NEW')} END
+            ''',
+            f'''
+                CREATE TRIGGER IF NOT EXISTS trg_analytics_watermark_delete AFTER DELETE ON detection_history
+                BEGIN {bump.format('OLD')} END
+            ''',
+            f'''
+                CREATE TRIGGER IF NOT EXISTS trg_analytics_watermark_update AFTER UPDATE ON detection_history
+                BEGIN {bump.format('OLD')} {bump.format('NEW')} END
+            '''
+        ]
+        for trigger in triggers:
+            cursor.execute(trigger)
+    
+    def load_categories(self) -> List[Tuple[int, str]]:
+        """獲取所有類別 (ID, 名稱)"""
+        with self.connections.connection() as conn:
+            return conn.execute('SELECT id, name FROM categories ORDER BY id').fetchall()
+    
+    def allocate_categories(self, names: Iterable[str]) -> Dict[str, int]:
+        """為類別名稱分配ID（已存在的名稱返回原ID）"""
+        names = list(names)
+        with self.connections.transaction() as conn:
+            conn.executemany('INSERT OR IGNORE INTO categories (name) VALUES (?)',
+                             [(name,) for name in names])
+            placeholders = ','.join('?' * len(names))
+            rows = conn.execute(f'SELECT name, id FROM categories WHERE name IN ({placeholders})',
+                                names).fetchall()
+            conn.commit()
+            return dict(rows)
+    
+    def _sync_categories(self):
+        """將類別註冊表寫入本數據庫（註冊表已綁定其他數據庫時使用）"""
+        with self.connections.transaction() as conn:
+            conn.executemany('INSERT OR IGNORE INTO categories (id, name) VALUES (?, ?)',
+                             get_category_registry().items())
             conn.commit()
     
     def save_feedback(self, feedback_type: str, content: str, 
                      detection_results: Optional[Dict] = None, 
                      user_rating: Optional[Dict] = None) -> int:
         """保存用戶反饋"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.transaction() as conn:
             cursor = conn.cursor()
             
             # 序列化檢測結果和用戶評分
             serialized_detection_results = None
             if detection_results:
-                serialized_detection_results = json.dumps(self._serialize_for_json(detection_results))
+                serialized_detection_results = dumps(detection_results)
             
             serialized_user_rating = None
             if user_rating:
-                serialized_user_rating = json.dumps(self._serialize_for_json(user_rating))
+                serialized_user_rating = dumps(user_rating)
             
             cursor.execute('''
                 INSERT INTO user_feedback 
@@ -112,127 +553,288 @@ class DatabaseManager:
             conn.commit()
             return feedback_id
     
-    def get_all_feedback(self) -> List[Dict]:
-        """獲取所有反饋"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, timestamp, feedback_type, content, 
-                       detection_results, user_rating, created_at
-                FROM user_feedback 
-                ORDER BY created_at DESC
-            ''')
-            
-            rows = cursor.fetchall()
-            feedback_list = []
-            
-            for row in rows:
-                feedback = {
-                    'id': row[0],
-                    'timestamp': row[1],
-                    'type': row[2],
-                    'content': row[3],
-                    'detection_results': json.loads(row[4]) if row[4] else None,
-                    'user_rating': json.loads(row[5]) if row[5] else None,
-                    'created_at': row[6]
-                }
-                feedback_list.append(feedback)
-            
-            return feedback_list
+    def save_feedback_batch(self, records: List[Dict]) -> int:
+        """在一個事務中批量保存用戶反饋（鍵與 save_feedback 的參數相同，可附帶 timestamp）"""
+        if not records:
+            return 0
+        
+        with self.connections.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO user_feedback 
+                (timestamp, feedback_type, content, detection_results, user_rating)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (
+                    record.get('timestamp') or datetime.now().isoformat(),
+                    record['feedback_type'],
+                    record['content'],
+                    dumps(record['detection_results'])
+                    if record.get('detection_results') else None,
+                    dumps(record['user_rating'])
+                    if record.get('user_rating') else None
+                )
+                for record in records
+            ])
+            conn.commit()
+            return len(records)
+    
+    def get_all_feedback(self) -> List[Mapping]:
+        """獲取所有反饋（大表請使用 iter_feedback 逐頁讀取）"""
+        return list(self.iter_feedback())
+    
+    def _fetch_page(self, table: str, columns: Tuple[str, ...], keys: Tuple[str, ...],
+                    decoders: Dict[str, Callable], limit: int, cursor: Optional[PageCursor],
+                    where: str = '', params: tuple = ()) -> Tuple[List[Mapping], Optional[PageCursor]]:
+        """按 (created_at, id) 倒序讀取一頁，返回 (行, 下一頁游標)；沒有下一頁時游標為 None"""
+        conditions = [where] if where else []
+        if cursor is not None:
+            conditions.append('(created_at, id) < (?, ?)')
+            params = params + tuple(cursor)
+        sql = f'''
+            SELECT {', '.join(columns)} FROM {table}
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        '''
+        with self.connections.connection() as conn:
+            rows = conn.execute(sql, params + (limit + 1,)).fetchall()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = (last[columns.index('created_at')], last[0])
+        return [LazyRow(keys, row, decoders) for row in rows], next_cursor
+    
+    def get_feedback_page(self, limit: int = 50, cursor: Optional[PageCursor] = None,
+                          feedback_type: Optional[str] = None) -> Tuple[List[Mapping], Optional[PageCursor]]:
+        """分頁獲取反饋（最新的在前），返回 (反饋列表, 下一頁游標)"""
+        where, params = ('feedback_type = ?', (feedback_type,)) if feedback_type else ('', ())
+        return self._fetch_page('user_feedback', _FEEDBACK_COLUMNS, _FEEDBACK_KEYS, _FEEDBACK_DECODERS,
+                                limit, cursor, where, params)
+    
+    def iter_feedback(self, batch_size: int = 500, feedback_type: Optional[str] = None) -> Iterator[Mapping]:
+        """逐頁迭代反饋（最新的在前），不一次載入整張表"""
+        cursor = None
+        while True:
+            rows, cursor = self.get_feedback_page(batch_size, cursor, feedback_type)
+            yield from rows
+            if cursor is None:
+                return
     
     def save_detection_record(self, detection_mode: str, total_detections: int,
                             detection_results: List[Dict], total_price: float,
-                            image_path: Optional[str] = None) -> int:
-        """保存檢測記錄"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # 序列化檢測結果
-            serialized_detection_results = json.dumps(self._serialize_for_json(detection_results))
-            
+                            image_path: Optional[str] = None, image_digest: Optional[str] = None) -> int:
+        """保存檢測記錄（image_digest 為圖片存儲中的內容摘要）"""
+        prepared = self.prepare_detection_records([{
+            'detection_mode': detection_mode,
+            'total_detections': total_detections,
+            'detection_results': detection_results,
+            'total_price': total_price,
+            'image_path': image_path,
+            'image_digest': image_digest
+        }])
+        with self.connections.transaction() as conn:
+            return self.insert_detection_records(conn, prepared)[0]
+    
+    def save_detection_records(self, records: List[Dict]) -> int:
+        """在一個事務中批量保存檢測記錄（鍵與 save_detection_record 的參數相同，可附帶 timestamp）"""
+        if not records:
+            return 0
+        
+        prepared = self.prepare_detection_records(records)
+        with self.connections.transaction() as conn:
+            return len(self.insert_detection_records(conn, prepared))
+    
+    def prepare_detection_records(self, records: List[Dict]) -> List[tuple]:
+        """編碼檢測結果並展開物件，供 insert_detection_records 使用
+        
+        可能分配類別ID（經連接池寫入），需在寫事務之前調用。
+        """
+        return [(record, detection_item_rows(record['detection_results']),
+                 encode_for_storage(record['detection_results'], self.detection_format))
+                for record in records]
+    
+    def insert_detection_records(self, conn, prepared: List[tuple]) -> List[int]:
+        """在調用方的事務中插入已準備的檢測記錄和物件，返回記錄ID"""
+        cursor = conn.cursor()
+        record_ids, items = [], []
+        # 逐條插入以取得各記錄的ID（仍在同一個事務中）
+        for record, rows, (serialized, blob) in prepared:
             cursor.execute('''
                 INSERT INTO detection_history 
                 (timestamp, image_path, detection_mode, total_detections, 
-                 detection_results, total_price)
-                VALUES (?, ?, ?, ?, ?, ?)
+                 detection_results, detection_blob, total_price, image_digest, scan_job_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
-                datetime.now().isoformat(),
-                image_path,
-                detection_mode,
-                total_detections,
-                serialized_detection_results,
-                total_price
+                record.get('timestamp') or datetime.now().isoformat(),
+                record.get('image_path'),
+                record['detection_mode'],
+                record['total_detections'],
+                serialized,
+                blob,
+                record['total_price'],
+                record.get('image_digest'),
+                record.get('scan_job_id')
             ))
-            
-            record_id = cursor.lastrowid
-            conn.commit()
-            return record_id
+            record_ids.append(cursor.lastrowid)
+            items.append((cursor.lastrowid, rows))
+        self.write_detection_items(conn, items, replace=False)
+        return record_ids
     
-    def get_detection_history(self, limit: int = 100) -> List[Dict]:
-        """獲取檢測歷史"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, timestamp, image_path, detection_mode, 
-                       total_detections, detection_results, total_price, created_at
-                FROM detection_history 
-                ORDER BY created_at DESC 
-                LIMIT ?
-            ''', (limit,))
+    def write_detection_items(self, conn, records: List[Tuple[int, List[tuple]]], replace: bool = True):
+        """在調用方的事務中寫入（或替換）檢測物件，records 為 (record_id, detection_item_rows(...))
+        
+        新插入的記錄可傳 replace=False，跳過刪除舊物件。
+        替換時只寫入仍存在的記錄（記錄可能在讀取後被保留策略等刪除），避免留下孤立的物件。
+        """
+        columns = '''
+            INSERT INTO detection_items
+            (record_id, item_index, category_id, confidence, bbox_x1, bbox_y1, bbox_x2, bbox_y2,
+             relative_area, weight, price, model_source)
+        '''
+        if not replace:
+            conn.executemany(columns + 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             [(record_id, *row) for record_id, rows in records for row in rows])
+            return
+        
+        conn.executemany('DELETE FROM detection_items WHERE record_id = ?',
+                         [(record_id,) for record_id, _ in records])
+        conn.executemany(columns + '''
+            SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+            WHERE EXISTS (SELECT 1 FROM detection_history WHERE id = ?)
+        ''', [(record_id, *row, record_id) for record_id, rows in records for row in rows])
+    
+    def migrate_detection_items(self, chunk_size: int = 1000) -> int:
+        """將 detection_items 建立前的檢測記錄（JSON 結果）分批展開寫入，返回遷移的記錄數
+        
+        進度保存在 system_settings，中斷後從上次的位置繼續；完成後只需一次查詢。
+        """
+        key = 'detection_items_migration'
+        with self.connections.connection() as conn:
+            row = conn.execute('SELECT value FROM system_settings WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                # 只需遷移此時已存在的記錄，之後的記錄寫入時已同步寫入物件表
+                max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM detection_history').fetchone()[0]
+                state = {'last_id': 0, 'max_id': max_id}
+            else:
+                state = json.loads(row[0])
+        if state.get('completed'):
+            return 0
+        
+        migrated = 0
+        while True:
+            with self.connections.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, {STORED_DETECTIONS} FROM detection_history
+                    WHERE id > ? AND id <= ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (state['last_id'], state['max_id'], chunk_size)).fetchall()
+            
+            items = []
+            for record_id, stored in rows:
+                try:
+                    results = decode_stored(stored)
+                except ValueError:
+                    results = []
+                items.append((record_id, detection_item_rows(results if isinstance(results, list) else [])))
             
-            rows = cursor.fetchall()
-            history_list = []
+            if rows:
+                state['last_id'] = rows[-1][0]
+            else:
+                state['completed'] = True
             
-            for row in rows:
-                record = {
-                    'id': row[0],
-                    'timestamp': row[1],
-                    'image_path': row[2],
-                    'detection_mode': row[3],
-                    'total_detections': row[4],
-                    'detection_results': json.loads(row[5]) if row[5] else [],
-                    'total_price': row[6],
-                    'created_at': row[7]
-                }
-                history_list.append(record)
+            with self.connections.transaction() as conn:
+                self.write_detection_items(conn, items)
+                conn.execute('''
+                    INSERT OR REPLACE INTO system_settings (key, value, updated_at)
+                    VALUES (?, ?, ?)
+                ''', (key, json.dumps(state), datetime.now().isoformat()))
+                conn.commit()
             
-            return history_list
+            migrated += len(rows)
+            if not rows:
+                break
+        
+        if migrated:
+            print(f"✅ 已將 {migrated} 條檢測記錄遷移到 detection_items")
+        return migrated
+    
+    def get_category_aggregates(self) -> List[Dict]:
+        """按類別統計檢測物件數量、總重量和總價值（按總價值降序）"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute('''
+                SELECT i.category_id, c.name AS category, i.item_count, i.total_weight, i.total_value
+                FROM (
+                    SELECT category_id, COUNT(*) AS item_count,
+                           COALESCE(SUM(weight), 0) AS total_weight,
+                           COALESCE(SUM(price), 0) AS total_value
+                    FROM detection_items
+                    GROUP BY category_id
+                ) AS i
+                LEFT JOIN categories AS c ON c.id = i.category_id
+                ORDER BY i.total_value DESC
+            ''')
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_detection_history(self, limit: int = 100) -> List[Mapping]:
+        """獲取檢測歷史（最新的 limit 條）"""
+        return self.get_detection_history_page(limit)[0]
+    
+    def get_detection_history_page(self, limit: int = 100, cursor: Optional[PageCursor] = None
+                                   ) -> Tuple[List[Mapping], Optional[PageCursor]]:
+        """分頁獲取檢測歷史（最新的在前），返回 (記錄列表, 下一頁游標)"""
+        return self._fetch_page('detection_history', _HISTORY_COLUMNS, _HISTORY_KEYS, _HISTORY_DECODERS,
+                                limit, cursor)
+    
+    def get_detections_by_image(self, image_digest: str, limit: int = 100) -> List[Mapping]:
+        """獲取同一張圖片（內容摘要）的檢測記錄（最新的在前）"""
+        return self._fetch_page('detection_history', _HISTORY_COLUMNS, _HISTORY_KEYS, _HISTORY_DECODERS,
+                                limit, None, 'image_digest = ?', (image_digest,))[0]
+    
+    def referenced_image_digests(self, digests: Iterable[str]) -> Set[str]:
+        """返回仍被檢測記錄引用的圖片摘要（分批查詢，使用 image_digest 索引）"""
+        digests = list(digests)
+        referenced = set()
+        with self.connections.connection() as conn:
+            for start in range(0, len(digests), 500):
+                chunk = digests[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                referenced.update(row[0] for row in conn.execute(
+                    f'SELECT DISTINCT image_digest FROM detection_history WHERE image_digest IN ({placeholders})',
+                    chunk))
+        return referenced
+    
+    def iter_detection_history(self, batch_size: int = 500) -> Iterator[Mapping]:
+        """逐頁迭代檢測歷史（最新的在前），不一次載入整張表"""
+        cursor = None
+        while True:
+            rows, cursor = self.get_detection_history_page(batch_size, cursor)
+            yield from rows
+            if cursor is None:
+                return
     
     def get_statistics(self) -> Dict[str, Any]:
-        """獲取統計數據"""
-        with sqlite3.connect(self.db_path) as conn:
+        """獲取統計數據（讀取觸發器維護的匯總表，與數據量無關）"""
+        with self.connections.connection() as conn:
             cursor = conn.cursor()
             
-            # 反饋統計
-            cursor.execute('SELECT COUNT(*) FROM user_feedback')
-            total_feedback = cursor.fetchone()[0]
-            
             cursor.execute('''
-                SELECT AVG(CAST(json_extract(user_rating, '$.overall') AS REAL))
-                FROM user_feedback 
-                WHERE user_rating IS NOT NULL
+                SELECT feedback_count, rating_count, rating_sum,
+                       detection_count, detections_count, detections_sum, value_sum
+                FROM statistics_summary WHERE id = 1
             ''')
-            avg_rating_result = cursor.fetchone()[0]
-            avg_rating = round(avg_rating_result, 1) if avg_rating_result else 0
-            
-            # 檢測統計
-            cursor.execute('SELECT COUNT(*) FROM detection_history')
-            total_detections = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT SUM(total_price) FROM detection_history')
-            total_value_result = cursor.fetchone()[0]
-            total_value = total_value_result if total_value_result else 0
+            (total_feedback, rating_count, rating_sum,
+             total_detections, detections_count, detections_sum, total_value) = cursor.fetchone()
             
-            cursor.execute('SELECT AVG(total_detections) FROM detection_history')
-            avg_detections_result = cursor.fetchone()[0]
-            avg_detections = round(avg_detections_result, 1) if avg_detections_result else 0
+            avg_rating = round(rating_sum / rating_count, 1) if rating_count else 0
+            avg_detections = round(detections_sum / detections_count, 1) if detections_count else 0
             
             # 反饋類型分布
-            cursor.execute('''
-                SELECT feedback_type, COUNT(*) 
-                FROM user_feedback 
-                GROUP BY feedback_type
-            ''')
+            cursor.execute('SELECT feedback_type, count FROM feedback_type_counts')
             feedback_types = dict(cursor.fetchall())
             
             return {
@@ -244,101 +846,199 @@ class DatabaseManager:
                 'feedback_types': feedback_types
             }
     
-    def get_recent_feedback(self, limit: int = 5) -> List[Dict]:
+    def _analytics_query(self, name: str, bucket: str, since: Optional[str], until: Optional[str],
+                         build_sql: Callable[[Callable[[str], str], str], str]) -> List[Dict]:
+        """執行分桶統計查詢，結果按 (查詢, 分桶, 範圍) 緩存
+        
+        範圍內任一天的檢測記錄有新增、修改或刪除時，緩存的數據版本不再匹配，重新查詢。
+        build_sql(分桶表達式, 匯總表篩選條件) 返回 SQL，參數為明細和匯總表各自的 since, until。
+        """
+        if bucket not in ANALYTICS_BUCKETS:
+            raise ValueError(f"不支持的分桶: {bucket}")
+        key = (name, bucket, since, until)
+        # 範圍邊界：含 since，不含 until
+        params = (since or '', until or '9999', since or '', until or '9999')
+        
+        with self.connections.connection() as conn:
+            # 先讀版本再查詢：兩者之間的寫入只會讓緩存提早失效，不會返回過期結果
+            version = conn.execute('''
+                SELECT COALESCE(SUM(version), 0) FROM analytics_watermarks WHERE day >= ? AND day <= ?
+            ''', (params[0][:10], params[1][:10])).fetchone()[0]
+            with self._analytics_lock:
+                cached = self._analytics_cache.get(key)
+                if cached is not None and cached[0] == version:
+                    self._analytics_cache.move_to_end(key)
+                    self._analytics_stats['hits'] += 1
+                    return [dict(row) for row in cached[1]]
+                self._analytics_stats['misses'] += 1
+            
+            if bucket in _ROLLUP_BUCKETS:
+                rollup_filter = 'day >= substr(?, 1, 10) AND day < ?'
+            else:
+                rollup_filter, params = '0', params[:2]
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(build_sql(ANALYTICS_BUCKETS[bucket].format, rollup_filter), params)
+            result = [dict(row) for row in cursor.fetchall()]
+        
+        with self._analytics_lock:
+            self._analytics_cache[key] = (version, result)
+            self._analytics_cache.move_to_end(key)
+            while len(self._analytics_cache) > self._analytics_cache_size:
+                self._analytics_cache.popitem(last=False)
+        return [dict(row) for row in result]
+    
+    def get_detection_series(self, bucket: str = 'day', since: Optional[str] = None,
+                             until: Optional[str] = None) -> List[Dict]:
+        """按時間分桶統計檢測記錄數、檢測物件數和總價值（含累計價值）
+        
+        bucket 為 'hour'、'day' 或 'week'；since / until 為 ISO 時間字符串（含 since，不含 until）。
+        """
+        return self._analytics_query('detections', bucket, since, until, lambda b, rollup: f'''
+            WITH merged (bucket, records, detections, value) AS (
+                SELECT {b('timestamp')}, COUNT(*), COALESCE(SUM(total_detections), 0),
+                       COALESCE(SUM(total_price), 0)
+                FROM detection_history
+                WHERE timestamp >= ? AND timestamp < ?
+                GROUP BY 1
+                UNION ALL
+                SELECT {b('day')}, record_count, detections_sum, value_sum
+                FROM detection_daily WHERE {rollup}
+            )
+            SELECT bucket, SUM(records) AS records, SUM(detections) AS detections,
+                   SUM(value) AS total_value,
+                   SUM(SUM(value)) OVER (ORDER BY bucket) AS cumulative_value
+            FROM merged
+            GROUP BY bucket
+            ORDER BY bucket
+        ''')
+    
+    def get_category_value_series(self, bucket: str = 'day', since: Optional[str] = None,
+                                  until: Optional[str] = None) -> List[Dict]:
+        """按時間分桶和類別統計物件數量、總重量、總價值及其在該時段的價值佔比"""
+        return self._analytics_query('category_value', bucket, since, until, lambda b, rollup: f'''
+            WITH merged (bucket, category_id, item_count, total_weight, total_value) AS (
+                SELECT {b('h.timestamp')}, i.category_id, COUNT(*),
+                       COALESCE(SUM(i.weight), 0), COALESCE(SUM(i.price), 0)
+                FROM detection_history AS h
+                JOIN detection_items AS i ON i.record_id = h.id
+                WHERE h.timestamp >= ? AND h.timestamp < ?
+                GROUP BY 1, 2
+                UNION ALL
+                SELECT {b('day')}, category_id, item_count, total_weight, total_value
+                FROM detection_category_daily WHERE {rollup}
+            ), totals AS (
+                SELECT bucket, category_id, SUM(item_count) AS item_count,
+                       SUM(total_weight) AS total_weight, SUM(total_value) AS total_value
+                FROM merged
+                GROUP BY bucket, category_id
+            )
+            SELECT t.bucket, t.category_id, c.name AS category, t.item_count, t.total_weight, t.total_value,
+                   COALESCE(t.total_value / NULLIF(SUM(t.total_value) OVER (PARTITION BY t.bucket), 0), 0)
+                       AS value_share
+            FROM totals AS t
+            LEFT JOIN categories AS c ON c.id = t.category_id
+            ORDER BY t.bucket, t.total_value DESC
+        ''')
+    
+    def get_mode_mix_series(self, bucket: str = 'day', since: Optional[str] = None,
+                            until: Optional[str] = None) -> List[Dict]:
+        """按時間分桶統計各檢測模式的記錄數、總價值及其在該時段的記錄佔比"""
+        return self._analytics_query('mode_mix', bucket, since, until, lambda b, rollup: f'''
+            WITH merged (bucket, detection_mode, records, value) AS (
+                SELECT {b('timestamp')}, COALESCE(detection_mode, ''), COUNT(*), COALESCE(SUM(total_price), 0)
+                FROM detection_history
+                WHERE timestamp >= ? AND timestamp < ?
+                GROUP BY 1, 2
+                UNION ALL
+                SELECT {b('day')}, detection_mode, record_count, value_sum
+                FROM detection_daily WHERE {rollup}
+            )
+            SELECT bucket, detection_mode, SUM(records) AS records, SUM(value) AS total_value,
+                   SUM(records) * 1.0 / SUM(SUM(records)) OVER (PARTITION BY bucket) AS share
+            FROM merged
+            GROUP BY bucket, detection_mode
+            ORDER BY bucket, records DESC
+        ''')
+    
+    def get_analytics_cache_stats(self) -> Dict[str, int]:
+        """獲取分析緩存的命中統計"""
+        with self._analytics_lock:
+            return dict(self._analytics_stats, entries=len(self._analytics_cache))
+    
+    def get_recent_feedback(self, limit: int = 5) -> List[Mapping]:
         """獲取最近的反饋"""
-        with sqlite3.connect(self.db_path) as conn:
+        return self.get_feedback_page(limit)[0]
+    
+    def save_performance_metrics(self, metrics: List[Dict]) -> int:
+        """批量保存性能指標"""
+        if not metrics:
+            return 0
+        
+        with self.connections.transaction() as conn:
+            conn.executemany('''
+                INSERT INTO performance_metrics
+                (timestamp, detection_mode, image_width, image_height, detection_count,
+                 cache_hit, queue_ms, preprocess_ms, detect_ms, pricing_ms, total_ms, model_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (
+                    metric.get('timestamp') or datetime.now().isoformat(),
+                    metric.get('detection_mode'),
+                    metric.get('image_width'),
+                    metric.get('image_height'),
+                    metric.get('detection_count'),
+                    None if metric.get('cache_hit') is None else int(bool(metric['cache_hit'])),
+                    metric.get('queue_ms'),
+                    metric.get('preprocess_ms'),
+                    metric.get('detect_ms'),
+                    metric.get('pricing_ms'),
+                    metric.get('total_ms'),
+                    metric.get('model_version')
+                )
+                for metric in metrics
+            ])
+            conn.commit()
+            return len(metrics)
+    
+    def get_performance_metrics(self, since: Optional[str] = None, limit: int = 20000) -> List[Dict]:
+        """獲取性能指標（按時間升序）"""
+        with self.connections.connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             cursor.execute('''
-                SELECT id, timestamp, feedback_type, content, 
-                       detection_results, user_rating, created_at
-                FROM user_feedback 
-                ORDER BY created_at DESC 
-                LIMIT ?
-            ''', (limit,))
-            
-            rows = cursor.fetchall()
-            feedback_list = []
-            
-            for row in rows:
-                feedback = {
-                    'id': row[0],
-                    'timestamp': row[1],
-                    'type': row[2],
-                    'content': row[3],
-                    'detection_results': json.loads(row[4]) if row[4] else None,
-                    'user_rating': json.loads(row[5]) if row[5] else None,
-                    'created_at': row[6]
-                }
-                feedback_list.append(feedback)
-            
-            return feedback_list
+                SELECT * FROM (
+                    SELECT timestamp, detection_mode, image_width, image_height, detection_count,
+                           cache_hit, queue_ms, preprocess_ms, detect_ms, pricing_ms, total_ms,
+                           model_version
+                    FROM performance_metrics
+                    WHERE timestamp >= ?
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                ) ORDER BY timestamp
+            ''', (since or '', limit))
+            return [dict(row) for row in cursor.fetchall()]
     
     def backup_json_data(self):
         """備份JSON數據到數據庫（如果存在）"""
-        # 備份反饋數據
-        feedback_file = "data/user_feedback.json"
-        if os.path.exists(feedback_file):
-            try:
-                with open(feedback_file, 'r', encoding='utf-8') as f:
-                    feedback_data = json.load(f)
-                
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    for feedback in feedback_data:
-                        cursor.execute('''
-                            INSERT OR IGNORE INTO user_feedback 
-                            (id, timestamp, feedback_type, content, detection_results, user_rating)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        ''', (
-                            feedback.get('id'),
-                            feedback.get('timestamp'),
-                            feedback.get('type'),
-                            feedback.get('content'),
-                            json.dumps(feedback.get('detection_results')),
-                            json.dumps(feedback.get('user_rating'))
-                        ))
-                    conn.commit()
-                
-                # 重命名原文件為備份
-                backup_file = feedback_file + '.backup'
-                os.rename(feedback_file, backup_file)
-                print(f"✅ 反饋數據已備份到數據庫，原文件重命名為: {backup_file}")
-                
-            except Exception as e:
-                print(f"⚠️ 備份反饋數據時出錯: {e}")
+        from src.bulk_import import BulkImporter
         
-        # 備份檢測歷史數據
-        history_file = "data/detection_history.json"
-        if os.path.exists(history_file):
+        # 流式解析、分批寫入；應用可能同時運行，因此保留索引
+        importer = BulkImporter.from_config(self, defer_indexes=False)
+        for dataset, path, label in (('feedback', "data/user_feedback.json", "反饋數據"),
+                                     ('detections', "data/detection_history.json", "檢測歷史數據")):
+            if not os.path.exists(path):
+                continue
             try:
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    history_data = json.load(f)
-                
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    for record in history_data:
-                        cursor.execute('''
-                            INSERT OR IGNORE INTO detection_history 
-                            (timestamp, image_path, detection_mode, total_detections, 
-                             detection_results, total_price)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        ''', (
-                            record.get('timestamp'),
-                            record.get('image_path'),
-                            record.get('detection_mode'),
-                            record.get('total_detections'),
-                            json.dumps(record.get('detection_results')),
-                            record.get('total_price')
-                        ))
-                    conn.commit()
+                stats = importer.import_file(path, dataset)
                 
                 # 重命名原文件為備份
-                backup_file = history_file + '.backup'
-                os.rename(history_file, backup_file)
-                print(f"✅ 檢測歷史數據已備份到數據庫，原文件重命名為: {backup_file}")
+                backup_file = path + '.backup'
+                os.rename(path, backup_file)
+                print(f"✅ {label}已備份到數據庫（{stats['rows']} 條），原文件重命名為: {backup_file}")
                 
             except Exception as e:
-                print(f"⚠️ 備份檢測歷史數據時出錯: {e}")
+                print(f"⚠️ 備份{label}時出錯: {e}")
 
 def main():
     """測試數據庫管理器"""
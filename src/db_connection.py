@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite連接管理 - 連接池、WAL模式、可配置的 pragma 和定期優化
+"""
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+
+class ConnectionManager:
+    """SQLite長連接池
+
+    連接在線程之間復用（同一時間只由一個線程使用），避免每次操作重新連接；
+    池中連接用完時臨時建立額外連接，歸還時關閉，不會阻塞調用方。
+    """
+
+    def __init__(self, db_path: str, pragmas: Optional[Dict[str, object]] = None,
+                 journal_mode: str = "WAL", pool_size: int = 4, optimize_interval: float = 3600.0):
+        self.db_path = db_path
+        self.pragmas = dict(pragmas or {})
+        self.pool_size = pool_size
+        self.optimize_interval = optimize_interval
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._init_lock = threading.Lock()
+        self._initialized = set()
+        self._stop = threading.Event()
+        self._optimizer: Optional[threading.Thread] = None
+
+        # journal_mode 是數據庫文件的持久設置，只需設置一次
+        conn = self._create()
+        try:
+            conn.execute(f'PRAGMA journal_mode={journal_mode}')
+        finally:
+            self._release(conn)
+
+        if optimize_interval > 0:
+            self._optimizer = threading.Thread(target=self._optimize_loop, name="sqlite-optimize",
+                                               daemon=True)
+            self._optimizer.start()
+        atexit.register(self.close)
+
+    def _create(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               timeout=self.pragmas.get('busy_timeout', 5000) / 1000)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        return conn
+
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """借用一個連接（用完自動歸還，未提交的事務會回滾）"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._create()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """借用一個連接並在結束時提交（出錯時回滾）"""
+        with self.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def run_once(self, key: str, init: Callable[[sqlite3.Connection], None]):
+        """每個進程只執行一次的初始化（例如建立表結構）"""
+        if key in self._initialized:
+            return
+        with self._init_lock:
+            if key in self._initialized:
+                return
+            with self.transaction() as conn:
+                init(conn)
+            self._initialized.add(key)
+
+    def optimize(self):
+        """更新查詢規劃器的統計信息（PRAGMA optimize 只分析需要的表）"""
+        with self.connection() as conn:
+            conn.execute('PRAGMA analysis_limit=400')
+            conn.execute('PRAGMA optimize')
+
+    def _optimize_loop(self):
+        while not self._stop.wait(self.optimize_interval):
+            try:
+                self.optimize()
+            except sqlite3.Error as e:
+                print(f"⚠️ 數據庫優化失敗: {e}")
+
+    def close(self):
+        """優化並關閉所有空閒連接"""
+        self._stop.set()
+        try:
+            self.optimize()
+        except sqlite3.Error:
+            pass
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path: str) -> ConnectionManager:
+    """獲取數據庫文件的共享連接管理器（每個進程每個文件一個）"""
+    key = os.path.abspath(db_path)
+    manager = _managers.get(key)
+    if manager is None:
+        with _managers_lock:
+            manager = _managers.get(key)
+            if manager is None:
+                from src.performance_config import get_performance_config
+
+                database_config = get_performance_config().get_database_config()
+                manager = _managers[key] = ConnectionManager(
+                    db_path,
+                    pragmas=database_config['pragmas'],
+                    journal_mode=database_config['journal_mode'],
+                    pool_size=database_config['pool_size'],
+                    optimize_interval=database_config['optimize_interval']
+                )
+    return manager
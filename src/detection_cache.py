@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+檢測結果磁碟緩存 - 使用SQLite在多個進程之間共享檢測結果
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.category_registry import get_category_registry
+
+
+def image_digest(image: np.ndarray) -> str:
+    """計算圖片內容摘要（包含尺寸和數據類型）"""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{image.shape}|{image.dtype}".encode('utf-8'))
+    hasher.update(np.ascontiguousarray(image).data)
+    return hasher.hexdigest()
+
+
+def model_version(model_paths: Iterable[str]) -> str:
+    """根據模型文件的大小和修改時間計算模型版本"""
+    hasher = hashlib.blake2b(digest_size=8)
+    for path in model_paths:
+        try:
+            stat = os.stat(path)
+            hasher.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8'))
+        except OSError:
+            hasher.update(f"{path}|missing".encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def settings_digest(settings: Dict) -> str:
+    """計算檢測設置的摘要"""
+    encoded = json.dumps(settings, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+class DiskDetectionCache:
+    """SQLite 檢測結果緩存（WAL 模式，支援多進程並發讀寫）"""
+
+    # 訪問時間的更新間隔，避免每次命中都寫入數據庫
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, db_path: str = "data/detection_cache.db", model_version: str = "",
+                 max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024):
+        """初始化磁碟緩存，模型版本改變時自動清空舊結果"""
+        self.db_path = db_path
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._puts_since_check = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每個線程使用獨立的長連接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=10000')
+            self._local.conn = conn
+        return conn
+
+    def _init_database(self):
+        """初始化緩存表並檢查模型版本"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS detection_cache (
+                    key TEXT PRIMARY KEY,
+                    model_version TEXT NOT NULL,
+                    detections TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_detection_cache_last_access
+                ON detection_cache (last_access)
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            ''')
+
+            row = conn.execute(
+                "SELECT value FROM cache_meta WHERE key = 'model_version'"
+            ).fetchone()
+            if row is None or row[0] != self.model_version:
+                # 模型已更換，舊的檢測結果全部失效
+                deleted = conn.execute('DELETE FROM detection_cache').rowcount
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('model_version', ?)",
+                    (self.model_version,)
+                )
+                if row is not None and deleted:
+                    print(f"🧹 模型已更新，清除 {deleted} 條磁碟緩存")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """讀取緩存的檢測結果"""
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT detections, last_access FROM detection_cache WHERE key = ? AND model_version = ?',
+            (key, self.model_version)
+        ).fetchone()
+        if row is None:
+            return None
+
+        now = time.time()
+        if now - row[1] > self.TOUCH_INTERVAL:
+            try:
+                conn.execute('UPDATE detection_cache SET last_access = ? WHERE key = ?', (now, key))
+            except sqlite3.OperationalError:
+                # 更新訪問時間失敗不影響讀取
+                pass
+        detections = json.loads(row[0])
+        # 類別ID按本進程的類別註冊表重新解析
+        registry = get_category_registry()
+        for detection in detections:
+            if 'class_name' in detection:
+                detection['category_id'] = registry.intern(detection['class_name'])
+        return detections
+
+    def put(self, key: str, detections: List[Dict]):
+        """寫入檢測結果，超出大小限制時淘汰最久未使用的條目
+
+        類別ID只在綁定的類別數據庫內有效，緩存文件可能被其他數據庫的進程共用，因此不保存ID。
+        """
+        payload = json.dumps([{k: v for k, v in detection.items() if k != 'category_id'}
+                              for detection in detections], default=_json_default)
+        now = time.time()
+        conn = self._connect()
+        conn.execute('''
+            INSERT OR REPLACE INTO detection_cache
+            (key, model_version, detections, size, created_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (key, self.model_version, payload, len(payload), now, now))
+
+        with self._lock:
+            self._puts_since_check += 1
+            check = self._puts_since_check >= max(1, self.max_entries // 100)
+            if check:
+                self._puts_since_check = 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """按 LRU 淘汰，直到條目數和總大小低於上限的 90%"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            count, total_size = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM detection_cache'
+            ).fetchone()
+            if count <= self.max_entries and total_size <= self.max_bytes:
+                conn.execute('COMMIT')
+                return
+
+            target_count = int(self.max_entries * 0.9)
+            target_size = int(self.max_bytes * 0.9)
+            removed = 0
+            cursor = conn.execute('SELECT key, size FROM detection_cache ORDER BY last_access')
+            victims = []
+            for key, size in cursor:
+                if count - removed <= target_count and total_size <= target_size:
+                    break
+                victims.append((key,))
+                removed += 1
+                total_size -= size
+            conn.executemany('DELETE FROM detection_cache WHERE key = ?', victims)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def clear(self):
+        """清空磁碟緩存"""
+        self._connect().execute('DELETE FROM detection_cache')
+
+    def get_stats(self) -> Dict:
+        """獲取緩存統計"""
+        count, total_size = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM detection_cache'
+        ).fetchone()
+        return {
+            'entries': count,
+            'size_bytes': total_size,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'model_version': self.model_version
+        }
+
+
+def _json_default(obj):
+    """序列化 NumPy 類型"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"無法序列化類型: {type(obj).__name__}")
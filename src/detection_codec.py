@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+檢測結果編碼 - 將檢測列表打包為緊湊的二進制格式（float32 陣列 + 類別ID），並保留 JSON 兼容
+"""
+
+import json
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.category_registry import get_category_registry
+
+MAGIC = b'RD'
+FORMAT_VERSION = 1
+
+# 頭部：魔數、版本、物件數量、字符串表長度
+_HEADER = struct.Struct('<2sBIH')
+_LENGTH = struct.Struct('<H')
+
+# 二進制格式只用於與 RecyclingPriceCalculator.price_detections 輸出結構完全一致的列表，
+# 其他結構（舊記錄、手動構造的結果）使用 JSON，確保解碼後內容不變
+_ITEM_KEYS = frozenset(('bbox', 'original_class_name', 'class_name', 'category_id', 'confidence',
+                        'source', 'relative_area', 'price_info'))
+# 未知類別只有基本欄位；已知類別另有單位、價格來源和更新時間
+_BASIC_PRICE_KEYS = frozenset(('price', 'weight', 'unit_price', 'price_version'))
+_FULL_PRICE_KEYS = _BASIC_PRICE_KEYS | {'unit', 'source', 'last_updated'}
+
+# 每個物件的 float32 欄位：bbox x1, y1, x2, y2, confidence, relative_area
+_FLOAT_FIELDS = 6
+# 每個物件的 float64 欄位（金額保持精確）：weight, price, unit_price
+_PRICE_FIELDS = 3
+# 每個物件的 int32 欄位：category_id, 原始類別ID, price_version
+_INT_FIELDS = 3
+# 每個物件的 uint16 字符串表索引：檢測來源、單位、價格來源、更新時間（_NO_STRING 表示沒有該欄位）
+_STRING_FIELDS = 4
+_NO_STRING = 0xFFFF
+
+
+def json_default(obj):
+    """json.dumps 的 default：轉換 NumPy 類型（只在遇到非標準類型時調用）"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> str:
+    """序列化為 JSON（NumPy 類型自動轉換）"""
+    return json.dumps(obj, default=json_default)
+
+
+def encode_detections(detections: List[Dict]) -> Optional[bytes]:
+    """編碼為二進制格式；結構不符合時返回 None（調用方改用 JSON）
+
+    會為未見過的原始類別名稱分配ID，需在數據庫寫事務之外調用。
+    """
+    registry = get_category_registry()
+    floats, amounts, ints, string_codes = [], [], [], []
+    strings: Dict[str, int] = {}
+
+    def string_code(value) -> int:
+        if not isinstance(value, str):
+            raise TypeError
+        return strings.setdefault(value, len(strings))
+
+    try:
+        for item in detections:
+            if not isinstance(item, dict) or item.keys() != _ITEM_KEYS:
+                return None
+            price_info = item['price_info']
+            if not isinstance(price_info, dict):
+                return None
+            price_keys = price_info.keys()
+            if price_keys == _FULL_PRICE_KEYS:
+                codes = (string_code(item['source']), string_code(price_info['unit']),
+                         string_code(price_info['source']), string_code(price_info['last_updated']))
+            elif price_keys == _BASIC_PRICE_KEYS:
+                codes = (string_code(item['source']), _NO_STRING, _NO_STRING, _NO_STRING)
+            else:
+                return None
+            bbox = item['bbox']
+            category_id = int(item['category_id'])
+            if len(bbox) != 4 or registry.name(category_id) != item['class_name']:
+                return None
+            if not isinstance(item['original_class_name'], str):
+                return None
+
+            floats.append((bbox[0], bbox[1], bbox[2], bbox[3], item['confidence'], item['relative_area']))
+            amounts.append((price_info['weight'], price_info['price'], price_info['unit_price']))
+            ints.append((category_id, registry.intern(item['original_class_name']), price_info['price_version']))
+            string_codes.append(codes)
+    except (TypeError, ValueError):
+        return None
+    if len(strings) >= _NO_STRING:
+        return None
+
+    count = len(ints)
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, count, len(strings))]
+    for value in strings:
+        encoded = value.encode('utf-8')
+        if len(encoded) > 0xFFFF:
+            return None
+        parts.append(_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+    parts.append(np.asarray(floats, dtype='<f4').reshape(count, _FLOAT_FIELDS).tobytes())
+    parts.append(np.asarray(amounts, dtype='<f8').reshape(count, _PRICE_FIELDS).tobytes())
+    parts.append(np.asarray(ints, dtype='<i4').reshape(count, _INT_FIELDS).tobytes())
+    parts.append(np.asarray(string_codes, dtype='<u2').reshape(count, _STRING_FIELDS).tobytes())
+    return b''.join(parts)
+
+
+def decode_detections(blob: bytes) -> List[Dict[str, Any]]:
+    """解碼二進制格式的檢測列表"""
+    magic, version, count, string_count = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("不是檢測結果編碼")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"不支持的檢測結果編碼版本: {version}")
+
+    offset = _HEADER.size
+    strings = []
+    for _ in range(string_count):
+        (length,) = _LENGTH.unpack_from(blob, offset)
+        offset += _LENGTH.size
+        strings.append(blob[offset:offset + length].decode('utf-8'))
+        offset += length
+
+    floats = np.frombuffer(blob, dtype='<f4', count=count * _FLOAT_FIELDS, offset=offset)
+    offset += floats.nbytes
+    amounts = np.frombuffer(blob, dtype='<f8', count=count * _PRICE_FIELDS, offset=offset)
+    offset += amounts.nbytes
+    ints = np.frombuffer(blob, dtype='<i4', count=count * _INT_FIELDS, offset=offset)
+    offset += ints.nbytes
+    string_codes = np.frombuffer(blob, dtype='<u2', count=count * _STRING_FIELDS, offset=offset)
+
+    name = get_category_registry().name
+    results = []
+    for (x1, y1, x2, y2, confidence, relative_area), (weight, price, unit_price), \
+            (category_id, original_id, price_version), (source, unit, price_source, last_updated) \
+            in zip(floats.reshape(count, _FLOAT_FIELDS).tolist(),
+                   amounts.reshape(count, _PRICE_FIELDS).tolist(),
+                   ints.reshape(count, _INT_FIELDS).tolist(),
+                   string_codes.reshape(count, _STRING_FIELDS).tolist()):
+        if unit == _NO_STRING:
+            price_info = {'price': price, 'weight': weight, 'unit_price': unit_price,
+                          'price_version': price_version}
+        else:
+            price_info = {'price': price, 'weight': weight, 'unit_price': unit_price,
+                          'unit': strings[unit], 'source': strings[price_source],
+                          'last_updated': strings[last_updated], 'price_version': price_version}
+        results.append({
+            'bbox': [x1, y1, x2, y2],
+            'original_class_name': name(original_id),
+            'class_name': name(category_id),
+            'category_id': category_id,
+            'confidence': confidence,
+            'source': strings[source],
+            'relative_area': relative_area,
+            'price_info': price_info
+        })
+    return results
+
+
+def encode_for_storage(detections: List[Dict], fmt: str = 'binary') -> Tuple[Optional[str], Optional[bytes]]:
+    """按存儲格式編碼，返回 (detection_results 文本, detection_blob)，二者只有一個不為 None"""
+    if fmt == 'binary' and detections:
+        blob = encode_detections(detections)
+        if blob is not None:
+            return None, blob
+    return dumps(detections), None
+
+
+def decode_stored(value) -> List[Dict[str, Any]]:
+    """解碼 COALESCE(detection_blob, detection_results) 的值（二進制、JSON 文本或空值）"""
+    if not value:
+        return []
+    if isinstance(value, (bytes, memoryview)):
+        return decode_detections(bytes(value))
+    return json.loads(value)
+
+
+def stored_json(value) -> Optional[str]:
+    """將存儲的檢測結果轉為 JSON 文本（匯出、歸檔用）"""
+    if isinstance(value, (bytes, memoryview)):
+        return dumps(decode_detections(bytes(value)))
+    return value
@@ -1,39 +1,44 @@
-import cv2
-import numpy as np
-from ultralytics import YOLO
-import torch
-from PIL import Image
-import streamlit as st
 import os
-import torch.serialization
+import threading
 import warnings
 from functools import lru_cache
 import time
 from src.performance_config import get_performance_config, optimize_system
+from src.detection_cache import DiskDetectionCache, image_digest, model_version, settings_digest
+from src.single_flight import SingleFlight
+from src.category_registry import (DIRECT_MAPPING, HIGH_CONFIDENCE_KEYWORDS, RECYCLING_KEYWORDS,
+                                   get_category_registry)
 warnings.filterwarnings("ignore")
 
-# 優化系統設置
-optimize_system()
-
 class EnhancedRecyclingDetector:
+    # 模型文件路徑
+    GENERAL_MODEL_PATH = "yolov8n.pt"
+    CUSTOM_MODEL_PATH = "yolov8_models/best.pt"
+    
     def __init__(self):
         # 獲取性能配置
         self.config = get_performance_config()
         
+        # 優化系統設置（延遲到第一次建立檢測器時，而非模組導入時）
+        optimize_system()
+        
         # 修復 PyTorch 2.6 模型載入問題
         self._setup_torch_compatibility()
         
         # 使用您的自定義模型和預訓練模型
         try:
+            # ultralytics 導入成本高，只在建立檢測器時載入
+            from ultralytics import YOLO
+            
             # 獲取模型配置
             model_config = self.config.get_model_config()
             
             # 先嘗試載入通用模型（這個應該能正常工作）
-            self.general_model = YOLO("yolov8n.pt")
+            self.general_model = YOLO(self.GENERAL_MODEL_PATH)
             
             # 嘗試載入自定義模型
             try:
-                self.custom_model = YOLO("yolov8_models/best.pt")
+                self.custom_model = YOLO(self.CUSTOM_MODEL_PATH)
                 print("✅ 所有模型載入成功")
             except Exception as custom_error:
                 print(f"自定義模型載入失敗: {custom_error}")
@@ -46,65 +51,15 @@ class EnhancedRecyclingDetector:
             self.custom_model = None
             self.general_model = None
         
-        # 回收物關鍵詞映射（高準確率版）
-        self.recycling_keywords = {
-            # 塑膠類（高信心度）
-            "bottle": "塑膠瓶",
-            "plastic": "塑膠瓶", 
-            "container": "塑膠容器",
-            "bag": "塑膠袋",
-            "cup": "塑膠杯",
-            "straw": "吸管",
-            "hdpe": "HDPE",    # 高密度聚乙烯
-            "pet": "PET",        # 聚對苯二甲酸乙二醇酯
-            "pp": "PP",          # 聚丙烯
-            "ps": "PS",          # 聚苯乙烯
-            "pvc": "PVC",        # 聚氯乙烯
-            
-            # 金屬類（高信心度）
-            "can": "金屬罐",
-            "aluminum": "鋁罐", 
-            "steel": "鐵罐",
-            "metal": "金屬",
-            "wire": "銅線",
-            "scrap": "廢金屬",
-            
-            # 紙類（高信心度）
-            "paper": "紙類",
-            "cardboard": "紙箱",
-            "newspaper": "報紙",
-            "magazine": "雜誌",
-            "book": "書籍",
-            "box": "紙箱",
-            
-            # 玻璃類（需要更明確的指示）
-            "glass": "玻璃瓶",
-            "jar": "玻璃罐",
-            "wine": "玻璃瓶",  # 酒瓶通常是玻璃
-            "beer": "玻璃瓶",   # 啤酒瓶通常是玻璃
-            
-            # 電子類（高信心度）
-            "phone": "電子廢棄物",
-            "laptop": "電子廢棄物", 
-            "computer": "電子廢棄物",
-            "battery": "廢電池",
-            "electronics": "電子廢棄物",
-            
-            # 其他（高信心度）
-            "tire": "廢輪胎",
-            "wood": "廢木材",
-            "fabric": "廢紡織品",
-            "ceramic": "廢陶瓷",
-            "oil": "廢機油"
-        }
+        # 回收物關鍵詞映射（高準確率版），與價格計算器共用類別註冊表
+        self.recycling_keywords = RECYCLING_KEYWORDS
         
         # 高信心度關鍵詞（只匹配這些詞才分類為回收物）
-        self.high_confidence_keywords = {
-            "bottle", "can", "paper", "glass", "plastic", "metal",
-            "cardboard", "newspaper", "book", "phone", "laptop",
-            "battery", "tire", "wood", "fabric", "ceramic", "container",
-            "box", "jar", "cup", "bag", "wire", "scrap", "wine", "water"
-        }
+        self.high_confidence_keywords = HIGH_CONFIDENCE_KEYWORDS
+        
+        # 模型類別索引 -> (顯示類別, 是否為回收物, 類別ID)，每個模型只編譯一次
+        self.category_registry = get_category_registry()
+        self._class_tables = {}
         
         # 性能優化：緩存檢測結果
         cache_config = self.config.get_cache_config()
@@ -112,6 +67,31 @@ class EnhancedRecyclingDetector:
         self._cache_size = cache_config['detection_cache_size']
         self._cache_counter = 0
         
+        # 線程安全：緩存狀態和模型推理（ultralytics predictor 不可並發調用）各自加鎖
+        self._cache_lock = threading.Lock()
+        self._custom_model_lock = threading.Lock()
+        self._general_model_lock = threading.Lock()
+        
+        # 合併相同圖片和設置的並發檢測請求（例如重複點擊或重跑）
+        self._single_flight = SingleFlight()
+        self._cache_stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        # 每個線程最近一次請求的緩存狀態（供性能指標使用）
+        self._request_local = threading.local()
+        
+        # 磁碟緩存（可選）：模型文件改變時自動失效
+        self.model_version = model_version([self.GENERAL_MODEL_PATH, self.CUSTOM_MODEL_PATH])
+        self._disk_cache = None
+        if cache_config['disk_enable']:
+            try:
+                self._disk_cache = DiskDetectionCache(
+                    cache_config['disk_path'],
+                    model_version=self.model_version,
+                    max_entries=cache_config['disk_max_entries'],
+                    max_bytes=cache_config['disk_max_bytes']
+                )
+            except Exception as e:
+                print(f"磁碟緩存初始化失敗: {e}")
+        
     def _setup_torch_compatibility(self):
         """設置 PyTorch 2.6 兼容性"""
         try:
@@ -153,39 +133,62 @@ class EnhancedRecyclingDetector:
         except Exception as e:
             print(f"PyTorch 兼容性設置警告: {e}")
     
+    def _cache_key(self, image, mode='enhanced', digest=None):
+        """緩存鍵：圖片內容摘要 + 模型版本 + 檢測設置（digest 為已計算的 image_digest(image)）"""
+        settings = {
+            'mode': mode,
+            'model': self.config.get_model_config(),
+            'overlap': self.config.OVERLAP_THRESHOLD
+        }
+        return f"{digest or image_digest(image)}:{self.model_version}:{settings_digest(settings)}"
+    
+    def _count_cache(self, outcome):
+        """記錄緩存命中情況"""
+        with self._cache_lock:
+            self._cache_stats[outcome] += 1
+    
+    def _set_cache_status(self, status):
+        self._request_local.cache_status = status
+    
+    def last_cache_status(self):
+        """當前線程最近一次檢測的緩存狀態: 'memory' / 'disk' / 'coalesced' / 'miss' / None（未使用緩存）"""
+        return getattr(self._request_local, 'cache_status', None)
+    
+    def get_metrics(self):
+        """獲取檢測器指標（緩存命中和請求合併情況）"""
+        with self._cache_lock:
+            metrics = dict(self._cache_stats)
+            metrics['memory_cache_entries'] = len(self._detection_cache)
+        flight_stats = self._single_flight.get_stats()
+        metrics.update({
+            'requests': flight_stats['calls'],
+            'coalesced_requests': flight_stats['duplicates'],
+            'duplicate_rate': flight_stats['duplicate_rate'],
+            'in_flight': flight_stats['in_flight']
+        })
+        if self._disk_cache is not None:
+            metrics['disk_cache'] = self._disk_cache.get_stats()
+        return metrics
+    
     def _clear_cache_if_needed(self):
         """根據配置清理緩存"""
         cache_config = self.config.get_cache_config()
-        self._cache_counter += 1
-        
-        if self._cache_counter >= cache_config['clear_interval']:
-            self._detection_cache.clear()
-            self._cache_counter = 0
-            print("🧹 緩存已清理")
+        with self._cache_lock:
+            self._cache_counter += 1
+            
+            if self._cache_counter >= cache_config['clear_interval']:
+                self._detection_cache.clear()
+                self._cache_counter = 0
+                print("🧹 緩存已清理")
     
     @lru_cache(maxsize=1000)
     def classify_as_recycling(self, class_name):
         """將通用類別分類為回收物類別（改進版本）"""
         class_name_lower = class_name.lower()
         
-        # 直接映射常見的檢測結果
-        direct_mapping = {
-            "glass": "玻璃瓶",
-            "bottle": "塑膠瓶",
-            "can": "金屬罐",
-            "box": "紙箱",
-            "paper": "紙類",
-            "plastic": "塑膠瓶",
-            "metal": "金屬",
-            "container": "塑膠容器",
-            "jar": "玻璃罐",
-            "cup": "塑膠杯",
-            "bag": "塑膠袋"
-        }
-        
         # 首先檢查直接映射
-        if class_name_lower in direct_mapping:
-            return direct_mapping[class_name_lower]
+        if class_name_lower in DIRECT_MAPPING:
+            return DIRECT_MAPPING[class_name_lower]
         
         # 然後檢查是否為高信心度關鍵詞
         for keyword in self.high_confidence_keywords:
@@ -206,8 +209,18 @@ class EnhancedRecyclingDetector:
         
         return None
     
-    def detect_with_custom_model(self, image):
-        """使用你的自定義模型檢測（5類）- 優化版"""
+    def detect_with_custom_model(self, image, digest=None):
+        """使用你的自定義模型檢測（5類）- 相同圖片的並發請求只推理一次"""
+        if self.custom_model is None:
+            return []
+        
+        flight_key = ('custom', self._cache_key(image, 'custom', digest))
+        detections, shared = self._single_flight.do(flight_key, self._run_custom_model, image)
+        self._set_cache_status('coalesced' if shared else None)
+        return detections if detections is not None else []
+    
+    def _run_custom_model(self, image):
+        """使用你的自定義模型檢測（5類）- 優化版，推理失敗時返回 None"""
         if self.custom_model is None:
             return []
         
@@ -216,52 +229,40 @@ class EnhancedRecyclingDetector:
             
             # 使用性能配置
             model_config = self.config.get_model_config()
-            results = self.custom_model(
-                image, 
-                verbose=model_config['verbose'],
-                conf=model_config['conf'],
-                iou=model_config['iou'],
-                device=model_config['device']
-            )
+            with self._custom_model_lock:
+                results = self.custom_model(
+                    image, 
+                    verbose=model_config['verbose'],
+                    conf=model_config['conf'],
+                    iou=model_config['iou'],
+                    device=model_config['device']
+                )
             
             detection_time = time.time() - start_time
             
             detections = []
             for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        bbox = box.xyxy[0].cpu().numpy()
-                        confidence = float(box.conf[0])
-                        class_id = int(box.cls[0])
-                        class_name = result.names[class_id]
-                        
-                        # 檢查是否為回收物
-                        recycling_type = self.classify_as_recycling(class_name)
-                        if recycling_type:
-                            detections.append({
-                                'bbox': bbox.tolist(),
-                                'class_name': recycling_type,
-                                'confidence': confidence,
-                                'source': 'custom_model'
-                            })
-                        else:
-                            detections.append({
-                                'bbox': bbox.tolist(),
-                                'class_name': class_name,
-                                'confidence': confidence,
-                                'source': 'custom_model'
-                            })
+                detections.extend(self._parse_custom_result(result))
             
             print(f"自定義模型檢測完成，耗時: {detection_time:.3f}秒")
             return detections
             
         except Exception as e:
             print(f"自定義模型檢測錯誤: {e}")
+            return None
+    
+    def detect_with_general_model(self, image, digest=None):
+        """使用通用模型檢測 - 相同圖片的並發請求只推理一次"""
+        if self.general_model is None:
             return []
+        
+        flight_key = ('general', self._cache_key(image, 'general', digest))
+        detections, shared = self._single_flight.do(flight_key, self._run_general_model, image)
+        self._set_cache_status('coalesced' if shared else None)
+        return detections if detections is not None else []
     
-    def detect_with_general_model(self, image):
-        """使用通用模型檢測 - 優化版"""
+    def _run_general_model(self, image):
+        """使用通用模型檢測 - 優化版，推理失敗時返回 None"""
         if self.general_model is None:
             return []
         
@@ -272,53 +273,123 @@ class EnhancedRecyclingDetector:
             model_config = self.config.get_model_config()
             detection_conf = 0.3  # 降低檢測信心度以確保能檢測到物體
             
-            results = self.general_model(
-                image, 
-                verbose=model_config['verbose'],
-                conf=detection_conf,  # 使用較低的信心度進行檢測
-                iou=model_config['iou'],
-                device=model_config['device']
-            )
+            with self._general_model_lock:
+                results = self.general_model(
+                    image, 
+                    verbose=model_config['verbose'],
+                    conf=detection_conf,  # 使用較低的信心度進行檢測
+                    iou=model_config['iou'],
+                    device=model_config['device']
+                )
             
             detection_time = time.time() - start_time
             
             detections = []
             for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        bbox = box.xyxy[0].cpu().numpy()
-                        confidence = float(box.conf[0])
-                        class_id = int(box.cls[0])
-                        class_name = result.names[class_id]
-                        
-                        # 處理所有檢測到的物體
-                        if confidence >= 0.3:  # 降低信心度要求
-                            # 檢查是否為回收物
-                            recycling_type = self.classify_as_recycling(class_name)
-                            if recycling_type:
-                                detections.append({
-                                    'bbox': bbox.tolist(),
-                                    'class_name': recycling_type,
-                                    'confidence': confidence,
-                                    'source': 'general_model'
-                                })
-                            else:
-                                # 如果沒有分類為回收物，但信心度較高，也記錄下來
-                                if confidence >= 0.5:
-                                    detections.append({
-                                        'bbox': bbox.tolist(),
-                                        'class_name': class_name,
-                                        'confidence': confidence,
-                                        'source': 'general_model'
-                                    })
+                detections.extend(self._parse_general_result(result))
             
             print(f"通用模型檢測完成，耗時: {detection_time:.3f}秒，檢測到 {len(detections)} 個回收物")
             return detections
             
         except Exception as e:
             print(f"通用模型檢測錯誤: {e}")
-            return []
+            return None
+    
+    def _class_table(self, source, names):
+        """編譯模型類別表：模型類別索引 -> (類別名稱, 是否為回收物, 類別ID)"""
+        registry = self.category_registry
+        table = self._class_tables.get(source)
+        if table is None or table[0] != registry.version:
+            entries = {}
+            for class_id, class_name in names.items():
+                recycling_type = self.classify_as_recycling(class_name)
+                label = recycling_type or class_name
+                entries[class_id] = (label, recycling_type is not None, registry.intern(label))
+            table = self._class_tables[source] = (registry.version, entries)
+        return table[1]
+    
+    def _parse_custom_result(self, result):
+        """解析自定義模型的單張圖片結果"""
+        detections = []
+        boxes = result.boxes
+        if boxes is not None:
+            class_table = self._class_table('custom_model', result.names)
+            for box in boxes:
+                bbox = box.xyxy[0].cpu().numpy()
+                confidence = float(box.conf[0])
+                
+                # 回收物使用映射後的類別，否則保留原始類別
+                class_name, _, category_id = class_table[int(box.cls[0])]
+                detections.append({
+                    'bbox': bbox.tolist(),
+                    'class_name': class_name,
+                    'category_id': category_id,
+                    'confidence': confidence,
+                    'source': 'custom_model'
+                })
+        return detections
+    
+    def _parse_general_result(self, result):
+        """解析通用模型的單張圖片結果"""
+        detections = []
+        boxes = result.boxes
+        if boxes is not None:
+            class_table = self._class_table('general_model', result.names)
+            for box in boxes:
+                bbox = box.xyxy[0].cpu().numpy()
+                confidence = float(box.conf[0])
+                class_name, is_recycling, category_id = class_table[int(box.cls[0])]
+                
+                # 處理所有檢測到的物體（降低信心度要求）；
+                # 未分類為回收物的物體只在信心度較高時記錄
+                if confidence >= 0.3 and (is_recycling or confidence >= 0.5):
+                    detections.append({
+                        'bbox': bbox.tolist(),
+                        'class_name': class_name,
+                        'category_id': category_id,
+                        'confidence': confidence,
+                        'source': 'general_model'
+                    })
+        return detections
+    
+    def detect_batch(self, images, mode='custom', batch_size=8):
+        """批量檢測多張圖片，返回與輸入順序對應的檢測結果列表
+        
+        mode 為 'custom' 或 'general' 時每批只調用一次模型；
+        'enhanced' 模式按圖片逐張檢測（可利用緩存）。
+        """
+        if mode == 'enhanced':
+            return [self.detect_recycling_objects(image) for image in images]
+        
+        if mode == 'custom':
+            model, lock, parse = self.custom_model, self._custom_model_lock, self._parse_custom_result
+            conf = self.config.get_model_config()['conf']
+        elif mode == 'general':
+            model, lock, parse = self.general_model, self._general_model_lock, self._parse_general_result
+            conf = 0.3
+        else:
+            raise ValueError(f"未知的檢測模式: {mode}")
+        
+        if model is None:
+            return [[] for _ in images]
+        
+        model_config = self.config.get_model_config()
+        all_detections = []
+        start_time = time.time()
+        for offset in range(0, len(images), batch_size):
+            batch = list(images[offset:offset + batch_size])
+            with lock:
+                results = model(
+                    batch,
+                    verbose=model_config['verbose'],
+                    conf=conf,
+                    iou=model_config['iou'],
+                    device=model_config['device']
+                )
+            all_detections.extend(parse(result) for result in results)
+        
+        print(f"批量檢測 {len(images)} 張圖片，耗時: {time.time() - start_time:.3f}秒")
+        return all_detections
     
     def fast_check_overlap(self, bbox1, bbox2, threshold=None):
         """快速重疊檢查（優化版）"""
@@ -367,32 +438,72 @@ class EnhancedRecyclingDetector:
         
         return combined
     
-    def detect_recycling_objects(self, image):
-        """主要檢測函數（高性能版本）"""
+    def detect_recycling_objects(self, image, degraded=False, digest=None):
+        """主要檢測函數（高性能版本）
+        
+        degraded=True 時（系統過載）只使用通用模型，且結果不寫入緩存。
+        相同圖片和設置的並發請求會等待同一次計算並共享結果。
+        digest 為已計算的圖片摘要（例如圖片存儲返回的摘要），避免重複計算。
+        """
+        cache_key = self._cache_key(image, digest=digest)
+        flight_key = ('enhanced', cache_key, degraded)
+        detections, shared = self._single_flight.do(
+            flight_key, self._detect_enhanced, image, cache_key, degraded
+        )
+        if shared:
+            self._set_cache_status('coalesced')
+        return detections
+    
+    def _detect_enhanced(self, image, cache_key, degraded):
+        """增強檢測（緩存 -> 通用模型 -> 自定義模型）"""
         start_time = time.time()
         
-        # 檢查緩存
+        # 檢查緩存（內存 -> 磁碟）
         if self.config.ENABLE_CACHE:
-            image_hash = hash(str(image.shape) + str(image.dtype))
-            if image_hash in self._detection_cache:
+            with self._cache_lock:
+                cached = self._detection_cache.get(cache_key)
+            if cached is not None:
                 print("使用緩存結果")
-                return self._detection_cache[image_hash]
+                self._count_cache('memory_hits')
+                self._set_cache_status('memory')
+                return cached
+            
+            if self._disk_cache is not None:
+                cached = self._disk_cache.get(cache_key)
+                if cached is not None:
+                    print("使用磁碟緩存結果")
+                    self._count_cache('disk_hits')
+                    self._set_cache_status('disk')
+                    with self._cache_lock:
+                        if len(self._detection_cache) < self._cache_size:
+                            self._detection_cache[cache_key] = cached
+                    return cached
+            
+            self._count_cache('misses')
+        self._set_cache_status('miss' if self.config.ENABLE_CACHE else None)
         
-        # 檢測（優化版本）
+        # 檢測（優化版本）；任一模型推理失敗時結果不完整，不寫入緩存
         custom_detections = []
         general_detections = []
+        failed = False
         
         # 優先使用通用模型（更快）
         if self.general_model is not None:
-            general_detections = self.detect_with_general_model(image)
+            general_detections = self._run_general_model(image)
+            if general_detections is None:
+                failed = True
+                general_detections = []
             
-            # 如果通用模型檢測到足夠的物體，就不使用自定義模型
-            if len(general_detections) >= 2:
+            # 如果通用模型檢測到足夠的物體（或系統過載），就不使用自定義模型
+            if len(general_detections) >= 2 or degraded:
                 final_detections = general_detections
             else:
                 # 如果通用模型檢測結果不足，嘗試自定義模型
                 if self.custom_model is not None:
-                    custom_detections = self.detect_with_custom_model(image)
+                    custom_detections = self._run_custom_model(image)
+                    if custom_detections is None:
+                        failed = True
+                        custom_detections = []
                     # 合併結果
                     combined_detections = self.combine_detections_fast(custom_detections, general_detections)
                     
@@ -403,7 +514,7 @@ class EnhancedRecyclingDetector:
                     for detection in combined_detections:
                         # 創建唯一標識符
                         bbox_key = tuple(round(x, 2) for x in detection['bbox'])
-                        class_key = detection['class_name']
+                        class_key = detection.get('category_id', detection['class_name'])
                         combination = (bbox_key, class_key)
                         
                         if combination not in seen_combinations:
@@ -414,13 +525,23 @@ class EnhancedRecyclingDetector:
         else:
             # 只有自定義模型可用
             if self.custom_model is not None:
-                final_detections = self.detect_with_custom_model(image)
+                final_detections = self._run_custom_model(image)
+                if final_detections is None:
+                    failed = True
+                    final_detections = []
             else:
                 final_detections = []
         
-        # 緩存結果
-        if self.config.ENABLE_CACHE and len(self._detection_cache) < self._cache_size:
-            self._detection_cache[image_hash] = final_detections
+        # 緩存結果（降級或推理失敗時結果不完整，不寫入緩存）
+        if self.config.ENABLE_CACHE and not degraded and not failed:
+            with self._cache_lock:
+                if len(self._detection_cache) < self._cache_size:
+                    self._detection_cache[cache_key] = final_detections
+            if self._disk_cache is not None:
+                try:
+                    self._disk_cache.put(cache_key, final_detections)
+                except Exception as e:
+                    print(f"寫入磁碟緩存失敗: {e}")
         
         # 清理緩存
         self._clear_cache_if_needed()
@@ -432,6 +553,8 @@ class EnhancedRecyclingDetector:
 
 # 使用範例
 if __name__ == "__main__":
+    import cv2
+    
     detector = EnhancedRecyclingDetector()
     
     # 測試圖片
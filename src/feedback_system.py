@@ -5,23 +5,35 @@
 """
 
 import streamlit as st
-import pandas as pd
 from .database_manager import DatabaseManager
 
-# 嘗試導入plotly，如果失敗則使用備用方案
-try:
-    import plotly.express as px
-    PLOTLY_AVAILABLE = True
-except ImportError:
-    PLOTLY_AVAILABLE = False
-    print("⚠️ plotly未安裝，將使用備用圖表方案")
+# plotly 只在顯示圖表時載入；None 表示尚未嘗試導入
+_plotly_express = None
+
+def _load_plotly():
+    """延遲導入plotly，如果失敗則使用備用方案"""
+    global _plotly_express
+    if _plotly_express is None:
+        try:
+            import plotly.express as px
+            _plotly_express = px
+        except ImportError:
+            _plotly_express = False
+            print("⚠️ plotly未安裝，將使用備用圖表方案")
+    return _plotly_express or None
 
 class FeedbackSystem:
-    def __init__(self):
-        self.db_manager = DatabaseManager()
+    def __init__(self, db_manager=None, writer=None):
+        # 與主應用共用同一個 DatabaseManager（及其連接池）
+        self.db_manager = db_manager or DatabaseManager()
+        # 延後寫入器（WriteBehindWriter），為 None 時同步寫入
+        self.writer = writer
     
     def save_feedback(self, feedback_type, content, detection_results=None, user_rating=None):
-        """保存用戶反饋到數據庫"""
+        """保存用戶反饋到數據庫（延後寫入時返回 None）"""
+        if self.writer is not None:
+            self.writer.submit_feedback(feedback_type, content, detection_results, user_rating)
+            return None
         return self.db_manager.save_feedback(feedback_type, content, detection_results, user_rating)
     
     def create_feedback_form(self, detection_results=None):
@@ -68,7 +80,10 @@ class FeedbackSystem:
             if st.button("提交反饋", type="primary"):
                 if content.strip():
                     feedback_id = self.save_feedback(feedback_type, content, detection_results, user_rating)
-                    st.success(f"✅ 反饋已提交！反饋ID: {feedback_id}")
+                    if feedback_id is None:
+                        st.success("✅ 反饋已提交！")
+                    else:
+                        st.success(f"✅ 反饋已提交！反饋ID: {feedback_id}")
                     st.balloons()
                 else:
                     st.error("請填寫反饋內容")
@@ -99,8 +114,11 @@ class FeedbackSystem:
         st.subheader("📊 反饋類型分布")
         if stats['feedback_types']:
             feedback_types = stats['feedback_types']
+            px = _load_plotly()
             
-            if PLOTLY_AVAILABLE:
+            if px is not None:
+                import pandas as pd
+                
                 # 使用plotly創建圖表
                 fig_data = pd.DataFrame({
                     "類型": list(feedback_types.keys()),
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+圖片存儲 - 按內容摘要保存檢測圖片（相同圖片只存一份），背景寫入原圖並生成縮略圖
+"""
+
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Set
+
+import numpy as np
+from PIL import Image
+
+from src.detection_cache import image_digest
+from src.performance_config import get_performance_config
+
+
+class ImageStore:
+    """內容尋址的圖片存儲
+
+    摘要與檢測緩存鍵使用同一個 image_digest，檢測記錄只保存摘要。
+    文件按摘要前兩級分目錄（ab/cd/abcd....png），避免單個目錄文件過多；
+    原圖（PNG 無損）和縮略圖（JPEG）都由背景線程寫入，不阻塞頁面渲染。
+    """
+
+    def __init__(self, root: str = "data/images", thumbnail_size: int = 256, orphan_grace: float = 86400.0):
+        self.root = root
+        self.thumbnail_size = thumbnail_size
+        self.orphan_grace = orphan_grace
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-store")
+        self._pending = set()
+        self._stats_lock = threading.Lock()
+        self._stats = {'stored': 0, 'deduplicated': 0, 'thumbnails': 0, 'failed': 0, 'removed': 0}
+
+    def _shard_path(self, directory: str, digest: str, extension: str) -> str:
+        return os.path.join(directory, digest[:2], digest[2:4], f"{digest}.{extension}")
+
+    def path(self, digest: str) -> str:
+        """原圖路徑"""
+        return self._shard_path(self.root, digest, 'png')
+
+    def thumbnail_path(self, digest: str) -> str:
+        """縮略圖路徑"""
+        return self._shard_path(os.path.join(self.root, 'thumbnails'), digest, 'jpg')
+
+    def exists(self, digest: str) -> bool:
+        """圖片是否已保存"""
+        return os.path.exists(self.path(digest))
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    @staticmethod
+    def _write_atomic(image: Image.Image, path: str, **save_options):
+        """先寫臨時文件再改名，其他進程不會讀到寫了一半的圖片"""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, **save_options)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def put(self, image: np.ndarray, digest: Optional[str] = None) -> str:
+        """提交圖片保存（已存在或正在寫入時跳過），返回內容摘要
+
+        digest 可傳入已計算的 image_digest(image)，避免重複計算；調用方之後不應修改 image。
+        """
+        digest = digest or image_digest(image)
+        with self._stats_lock:
+            duplicate = digest in self._pending or os.path.exists(self.path(digest))
+            if duplicate:
+                self._stats['deduplicated'] += 1
+            else:
+                self._pending.add(digest)
+        if not duplicate:
+            self._executor.submit(self._write, digest, image)
+        return digest
+
+    def _write(self, digest: str, array: np.ndarray):
+        try:
+            image = Image.fromarray(array)
+            # PNG 壓縮級別 1：保存速度優先（原圖只寫一次）
+            self._write_atomic(image, self.path(digest), format='PNG', compress_level=1)
+            self._count('stored')
+            self._write_thumbnail(digest, image)
+        except Exception as e:
+            self._count('failed')
+            print(f"⚠️ 保存圖片失敗 {digest}: {e}")
+        finally:
+            with self._stats_lock:
+                self._pending.discard(digest)
+
+    def _write_thumbnail(self, digest: str, image: Image.Image):
+        image = image.convert('RGB')
+        image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+        self._write_atomic(image, self.thumbnail_path(digest), format='JPEG', quality=85)
+        self._count('thumbnails')
+
+    def open(self, digest: str) -> Image.Image:
+        """讀取原圖"""
+        return Image.open(self.path(digest))
+
+    def thumbnail(self, digest: str) -> Optional[str]:
+        """縮略圖路徑；缺少時從原圖生成，原圖不存在時返回 None"""
+        path = self.thumbnail_path(digest)
+        if not os.path.exists(path):
+            if not self.exists(digest):
+                return None
+            with self.open(digest) as image:
+                self._write_thumbnail(digest, image)
+        return path
+
+    def cleanup_orphans(self, referenced: Callable[[Iterable[str]], Set[str]], batch_size: int = 500) -> int:
+        """刪除沒有檢測記錄引用的圖片（及其縮略圖），返回刪除的圖片數
+
+        referenced(digests) 返回其中仍被引用的摘要（例如 DatabaseManager.referenced_image_digests）。
+        修改時間在 orphan_grace 秒內的文件不刪除：圖片寫入後檢測記錄可能仍在延後寫入隊列中。
+        """
+        cutoff = time.time() - self.orphan_grace
+        removed = 0
+        candidates = []
+        for directory, subdirectories, files in os.walk(self.root):
+            if directory == self.root and 'thumbnails' in subdirectories:
+                subdirectories.remove('thumbnails')
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                except OSError:
+                    continue
+                if file_name.endswith('.tmp'):
+                    # 寫入中斷留下的臨時文件
+                    os.remove(path)
+                elif file_name.endswith('.png'):
+                    candidates.append(file_name[:-4])
+                if len(candidates) >= batch_size:
+                    removed += self._remove_unreferenced(candidates, referenced)
+                    candidates = []
+        removed += self._remove_unreferenced(candidates, referenced)
+        return removed
+
+    def _remove_unreferenced(self, digests, referenced) -> int:
+        if not digests:
+            return 0
+        keep = referenced(digests)
+        with self._stats_lock:
+            keep |= self._pending
+        removed = 0
+        for digest in digests:
+            if digest in keep:
+                continue
+            for path in (self.path(digest), self.thumbnail_path(digest)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        self._count('removed', removed)
+        return removed
+
+    def flush(self):
+        """等待已提交的圖片寫入完成"""
+        self._executor.submit(lambda: None).result()
+
+    def get_stats(self) -> Dict[str, int]:
+        """獲取本進程的存儲統計（pending = 待寫入的圖片數）"""
+        with self._stats_lock:
+            return dict(self._stats, pending=len(self._pending))
+
+
+_image_store: Optional[ImageStore] = None
+_image_store_lock = threading.Lock()
+
+
+def get_image_store() -> Optional[ImageStore]:
+    """獲取全局圖片存儲（ENABLE_IMAGE_STORE 關閉時返回 None）"""
+    global _image_store
+    config = get_performance_config()
+    if not config.ENABLE_IMAGE_STORE:
+        return None
+    if _image_store is None:
+        with _image_store_lock:
+            if _image_store is None:
+                _image_store = ImageStore(**config.get_image_store_config())
+    return _image_store
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+導入分析器 - 記錄每個模組的導入耗時，用於產生啟動報告
+"""
+
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class _TimingLoader:
+    """包裝原始 loader，記錄 exec_module 的耗時"""
+
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # 還原原始 loader，避免影響依賴 loader 類型的第三方代碼
+        spec = getattr(module, '__spec__', None)
+        if spec is not None and spec.loader is self:
+            spec.loader = self._loader
+        if getattr(module, '__loader__', None) is self:
+            module.__loader__ = self._loader
+
+        self._profiler._enter(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit(module.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportProfiler:
+    """通過 sys.meta_path 攔截模組載入，統計每個模組的導入時間"""
+
+    def __init__(self):
+        self._records: Dict[str, Dict[str, float]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._installed = False
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+    # sys.meta_path finder 接口
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimingLoader(spec.loader, self)
+                return spec
+        return None
+
+    def invalidate_caches(self):
+        pass
+
+    def _stack(self) -> List[list]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, name):
+        # [模組名稱, 開始時間, 子模組耗時]
+        self._stack().append([name, time.perf_counter(), 0.0])
+
+    def _exit(self, name):
+        stack = self._stack()
+        entry = stack.pop()
+        elapsed = time.perf_counter() - entry[1]
+        if stack:
+            stack[-1][2] += elapsed
+        with self._lock:
+            self._records[name] = {
+                'cumulative': elapsed,
+                'self': elapsed - entry[2],
+                'top_level': not stack
+            }
+
+    def start(self):
+        """開始記錄導入耗時"""
+        if not self._installed:
+            sys.meta_path.insert(0, self)
+            self._installed = True
+            self.started_at = time.perf_counter()
+        return self
+
+    def stop(self):
+        """停止記錄"""
+        if self._installed:
+            try:
+                sys.meta_path.remove(self)
+            except ValueError:
+                pass
+            self._installed = False
+            self.stopped_at = time.perf_counter()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def get_records(self) -> List[Dict]:
+        """按累計耗時排序的導入記錄"""
+        with self._lock:
+            items = list(self._records.items())
+        records = [
+            {
+                'module': name,
+                'cumulative_ms': data['cumulative'] * 1000,
+                'self_ms': data['self'] * 1000,
+                'top_level': data['top_level']
+            }
+            for name, data in items
+        ]
+        records.sort(key=lambda record: record['cumulative_ms'], reverse=True)
+        return records
+
+    def get_total_time(self) -> float:
+        """記錄期間的總耗時（秒）"""
+        if self.started_at is None:
+            return 0.0
+        end = self.stopped_at if self.stopped_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    def get_report(self, top: int = 20) -> str:
+        """產生啟動導入報告"""
+        records = self.get_records()
+        top_level = [record for record in records if record['top_level']]
+
+        report = "📦 啟動導入報告\n"
+        report += "=" * 60 + "\n"
+        report += f"總耗時: {self.get_total_time() * 1000:.1f} ms，載入模組: {len(records)} 個\n"
+        report += "-" * 60 + "\n"
+        report += f"{'累計(ms)':>10} {'自身(ms)':>10}  模組\n"
+        for record in records[:top]:
+            marker = "*" if record['top_level'] else " "
+            report += (f"{record['cumulative_ms']:>10.1f} {record['self_ms']:>10.1f} "
+                       f"{marker}{record['module']}\n")
+        report += "-" * 60 + "\n"
+        report += f"* 表示直接導入的頂層模組 ({len(top_level)} 個)\n"
+        report += "=" * 60 + "\n"
+        return report
+
+
+# 應用啟動時使用的全局分析器
+_startup_profiler: Optional[ImportProfiler] = None
+
+def start_startup_profiling() -> ImportProfiler:
+    """開始記錄啟動導入（每個進程只安裝一次）"""
+    global _startup_profiler
+    if _startup_profiler is None:
+        _startup_profiler = ImportProfiler().start()
+    return _startup_profiler
+
+def get_startup_profiler() -> Optional[ImportProfiler]:
+    """獲取啟動導入分析器"""
+    return _startup_profiler
+
+
+def main():
+    """分析指定模組的導入耗時"""
+    import argparse
+    import importlib
+    import os
+
+    parser = argparse.ArgumentParser(description="分析模組導入耗時")
+    parser.add_argument('modules', nargs='*', default=[
+        'src.performance_config',
+        'src.recycling_price_calculator',
+        'src.database_manager',
+        'src.enhanced_detection',
+        'src.feedback_system'
+    ])
+    parser.add_argument('--top', type=int, default=20, help="顯示最慢的模組數量")
+    args = parser.parse_args()
+
+    # 確保可以從項目根目錄導入 src
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    with ImportProfiler() as profiler:
+        for module_name in args.modules:
+            try:
+                importlib.import_module(module_name)
+            except Exception as e:
+                print(f"⚠️ 導入 {module_name} 失敗: {e}")
+
+    print(profiler.get_report(args.top))
+
+if __name__ == "__main__":
+    main()
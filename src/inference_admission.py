@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推理准入控制 - 限制並發推理數量，提供有界隊列、會話公平性和過載降級
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from src.performance_config import get_performance_config
+
+
+class AdmissionRejected(RuntimeError):
+    """系統過載，請求被拒絕"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class AdmissionTicket:
+    """准入憑證"""
+
+    __slots__ = ('session_id', 'degraded', 'wait_time')
+
+    def __init__(self, session_id: str, degraded: bool, wait_time: float):
+        self.session_id = session_id
+        self.degraded = degraded  # 過載時應使用較快的降級檢測
+        self.wait_time = wait_time
+
+
+class _Waiter:
+    __slots__ = ('event', 'granted', 'degraded')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.degraded = False
+
+
+class InferenceAdmission:
+    """推理請求准入層
+
+    - 同時最多 max_concurrent 個推理
+    - 等待隊列最多 max_queue 個請求，超出時立即拒絕
+    - 每個會話最多 max_per_session 個等待請求，會話之間輪流調度
+    - 等待超過 queue_timeout 秒時拒絕
+    - 隊列深度達到 degrade_queue_depth 時，准入的請求標記為降級
+    """
+
+    def __init__(self, max_concurrent: int = 1, max_queue: int = 8, max_per_session: int = 2,
+                 queue_timeout: float = 15.0, degrade_queue_depth: int = 4):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_per_session = max_per_session
+        self.queue_timeout = queue_timeout
+        self.degrade_queue_depth = degrade_queue_depth
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting: "OrderedDict[str, deque]" = OrderedDict()
+        self._waiting_count = 0
+
+        self._stats = {
+            'admitted': 0,
+            'degraded': 0,
+            'rejected_queue_full': 0,
+            'rejected_session_limit': 0,
+            'rejected_timeout': 0,
+            'max_queue_depth': 0,
+            'total_wait_time': 0.0
+        }
+
+    def _should_degrade(self) -> bool:
+        return self._waiting_count >= self.degrade_queue_depth
+
+    def acquire(self, session_id: str) -> AdmissionTicket:
+        """申請推理名額，必要時排隊等待"""
+        start = time.perf_counter()
+
+        with self._lock:
+            if self._active < self.max_concurrent and self._waiting_count == 0:
+                self._active += 1
+                self._stats['admitted'] += 1
+                return AdmissionTicket(session_id, False, 0.0)
+
+            if self._waiting_count >= self.max_queue:
+                self._stats['rejected_queue_full'] += 1
+                raise AdmissionRejected('queue_full', "系統忙碌中，請稍後再試")
+
+            session_queue = self._waiting.get(session_id)
+            if session_queue is not None and len(session_queue) >= self.max_per_session:
+                self._stats['rejected_session_limit'] += 1
+                raise AdmissionRejected('session_limit', "您已有檢測正在進行，請等待完成")
+
+            waiter = _Waiter()
+            if session_queue is None:
+                session_queue = self._waiting[session_id] = deque()
+            session_queue.append(waiter)
+            self._waiting_count += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._waiting_count)
+
+        waiter.event.wait(self.queue_timeout)
+
+        with self._lock:
+            wait_time = time.perf_counter() - start
+            if not waiter.granted:
+                # 超時：從隊列中移除
+                session_queue = self._waiting.get(session_id)
+                if session_queue is not None:
+                    try:
+                        session_queue.remove(waiter)
+                        self._waiting_count -= 1
+                    except ValueError:
+                        pass
+                    if not session_queue:
+                        del self._waiting[session_id]
+                self._stats['rejected_timeout'] += 1
+                raise AdmissionRejected('timeout', "等待檢測超時，請稍後再試")
+
+            self._stats['admitted'] += 1
+            self._stats['total_wait_time'] += wait_time
+            if waiter.degraded:
+                self._stats['degraded'] += 1
+            return AdmissionTicket(session_id, waiter.degraded, wait_time)
+
+    def release(self):
+        """釋放推理名額並按會話輪流喚醒等待者"""
+        with self._lock:
+            self._active -= 1
+            while self._active < self.max_concurrent and self._waiting:
+                session_id, session_queue = next(iter(self._waiting.items()))
+                waiter = session_queue.popleft()
+                self._waiting_count -= 1
+                if session_queue:
+                    # 該會話還有等待請求，移到隊尾以保證公平
+                    self._waiting.move_to_end(session_id)
+                else:
+                    del self._waiting[session_id]
+
+                waiter.granted = True
+                waiter.degraded = self._should_degrade()
+                self._active += 1
+                waiter.event.set()
+
+    @contextmanager
+    def admit(self, session_id: str):
+        """准入上下文：with admission.admit(session_id) as ticket: ..."""
+        ticket = self.acquire(session_id)
+        try:
+            yield ticket
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict:
+        """獲取准入統計"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active'] = self._active
+            stats['queue_depth'] = self._waiting_count
+            stats['waiting_sessions'] = len(self._waiting)
+        waited = stats['admitted']
+        stats['avg_wait_time'] = stats.pop('total_wait_time') / waited if waited else 0.0
+        return stats
+
+
+# 全局准入控制實例（按需建立）
+_inference_admission: Optional[InferenceAdmission] = None
+_admission_lock = threading.Lock()
+
+def get_inference_admission() -> InferenceAdmission:
+    """獲取全局推理准入控制"""
+    global _inference_admission
+    if _inference_admission is None:
+        with _admission_lock:
+            if _inference_admission is None:
+                admission_config = get_performance_config().get_admission_config()
+                _inference_admission = InferenceAdmission(**admission_config)
+    return _inference_admission
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量掃描任務隊列 - 多台機器共享同一個SQLite文件分配圖片檢測任務
+"""
+
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+# 批量模式 -> 檢測記錄中使用的模式名稱（與主應用一致）
+BATCH_MODE_LABELS = {
+    'custom': "自定義模型 (5類回收物)",
+    'enhanced': "增強檢測 (推薦)",
+    'general': "通用模型"
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class JobQueue:
+    """基於SQLite的可恢復任務隊列，與 DatabaseManager 共用數據庫文件
+
+    任務狀態: pending -> leased -> done / failed
+    工作進程租用任務時設置過期時間，崩潰後過期的任務會重新分配。
+    """
+
+    def __init__(self, db_manager, max_attempts: int = 3, retry_delay: float = 30.0):
+        """初始化任務隊列"""
+        self.db_manager = db_manager
+        self.db_path = db_manager.db_path
+        self.connections = db_manager.connections
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.init_tables()
+
+    def init_tables(self):
+        """初始化任務表（每個進程只執行一次）"""
+        self.connections.run_once('scan_jobs', self._create_tables)
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS scan_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch TEXT NOT NULL,
+                image_path TEXT NOT NULL,
+                detection_mode TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                last_error TEXT,
+                record_id INTEGER,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                UNIQUE (batch, image_path)
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_scan_jobs_status
+            ON scan_jobs (status, available_at)
+        ''')
+
+    def enqueue(self, image_paths: Iterable[str], detection_mode: str = 'custom',
+                batch: Optional[str] = None) -> int:
+        """加入任務；同一批次中重複的圖片路徑會被忽略，返回新增數量"""
+        if detection_mode not in BATCH_MODE_LABELS:
+            raise ValueError(f"未知的檢測模式: {detection_mode}")
+        batch = batch or datetime.now().strftime('%Y%m%d-%H%M%S')
+        now = datetime.now().isoformat()
+
+        with self.connections.transaction() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.total_changes
+            conn.executemany('''
+                INSERT OR IGNORE INTO scan_jobs
+                (batch, image_path, detection_mode, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', ((batch, os.path.abspath(path), detection_mode, now, now) for path in image_paths))
+            return conn.total_changes - before
+
+    def lease(self, worker_id: str, limit: int = 8, lease_seconds: float = 300.0) -> List[Dict]:
+        """租用一批可執行的任務（待處理或租約已過期）"""
+        now = time.time()
+        with self.connections.transaction() as conn:
+            # 先取得寫鎖，多台機器同時租用時不會分配到同一任務
+            conn.execute('BEGIN IMMEDIATE')
+
+            # 租約過期且已達最大重試次數的任務標記為失敗
+            conn.execute('''
+                UPDATE scan_jobs
+                SET status = 'failed', lease_owner = NULL,
+                    last_error = COALESCE(last_error, '租約過期'), updated_at = ?
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+            ''', (datetime.now().isoformat(), now, self.max_attempts))
+
+            job_ids = [row[0] for row in conn.execute('''
+                SELECT id FROM scan_jobs
+                WHERE (status = 'pending' AND available_at <= ?)
+                   OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY id
+                LIMIT ?
+            ''', (now, now, limit))]
+
+            conn.executemany('''
+                UPDATE scan_jobs
+                SET status = 'leased', lease_owner = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+            ''', [(worker_id, now + lease_seconds, datetime.now().isoformat(), job_id)
+                  for job_id in job_ids])
+
+            if not job_ids:
+                return []
+            placeholders = ','.join('?' * len(job_ids))
+            cursor = conn.execute(
+                f'SELECT * FROM scan_jobs WHERE id IN ({placeholders}) ORDER BY id', job_ids
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+    def extend_lease(self, job_ids: List[int], worker_id: str, lease_seconds: float = 300.0) -> List[int]:
+        """延長租約（長時間批量處理時調用），返回仍由該工作進程持有的任務ID"""
+        with self.connections.transaction() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            expires = time.time() + lease_seconds
+            return [job_id for job_id in job_ids if conn.execute('''
+                UPDATE scan_jobs SET lease_expires = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'leased'
+            ''', (expires, job_id, worker_id)).rowcount]
+
+    def find_saved_record(self, job: Dict) -> Optional[int]:
+        """查找該任務已保存的檢測記錄（按任務ID，不會匹配其他批次掃描同一路徑的結果）"""
+        with self.connections.connection() as conn:
+            row = conn.execute('''
+                SELECT id FROM detection_history
+                WHERE scan_job_id = ?
+                ORDER BY id DESC LIMIT 1
+            ''', (job['id'],)).fetchone()
+            return row[0] if row else None
+
+    def save_result(self, job: Dict, worker_id: str, record: Dict) -> Optional[int]:
+        """在同一個事務中確認租約、保存檢測記錄並標記任務完成，返回記錄ID
+
+        租約已被其他工作進程接管時不保存，返回 None（不會產生重複記錄）。
+        record 的鍵與 DatabaseManager.save_detection_record 的參數相同。
+        """
+        prepared = self.db_manager.prepare_detection_records([dict(record, scan_job_id=job['id'])])
+        with self.connections.transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE scan_jobs
+                SET status = 'done', lease_owner = NULL, last_error = NULL, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'leased'
+            ''', (datetime.now().isoformat(), job['id'], worker_id))
+            if cursor.rowcount != 1:
+                return None
+            record_id = self.db_manager.insert_detection_records(conn, prepared)[0]
+            conn.execute('UPDATE scan_jobs SET record_id = ? WHERE id = ?', (record_id, job['id']))
+            return record_id
+
+    def complete(self, job_id: int, worker_id: str, record_id: int) -> bool:
+        """標記任務完成；若租約已被其他工作進程接管則返回 False"""
+        with self.connections.transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE scan_jobs
+                SET status = 'done', record_id = ?, lease_owner = NULL,
+                    last_error = NULL, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'leased'
+            ''', (record_id, datetime.now().isoformat(), job_id, worker_id))
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str):
+        """記錄失敗；未達最大次數時延遲後重試"""
+        with self.connections.transaction() as conn:
+            conn.execute('''
+                UPDATE scan_jobs
+                SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    available_at = ? + ? * attempts,
+                    lease_owner = NULL, last_error = ?, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'leased'
+            ''', (self.max_attempts, time.time(), self.retry_delay, error[:500],
+                  datetime.now().isoformat(), job_id, worker_id))
+
+    def retry_failed(self, batch: Optional[str] = None) -> int:
+        """將失敗的任務重新放回隊列"""
+        query = '''
+            UPDATE scan_jobs
+            SET status = 'pending', attempts = 0, available_at = 0, updated_at = ?
+            WHERE status = 'failed'
+        '''
+        params = [datetime.now().isoformat()]
+        if batch:
+            query += ' AND batch = ?'
+            params.append(batch)
+        with self.connections.transaction() as conn:
+            return conn.execute(query, params).rowcount
+
+    def get_status(self, batch: Optional[str] = None) -> Dict[str, int]:
+        """獲取各狀態的任務數量"""
+        query = 'SELECT status, COUNT(*) FROM scan_jobs'
+        params = []
+        if batch:
+            query += ' WHERE batch = ?'
+            params.append(batch)
+        query += ' GROUP BY status'
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        with self.connections.connection() as conn:
+            counts.update(dict(conn.execute(query, params).fetchall()))
+        return counts
+
+
+class ScanWorker:
+    """從隊列租用任務，以批量模式運行檢測器並保存檢測記錄"""
+
+    def __init__(self, queue: JobQueue, detector, price_calculator,
+                 worker_id: Optional[str] = None, batch_size: int = 8,
+                 lease_seconds: float = 300.0):
+        self.queue = queue
+        self.detector = detector
+        self.price_calculator = price_calculator
+        self.db_manager = queue.db_manager
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.stats = {'done': 0, 'recovered': 0, 'failed': 0, 'lost_lease': 0}
+
+    def _load_image(self, path: str):
+        import numpy as np
+        from PIL import Image
+        from src.performance_config import preprocess_image
+
+        with Image.open(path) as image:
+            return preprocess_image(np.array(image.convert('RGB')))
+
+    def _save(self, job: Dict, image, detections: List[Dict]):
+        results = self.price_calculator.price_detections(detections, image.shape)
+        record_id = self.queue.save_result(job, self.worker_id, {
+            'detection_mode': BATCH_MODE_LABELS[job['detection_mode']],
+            'total_detections': len(results),
+            'detection_results': results,
+            'total_price': sum(item['price_info']['price'] for item in results),
+            'image_path': job['image_path']
+        })
+        if record_id is not None:
+            self.stats['done'] += 1
+        else:
+            self.stats['lost_lease'] += 1
+            print(f"⚠️ 任務 {job['id']} 的租約已被其他工作進程接管，未保存結果")
+
+    def _renew(self, items: List[tuple]) -> List[tuple]:
+        """延長租約，丟棄已被其他工作進程接管的任務"""
+        owned = set(self.queue.extend_lease([job['id'] for job, *_ in items], self.worker_id,
+                                            self.lease_seconds))
+        lost = [job for job, *_ in items if job['id'] not in owned]
+        if lost:
+            self.stats['lost_lease'] += len(lost)
+            print(f"⚠️ {len(lost)} 個任務的租約已被其他工作進程接管，跳過")
+        return [item for item in items if item[0]['id'] in owned]
+
+    def process_jobs(self, jobs: List[Dict]):
+        """處理一批已租用的任務"""
+        pending = []
+        for job in jobs:
+            # 重試的任務可能在崩潰前已經保存了結果
+            if job['attempts'] > 1:
+                record_id = self.queue.find_saved_record(job)
+                if record_id is not None:
+                    self.queue.complete(job['id'], self.worker_id, record_id)
+                    self.stats['recovered'] += 1
+                    continue
+            try:
+                pending.append((job, self._load_image(job['image_path'])))
+            except Exception as e:
+                self.queue.fail(job['id'], self.worker_id, f"讀取圖片失敗: {e}")
+                self.stats['failed'] += 1
+
+        # 按檢測模式分組批量推理
+        by_mode: Dict[str, List] = {}
+        for job, image in pending:
+            by_mode.setdefault(job['detection_mode'], []).append((job, image))
+
+        for mode, items in by_mode.items():
+            # 每組推理前延長租約，避免批量處理超過租期後被其他工作進程重複處理
+            items = self._renew(items)
+            if not items:
+                continue
+            images = [image for _, image in items]
+            try:
+                batch_detections = self.detector.detect_batch(images, mode=mode, batch_size=self.batch_size)
+            except Exception as e:
+                for job, _ in items:
+                    self.queue.fail(job['id'], self.worker_id, f"檢測失敗: {e}")
+                    self.stats['failed'] += 1
+                continue
+
+            # 推理可能耗時較長，保存前再次延長；保存時仍在事務中確認租約
+            owned = {job['id'] for job, _ in self._renew(items)}
+            for (job, image), detections in zip(items, batch_detections):
+                if job['id'] not in owned:
+                    continue
+                try:
+                    self._save(job, image, detections)
+                except Exception as e:
+                    self.queue.fail(job['id'], self.worker_id, f"保存失敗: {e}")
+                    self.stats['failed'] += 1
+
+    def run(self, max_jobs: Optional[int] = None, idle_timeout: float = 0.0, poll_interval: float = 2.0):
+        """持續處理任務，直到隊列為空（超過 idle_timeout）或達到 max_jobs"""
+        processed = 0
+        idle_since = None
+        while max_jobs is None or processed < max_jobs:
+            limit = self.batch_size if max_jobs is None else min(self.batch_size, max_jobs - processed)
+            jobs = self.queue.lease(self.worker_id, limit, self.lease_seconds)
+            if not jobs:
+                idle_since = idle_since or time.time()
+                if time.time() - idle_since >= idle_timeout:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            idle_since = None
+            self.process_jobs(jobs)
+            processed += len(jobs)
+            print(f"🔄 {self.worker_id}: 已處理 {processed} 個任務 {self.stats}")
+        return self.stats
+
+
+def main():
+    """命令行入口"""
+    import argparse
+    from src.database_manager import DatabaseManager
+
+    parser = argparse.ArgumentParser(description="批量掃描任務隊列")
+    parser.add_argument('--db-path', default="data/recycling_app.db", help="共享數據庫路徑")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help="加入圖片目錄中的所有圖片")
+    enqueue_parser.add_argument('directory')
+    enqueue_parser.add_argument('--mode', choices=BATCH_MODE_LABELS.keys(), default='custom')
+    enqueue_parser.add_argument('--batch', help="批次名稱（預設為當前時間）")
+
+    work_parser = subparsers.add_parser('work', help="運行工作進程")
+    work_parser.add_argument('--worker-id')
+    work_parser.add_argument('--batch-size', type=int, default=8)
+    work_parser.add_argument('--lease-seconds', type=float, default=300.0)
+    work_parser.add_argument('--max-jobs', type=int)
+    work_parser.add_argument('--idle-timeout', type=float, default=0.0, help="隊列為空時等待的秒數")
+
+    status_parser = subparsers.add_parser('status', help="顯示任務狀態")
+    status_parser.add_argument('--batch')
+
+    retry_parser = subparsers.add_parser('retry-failed', help="重新排隊失敗的任務")
+    retry_parser.add_argument('--batch')
+
+    args = parser.parse_args()
+    queue = JobQueue(DatabaseManager(args.db_path))
+
+    if args.command == 'enqueue':
+        paths = []
+        for root, _, files in os.walk(args.directory):
+            paths.extend(os.path.join(root, name) for name in sorted(files)
+                         if name.lower().endswith(IMAGE_EXTENSIONS))
+        added = queue.enqueue(paths, args.mode, args.batch)
+        print(f"✅ 已加入 {added} 個任務（共找到 {len(paths)} 張圖片）")
+    elif args.command == 'work':
+        from src.enhanced_detection import EnhancedRecyclingDetector
+        from src.recycling_price_calculator import RecyclingPriceCalculator
+
+        worker = ScanWorker(queue, EnhancedRecyclingDetector(), RecyclingPriceCalculator(),
+                            worker_id=args.worker_id, batch_size=args.batch_size,
+                            lease_seconds=args.lease_seconds)
+        stats = worker.run(max_jobs=args.max_jobs, idle_timeout=args.idle_timeout)
+        print(f"✅ 工作進程結束: {stats}")
+    elif args.command == 'status':
+        print(f"📊 任務狀態: {queue.get_status(args.batch)}")
+    elif args.command == 'retry-failed':
+        print(f"🔁 重新排隊 {queue.retry_failed(args.batch)} 個任務")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+負載測試工具 - 模擬多個自助機會話並發使用檢測、價格計算和數據庫
+"""
+
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.inference_admission import AdmissionRejected, get_inference_admission
+from src.performance_config import preprocess_image
+
+# 與主應用相同的檢測模式名稱
+DETECTION_MODES = ["自定義模型 (5類回收物)", "增強檢測 (推薦)", "通用模型"]
+
+# 測試目標：完整流程 / 只測檢測器 / 只測價格計算和數據庫
+TARGETS = ("full", "detector", "pricing-db")
+
+# pricing-db 目標使用的模擬檢測類別
+_SIMULATED_CLASSES = ["PlasticBottle", "AluCan", "IronCan", "Paper", "GlassBottle", "bottle", "box"]
+
+
+def load_fixture_images(fixture_dir: Optional[str] = None,
+                        sizes: Tuple[Tuple[int, int], ...] = ((480, 640), (720, 1280), (1080, 1920)),
+                        seed: int = 0) -> List[Tuple[str, np.ndarray]]:
+    """載入測試圖片；若未提供目錄，則生成不同尺寸的合成圖片"""
+    images = []
+    if fixture_dir and os.path.isdir(fixture_dir):
+        from PIL import Image
+
+        for name in sorted(os.listdir(fixture_dir)):
+            if not name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
+                continue
+            with Image.open(os.path.join(fixture_dir, name)) as image:
+                images.append((name, np.array(image.convert('RGB'))))
+
+    if not images:
+        rng = np.random.default_rng(seed)
+        for height, width in sizes:
+            image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+            images.append((f"synthetic_{width}x{height}", image))
+    return images
+
+
+class _ResourceSampler:
+    """在背景線程中採樣進程的 CPU 和內存使用"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.cpu_samples: List[float] = []
+        self.rss_samples: List[float] = []
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._process = None
+
+    def _run(self):
+        self._process.cpu_percent(None)
+        while not self._stop.wait(self.interval):
+            self.cpu_samples.append(self._process.cpu_percent(None))
+            self.rss_samples.append(self._process.memory_info().rss / (1024 * 1024))
+
+    def start(self):
+        if self._process is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+        return self
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        usage = {'avg_cpu_percent': 100.0 * cpu / wall if wall > 0 else 0.0}
+        if self.cpu_samples:
+            usage['avg_cpu_percent'] = float(np.mean(self.cpu_samples))
+            usage['max_cpu_percent'] = float(np.max(self.cpu_samples))
+        if self.rss_samples:
+            usage['max_rss_mb'] = float(np.max(self.rss_samples))
+        else:
+            import resource
+            # Linux 上 ru_maxrss 單位為 KB
+            usage['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return usage
+
+
+class LoadTester:
+    """以多個模擬會話驅動檢測器 / 價格計算器 / 數據庫
+
+    檢測請求與主應用一樣經過推理准入控制；預設每個請求的圖片內容都不同
+    （在預處理後的圖片中寫入請求序號），檢測緩存不會命中，測得的是實際推理的吞吐量。
+    unique_images=False 時重複使用測試圖片，可用於測量緩存命中的路徑。
+    """
+
+    def __init__(self, target: str = "full", detector=None, price_calculator=None,
+                 db_manager=None, images: Optional[List[Tuple[str, np.ndarray]]] = None,
+                 mode_weights: Optional[Dict[str, float]] = None, seed: int = 0,
+                 unique_images: bool = True):
+        if target not in TARGETS:
+            raise ValueError(f"未知的測試目標: {target}")
+        self.target = target
+        self.detector = detector
+        self.price_calculator = price_calculator
+        self.db_manager = db_manager
+        self.images = images or load_fixture_images(seed=seed)
+        self.mode_weights = mode_weights or {"增強檢測 (推薦)": 0.6,
+                                             "自定義模型 (5類回收物)": 0.3,
+                                             "通用模型": 0.1}
+        self.seed = seed
+        self.unique_images = unique_images
+        self._request_numbers = itertools.count(1)
+
+    def _make_unique(self, image: np.ndarray, original: np.ndarray) -> np.ndarray:
+        """在圖片開頭寫入請求序號，使每個請求的內容摘要不同"""
+        if image is original or not image.flags.writeable:
+            image = image.copy()
+        stamp = np.frombuffer(np.int64(next(self._request_numbers)).tobytes(), dtype=np.uint8)
+        image.reshape(-1)[:stamp.size] = stamp
+        return image
+
+    def _detect(self, image: np.ndarray, mode: str, rng: random.Random, session_id: str) -> List[Dict]:
+        if self.target == "pricing-db":
+            # 不經過模型，生成隨機檢測結果
+            height, width = image.shape[:2]
+            detections = []
+            for _ in range(rng.randint(1, 4)):
+                x1, y1 = rng.uniform(0, width / 2), rng.uniform(0, height / 2)
+                detections.append({
+                    'bbox': [x1, y1, x1 + rng.uniform(10, width / 2), y1 + rng.uniform(10, height / 2)],
+                    'class_name': rng.choice(_SIMULATED_CLASSES),
+                    'confidence': rng.uniform(0.5, 1.0),
+                    'source': 'simulated'
+                })
+            return detections
+
+        # 與主應用相同：推理前經過准入控制（排隊、會話輪流、過載降級）
+        with get_inference_admission().admit(session_id) as ticket:
+            if mode == "自定義模型 (5類回收物)":
+                return self.detector.detect_with_custom_model(image)
+            if mode == "通用模型":
+                return self.detector.detect_with_general_model(image)
+            return self.detector.detect_recycling_objects(image, degraded=ticket.degraded)
+
+    def run_request(self, image: np.ndarray, mode: str, rng: random.Random,
+                    session_id: str = "load-test") -> int:
+        """執行一次與主應用相同的處理流程，返回檢測數量"""
+        processed_image = preprocess_image(image)
+        if self.unique_images:
+            processed_image = self._make_unique(processed_image, image)
+        detections = self._detect(processed_image, mode, rng, session_id)
+        if self.target == "detector":
+            return len(detections)
+
+        results = self.price_calculator.price_detections(detections, processed_image.shape)
+
+        if self.db_manager is not None:
+            self.db_manager.save_detection_record(
+                detection_mode=mode,
+                total_detections=len(results),
+                detection_results=results,
+                total_price=sum(item['price_info']['price'] for item in results)
+            )
+        return len(results)
+
+    def _session(self, session_id: int, deadline: float, arrival_rate: float,
+                 samples: List[Tuple[float, float, float, str]], lock: threading.Lock):
+        rng = random.Random(self.seed * 1000003 + session_id)
+        modes = list(self.mode_weights.keys())
+        weights = list(self.mode_weights.values())
+        # 錯開各會話的開始時間
+        next_arrival = time.perf_counter() + rng.expovariate(arrival_rate)
+
+        while True:
+            now = time.perf_counter()
+            if next_arrival >= deadline:
+                break
+            if next_arrival > now:
+                time.sleep(next_arrival - now)
+
+            _, image = rng.choice(self.images)
+            mode = rng.choices(modes, weights)[0]
+            started = time.perf_counter()
+            try:
+                self.run_request(image, mode, rng, f"load-test-{session_id}")
+                status = 'ok'
+            except AdmissionRejected:
+                status = 'rejected'
+            except Exception as e:
+                print(f"⚠️ 會話 {session_id} 請求失敗: {e}")
+                status = 'error'
+            finished = time.perf_counter()
+
+            # 響應時間從計劃到達時間算起（含落後時的排隊等待，避免協調遺漏），服務時間從實際開始算起
+            with lock:
+                samples.append((next_arrival, finished - next_arrival, finished - started, status))
+
+            # 泊松到達：到達時間與處理進度無關，落後時後續請求立即開始
+            next_arrival += rng.expovariate(arrival_rate)
+
+    def run(self, sessions: int, duration: float, arrival_rate: float) -> Dict[str, Any]:
+        """以指定會話數運行負載測試
+
+        arrival_rate 為每個會話每秒的平均請求數（指數分布的到達間隔）。
+        latency_* 為響應時間（從計劃到達時間算起），service_* 為實際處理時間。
+        """
+        samples: List[Tuple[float, float, float, str]] = []
+        lock = threading.Lock()
+        sampler = _ResourceSampler().start()
+        started = time.perf_counter()
+        deadline = started + duration
+
+        threads = [
+            threading.Thread(target=self._session,
+                             args=(i, deadline, arrival_rate, samples, lock),
+                             daemon=True)
+            for i in range(sessions)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - started
+        usage = sampler.stop()
+        return self._summarize(sessions, arrival_rate, elapsed, samples, usage)
+
+    def _summarize(self, sessions, arrival_rate, elapsed, samples, usage) -> Dict[str, Any]:
+        latencies = np.array([latency for _, latency, _, status in samples if status == 'ok'],
+                             dtype=float) * 1000
+        service_times = np.array([service for _, _, service, status in samples if status == 'ok'],
+                                 dtype=float) * 1000
+        # 准入控制拒絕的請求同樣算作失敗（自助機上用戶看到的是「系統忙碌」）
+        rejected = sum(1 for *_, status in samples if status == 'rejected')
+        errors = sum(1 for *_, status in samples if status != 'ok')
+        total = len(samples)
+
+        summary = {
+            'target': self.target,
+            'sessions': sessions,
+            'offered_rate': sessions * arrival_rate,
+            'duration': elapsed,
+            'requests': total,
+            'errors': errors,
+            'rejected': rejected,
+            'error_rate': errors / total if total else 0.0,
+            'throughput': (total - errors) / elapsed if elapsed > 0 else 0.0,
+        }
+        if len(latencies):
+            p50, p90, p95, p99 = np.percentile(latencies, [50, 90, 95, 99])
+            summary.update({
+                'latency_mean_ms': float(latencies.mean()),
+                'latency_p50_ms': float(p50),
+                'latency_p90_ms': float(p90),
+                'latency_p95_ms': float(p95),
+                'latency_p99_ms': float(p99),
+                'latency_max_ms': float(latencies.max()),
+                'service_p50_ms': float(np.percentile(service_times, 50)),
+                'service_p95_ms': float(np.percentile(service_times, 95))
+            })
+        summary.update(usage)
+        return summary
+
+    def find_saturation(self, levels: List[int], duration: float, arrival_rate: float,
+                        latency_slo_ms: float = 2000.0, max_error_rate: float = 0.01,
+                        min_gain: float = 0.05) -> Dict[str, Any]:
+        """逐步增加會話數，找出吞吐量不再增長或延遲超出目標的飽和點"""
+        results = []
+        saturation = None
+        best_throughput = 0.0
+
+        for sessions in levels:
+            result = self.run(sessions, duration, arrival_rate)
+            results.append(result)
+            print(format_result(result))
+
+            p95 = result.get('latency_p95_ms', float('inf'))
+            if result['error_rate'] > max_error_rate or p95 > latency_slo_ms:
+                saturation = {'sessions': sessions, 'reason': 'SLO 超標'}
+                break
+            if best_throughput and result['throughput'] < best_throughput * (1 + min_gain):
+                saturation = {'sessions': sessions, 'reason': '吞吐量不再增長'}
+                break
+            best_throughput = max(best_throughput, result['throughput'])
+
+        max_sustainable = None
+        for result in results:
+            if (result['error_rate'] <= max_error_rate and
+                    result.get('latency_p95_ms', float('inf')) <= latency_slo_ms):
+                max_sustainable = result
+        return {
+            'levels': results,
+            'saturation': saturation,
+            'max_sustainable_sessions': max_sustainable['sessions'] if max_sustainable else None,
+            'max_throughput': max((r['throughput'] for r in results), default=0.0)
+        }
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    """格式化單次負載測試結果"""
+    line = (f"會話 {result['sessions']:>3} | 請求 {result['requests']:>5} | "
+            f"吞吐量 {result['throughput']:.2f}/s | 錯誤率 {result['error_rate']:.1%}")
+    if result.get('rejected'):
+        line += f"（准入拒絕 {result['rejected']}）"
+    if 'latency_p50_ms' in result:
+        line += (f" | p50 {result['latency_p50_ms']:.0f}ms p95 {result['latency_p95_ms']:.0f}ms "
+                 f"p99 {result['latency_p99_ms']:.0f}ms（服務 p95 {result['service_p95_ms']:.0f}ms）")
+    line += f" | CPU {result['avg_cpu_percent']:.0f}%"
+    if 'max_rss_mb' in result:
+        line += f" RSS {result['max_rss_mb']:.0f}MB"
+    return line
+
+
+def main():
+    """命令行入口"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="回收物檢測系統負載測試")
+    parser.add_argument('--target', choices=TARGETS, default="full", help="測試目標")
+    parser.add_argument('--fixtures', help="測試圖片目錄（未提供時使用合成圖片）")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help="會話數；提供多個值時搜索飽和點")
+    parser.add_argument('--duration', type=float, default=30.0, help="每個級別的持續時間（秒）")
+    parser.add_argument('--rate', type=float, default=0.5, help="每個會話每秒的平均請求數")
+    parser.add_argument('--slo-ms', type=float, default=2000.0, help="p95 延遲目標（毫秒）")
+    parser.add_argument('--db-path', help="數據庫路徑（預設使用臨時數據庫）")
+    parser.add_argument('--reuse-images', action='store_true',
+                        help="重複使用測試圖片（檢測緩存會命中，只用於測量緩存路徑）")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    detector = None
+    price_calculator = None
+    db_manager = None
+
+    if args.target in ("full", "detector"):
+        from src.enhanced_detection import EnhancedRecyclingDetector
+        detector = EnhancedRecyclingDetector()
+    if args.target in ("full", "pricing-db"):
+        from src.recycling_price_calculator import RecyclingPriceCalculator
+        from src.database_manager import DatabaseManager
+        price_calculator = RecyclingPriceCalculator()
+        db_path = args.db_path or os.path.join(tempfile.mkdtemp(prefix="load_test_"), "load_test.db")
+        db_manager = DatabaseManager(db_path)
+        print(f"📁 測試數據庫: {db_path}")
+
+    tester = LoadTester(
+        target=args.target,
+        detector=detector,
+        price_calculator=price_calculator,
+        db_manager=db_manager,
+        images=load_fixture_images(args.fixtures, seed=args.seed),
+        seed=args.seed,
+        unique_images=not args.reuse_images
+    )
+    print(f"🖼️ 測試圖片: {len(tester.images)} 張")
+
+    if len(args.sessions) == 1:
+        print(format_result(tester.run(args.sessions[0], args.duration, args.rate)))
+        return
+
+    report = tester.find_saturation(args.sessions, args.duration, args.rate, args.slo_ms)
+    print("=" * 60)
+    print(f"最大吞吐量: {report['max_throughput']:.2f} 請求/秒")
+    print(f"可持續會話數: {report['max_sustainable_sessions']}")
+    if report['saturation']:
+        print(f"飽和點: {report['saturation']['sessions']} 個會話（{report['saturation']['reason']}）")
+    else:
+        print("在測試範圍內未達到飽和")
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,6 @@
 用於調整檢測系統的性能參數
 """
 
-import torch
-import cv2
 import os
 
 class PerformanceConfig:
@@ -20,9 +18,14 @@ class PerformanceConfig:
         self.CACHE_SIZE = 100  # 檢測結果緩存大小
         self.CLASSIFICATION_CACHE_SIZE = 1000  # 分類緩存大小
         
-        # 模型配置
-        self.USE_GPU = torch.cuda.is_available()  # 是否使用GPU
-        self.MODEL_DEVICE = 'cuda' if self.USE_GPU else 'cpu'
+        # 磁碟緩存配置（跨進程、跨重啟共享檢測結果）
+        self.ENABLE_DISK_CACHE = False  # 是否啟用磁碟緩存
+        self.DISK_CACHE_PATH = "data/detection_cache.db"  # 磁碟緩存路徑
+        self.DISK_CACHE_MAX_ENTRIES = 10000  # 磁碟緩存最大條目數
+        self.DISK_CACHE_MAX_MB = 256  # 磁碟緩存最大容量 (MB)
+        
+        # 模型配置（GPU 偵測延遲到第一次使用，避免導入時載入 torch）
+        self._use_gpu = None
         
         # 檢測配置
         self.ENABLE_VERBOSE = False  # 關閉詳細輸出
@@ -30,13 +33,97 @@ class PerformanceConfig:
         self.ENABLE_PREPROCESSING = True  # 啟用預處理
         
         # 並行處理配置
-        self.MAX_WORKERS = 2  # 最大並行工作數
+        self.MAX_WORKERS = 2  # 最大並行工作數（同時進行的推理數）
+        
+        # 推理准入配置
+        self.ADMISSION_QUEUE_SIZE = 8  # 等待隊列上限，超出時立即拒絕
+        self.ADMISSION_MAX_PER_SESSION = 2  # 每個會話最多排隊的請求數
+        self.ADMISSION_TIMEOUT = 15.0  # 最長排隊時間（秒）
+        self.ADMISSION_DEGRADE_DEPTH = 4  # 隊列達到此深度時啟用降級檢測
         
         # 內存優化
         self.CLEAR_CACHE_INTERVAL = 50  # 每50次檢測清理一次緩存
         
+        # SQLite 配置（連接池中每個連接的 pragma）
+        self.SQLITE_JOURNAL_MODE = "WAL"  # 寫入不阻塞讀取
+        self.SQLITE_PRAGMAS = {
+            'synchronous': 'NORMAL',  # WAL 模式下只在檢查點時 fsync
+            'cache_size': -16000,     # 頁緩存 (負數為 KB)
+            'mmap_size': 64 * 1024 * 1024,  # 內存映射讀取 (bytes)
+            'busy_timeout': 5000,     # 等待鎖的最長時間 (ms)
+            'temp_store': 'MEMORY'
+        }
+        self.SQLITE_POOL_SIZE = 4  # 連接池大小
+        self.SQLITE_OPTIMIZE_INTERVAL = 3600.0  # 定期 PRAGMA optimize 的間隔（秒），0 表示停用
+        self.DETECTION_RESULTS_FORMAT = "binary"  # 檢測結果存儲格式：binary（緊湊編碼）或 json
+        self.ANALYTICS_CACHE_SIZE = 128  # 時間序列分析結果的緩存條目數
+        
+        # 延後寫入配置
+        self.WRITE_BEHIND_BATCH_SIZE = 200  # 每批最多寫入的記錄數
+        self.WRITE_BEHIND_FLUSH_INTERVAL = 0.5  # 累積一批的等待時間（秒）
+        self.WRITE_BEHIND_MAX_QUEUE = 5000  # 隊列上限，滿了改為同步寫入
+        self.WRITE_BEHIND_MAX_RETRIES = 3  # 批量寫入失敗後的重試次數（之後改為逐條寫入）
+        self.WRITE_BEHIND_RETRY_BACKOFF = 0.2  # 第一次重試前的等待時間（秒），之後每次加倍
+        
+        # 數據保留配置
+        self.RETENTION_DAYS = 0  # 明細記錄保留天數，更早的匯總後刪除；0 表示永久保留
+        self.RETENTION_ARCHIVE_DIR = "data/archive"  # 刪除前將原始記錄壓縮歸檔的目錄，None 表示不歸檔
+        self.RETENTION_CHUNK_SIZE = 2000  # 每個事務處理的記錄數
+        self.RETENTION_INTERVAL = 86400.0  # 自動執行的間隔（秒）
+        self.RETENTION_VACUUM_PAGES = 2000  # 每次增量 VACUUM 釋放的頁數
+        
+        # 批量導入配置
+        self.BULK_IMPORT_BATCH_SIZE = 5000  # 每個事務寫入的記錄數
+        self.BULK_IMPORT_PRAGMAS = {  # 導入專用連接的 pragma（WAL 下 NORMAL 不會損壞數據庫）
+            'synchronous': 'NORMAL',
+            'cache_size': -200000,  # 約 200MB
+            'temp_store': 'MEMORY',
+            'busy_timeout': 30000
+        }
+        
+        # 分析鏡像配置（需要 pyarrow；啟用保留策略時，同步間隔應短於保留天數，舊記錄刪除前已進入鏡像）
+        self.ANALYTICS_MIRROR_DIR = "data/analytics"  # 按日分區的 Parquet 目錄
+        self.ANALYTICS_MIRROR_CHUNK_SIZE = 50000  # 每批同步的記錄數
+        self.ANALYTICS_MIRROR_INTERVAL = 0.0  # 自動同步的間隔（秒），0 表示不自動同步
+        
+        # 圖片存儲配置
+        self.ENABLE_IMAGE_STORE = False  # 按內容摘要保存檢測圖片（預設關閉；無記錄引用的圖片由數據保留策略清理）
+        self.IMAGE_STORE_DIR = "data/images"  # 圖片存儲目錄
+        self.IMAGE_THUMBNAIL_SIZE = 256  # 縮略圖最長邊（像素）
+        self.IMAGE_ORPHAN_GRACE = 86400.0  # 保留策略清理無記錄引用的圖片前等待的時間（秒）
+        
+        # 數據匯出配置
+        self.EXPORT_DIR = "data/exports"  # 應用內匯出文件的保存目錄
+        self.EXPORT_DOWNLOAD_MAX_MB = 50  # 不超過此大小的匯出文件才在頁面提供下載（需讀入內存）
+        
+        # 價格表配置
+        self.PRICE_FILE_PATH = "recycling_prices.json"  # 價格文件路徑
+        self.PRICE_RELOAD_INTERVAL = 5.0  # 檢查價格文件變更的間隔（秒），0 表示不自動重載
+        self.ENABLE_PRICE_HISTORY = True  # 記錄價格變更歷史（用於按檢測時間計價）
+        self.PRICE_HISTORY_PATH = "data/recycling_app.db"  # 價格歷史數據庫路徑
+        self.PRICE_SOURCES = []  # 價格來源網頁，例如 [{'name': '回收站', 'url': 'https://...', 'timeout': 10}]
+        self.PRICE_FETCH_WORKERS = 4  # 並發抓取的價格來源數
+        self.PRICE_SOURCE_TIMEOUT = 10.0  # 每個價格來源的預設超時（秒）
+        self.PRICE_SOURCE_FAILURE_THRESHOLD = 3  # 連續失敗多少次後熔斷
+        self.PRICE_SOURCE_RESET_TIMEOUT = 300.0  # 熔斷後多久允許再次嘗試（秒）
+        
+    @property
+    def USE_GPU(self):
+        """是否使用GPU（第一次訪問時才導入 torch）"""
+        if self._use_gpu is None:
+            import torch
+            self._use_gpu = torch.cuda.is_available()
+        return self._use_gpu
+    
+    @property
+    def MODEL_DEVICE(self):
+        """模型運行設備"""
+        return 'cuda' if self.USE_GPU else 'cpu'
+        
     def optimize_torch_settings(self):
         """優化 PyTorch 設置"""
+        import torch
+        
         if self.USE_GPU:
             # GPU 優化
             torch.backends.cudnn.benchmark = True
@@ -67,18 +154,140 @@ class PerformanceConfig:
             'detection_cache_size': self.CACHE_SIZE,
             'classification_cache_size': self.CLASSIFICATION_CACHE_SIZE,
             'enable': self.ENABLE_CACHE,
-            'clear_interval': self.CLEAR_CACHE_INTERVAL
+            'clear_interval': self.CLEAR_CACHE_INTERVAL,
+            'disk_enable': self.ENABLE_DISK_CACHE,
+            'disk_path': self.DISK_CACHE_PATH,
+            'disk_max_entries': self.DISK_CACHE_MAX_ENTRIES,
+            'disk_max_bytes': self.DISK_CACHE_MAX_MB * 1024 * 1024
+        }
+
+    def get_admission_config(self):
+        """獲取推理准入配置"""
+        return {
+            'max_concurrent': self.MAX_WORKERS,
+            'max_queue': self.ADMISSION_QUEUE_SIZE,
+            'max_per_session': self.ADMISSION_MAX_PER_SESSION,
+            'queue_timeout': self.ADMISSION_TIMEOUT,
+            'degrade_queue_depth': self.ADMISSION_DEGRADE_DEPTH
+        }
+
+    def get_database_config(self):
+        """獲取 SQLite 連接配置"""
+        return {
+            'journal_mode': self.SQLITE_JOURNAL_MODE,
+            'pragmas': dict(self.SQLITE_PRAGMAS),
+            'pool_size': self.SQLITE_POOL_SIZE,
+            'optimize_interval': self.SQLITE_OPTIMIZE_INTERVAL,
+            'detection_format': self.DETECTION_RESULTS_FORMAT,
+            'analytics_cache_size': self.ANALYTICS_CACHE_SIZE
+        }
+
+    def get_write_behind_config(self):
+        """獲取延後寫入配置"""
+        return {
+            'batch_size': self.WRITE_BEHIND_BATCH_SIZE,
+            'flush_interval': self.WRITE_BEHIND_FLUSH_INTERVAL,
+            'max_queue': self.WRITE_BEHIND_MAX_QUEUE,
+            'max_retries': self.WRITE_BEHIND_MAX_RETRIES,
+            'retry_backoff': self.WRITE_BEHIND_RETRY_BACKOFF
+        }
+
+    def get_retention_config(self):
+        """獲取數據保留配置"""
+        return {
+            'days': self.RETENTION_DAYS,
+            'archive_dir': self.RETENTION_ARCHIVE_DIR,
+            'chunk_size': self.RETENTION_CHUNK_SIZE,
+            'interval': self.RETENTION_INTERVAL,
+            'vacuum_pages': self.RETENTION_VACUUM_PAGES
+        }
+
+    def get_bulk_import_config(self):
+        """獲取批量導入配置"""
+        return {
+            'batch_size': self.BULK_IMPORT_BATCH_SIZE,
+            'pragmas': dict(self.BULK_IMPORT_PRAGMAS)
+        }
+
+    def get_analytics_mirror_config(self):
+        """獲取分析鏡像配置"""
+        return {
+            'root': self.ANALYTICS_MIRROR_DIR,
+            'chunk_size': self.ANALYTICS_MIRROR_CHUNK_SIZE,
+            'interval': self.ANALYTICS_MIRROR_INTERVAL
+        }
+
+    def get_image_store_config(self):
+        """獲取圖片存儲配置"""
+        return {
+            'root': self.IMAGE_STORE_DIR,
+            'thumbnail_size': self.IMAGE_THUMBNAIL_SIZE,
+            'orphan_grace': self.IMAGE_ORPHAN_GRACE
+        }
+
+    def get_export_config(self):
+        """獲取數據匯出配置"""
+        return {
+            'directory': self.EXPORT_DIR,
+            'download_max_bytes': int(self.EXPORT_DOWNLOAD_MAX_MB * 1024 * 1024)
+        }
+
+    def get_price_config(self):
+        """獲取價格表配置"""
+        return {
+            'path': self.PRICE_FILE_PATH,
+            'reload_interval': self.PRICE_RELOAD_INTERVAL,
+            'history_enable': self.ENABLE_PRICE_HISTORY,
+            'history_path': self.PRICE_HISTORY_PATH,
+            'sources': self.PRICE_SOURCES,
+            'fetch_workers': self.PRICE_FETCH_WORKERS,
+            'source_timeout': self.PRICE_SOURCE_TIMEOUT,
+            'failure_threshold': self.PRICE_SOURCE_FAILURE_THRESHOLD,
+            'reset_timeout': self.PRICE_SOURCE_RESET_TIMEOUT
         }
 
 # 全局性能配置實例
 performance_config = PerformanceConfig()
 
+# 系統優化只需在每個進程中執行一次
+_system_optimized = False
+
 def get_performance_config():
     """獲取性能配置"""
     return performance_config
 
+def preprocess_image(image_array):
+    """預處理圖片以提高檢測速度"""
+    # 獲取預處理配置
+    preprocessing_config = performance_config.get_preprocessing_config()
+    
+    if not preprocessing_config['enable']:
+        return image_array
+    
+    # 調整圖片大小以加快處理速度
+    height, width = image_array.shape[:2]
+    max_size = preprocessing_config['max_size']
+    
+    # 如果圖片太大，縮小到合適的尺寸
+    if max(height, width) > max_size:
+        import cv2
+        
+        scale = max_size / max(height, width)
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        image_array = cv2.resize(image_array, (new_width, new_height))
+    
+    return image_array
+
 def optimize_system():
-    """優化系統設置"""
+    """優化系統設置（每個進程只執行一次，於第一次載入模型時調用）"""
+    global _system_optimized
+    if _system_optimized:
+        return
+    _system_optimized = True
+    
+    import cv2
+    
     # 優化 PyTorch 設置
     performance_config.optimize_torch_settings()
     
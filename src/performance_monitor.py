@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能監控 - 在背景批量寫入請求耗時，並提供性能儀表板
+"""
+
+from datetime import datetime, timedelta
+
+import streamlit as st
+
+from src.batch_writer import BatchWriter
+from src.feedback_system import _load_plotly
+
+
+class PerformanceRecorder(BatchWriter):
+    """收集每個請求的性能指標，由背景線程批量寫入數據庫"""
+
+    thread_name = "performance-recorder"
+
+    def __init__(self, db_manager, flush_interval: float = 5.0, batch_size: int = 200,
+                 max_queue: int = 10000):
+        super().__init__(batch_size=batch_size, flush_interval=flush_interval, max_queue=max_queue)
+        self.db_manager = db_manager
+
+    @property
+    def dropped(self) -> int:
+        """隊列已滿時丟棄的指標數"""
+        return self._stats['dropped']
+
+    def record(self, **metrics):
+        """記錄一次請求的指標（不阻塞；隊列已滿時丟棄）"""
+        metrics.setdefault('timestamp', datetime.now().isoformat())
+        if not self._enqueue(metrics):
+            self._count('dropped')
+
+    def _write_batch(self, items):
+        self.db_manager.save_performance_metrics(items)
+
+
+class PerformanceDashboard:
+    """性能儀表板：按檢測模式顯示延遲分布和變化趨勢"""
+
+    TIME_RANGES = {
+        "最近1小時": timedelta(hours=1),
+        "最近24小時": timedelta(days=1),
+        "最近7天": timedelta(days=7),
+        "最近30天": timedelta(days=30)
+    }
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def show_performance_dashboard(self):
+        """顯示性能儀表板"""
+        import pandas as pd
+
+        st.subheader("📈 性能監控")
+
+        time_range = st.selectbox("時間範圍", list(self.TIME_RANGES.keys()), index=1)
+        since = (datetime.now() - self.TIME_RANGES[time_range]).isoformat()
+        metrics = self.db_manager.get_performance_metrics(since=since)
+
+        if not metrics:
+            st.warning("暫無性能數據")
+            return
+
+        df = pd.DataFrame(metrics)
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+
+        # 總覽
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("請求數", len(df))
+        with col2:
+            st.metric("p50 延遲", f"{df['total_ms'].quantile(0.5):.0f} ms")
+        with col3:
+            st.metric("p95 延遲", f"{df['total_ms'].quantile(0.95):.0f} ms")
+        with col4:
+            hit_rate = df['cache_hit'].dropna().mean() if df['cache_hit'].notna().any() else 0
+            st.metric("緩存命中率", f"{hit_rate:.1%}")
+
+        # 各模式的延遲趨勢（按時間分桶的 p50 / p95）
+        span = df['timestamp'].max() - df['timestamp'].min()
+        freq = 'min' if span <= pd.Timedelta(hours=2) else ('h' if span <= pd.Timedelta(days=3) else 'D')
+        grouped = df.groupby([pd.Grouper(key='timestamp', freq=freq), 'detection_mode'])['total_ms']
+        trend = grouped.quantile(0.5).rename('p50').to_frame()
+        trend['p95'] = grouped.quantile(0.95)
+        trend = trend.dropna().reset_index()
+
+        # 模型版本變更時間點（用於對照部署或模型更新）
+        model_changes = (df.dropna(subset=['model_version'])
+                         .groupby('model_version')['timestamp'].min()
+                         .sort_values())
+
+        px = _load_plotly()
+        st.subheader("⏱️ 延遲趨勢")
+        if px is not None:
+            long_trend = trend.melt(id_vars=['timestamp', 'detection_mode'],
+                                    value_vars=['p50', 'p95'], var_name='百分位', value_name='延遲 (ms)')
+            fig = px.line(long_trend, x='timestamp', y='延遲 (ms)', color='detection_mode',
+                          line_dash='百分位', title="各檢測模式延遲 (p50 / p95)")
+            for version, changed_at in list(model_changes.items())[1:]:
+                fig.add_vline(x=changed_at, line_dash='dot', line_color='gray')
+                fig.add_annotation(x=changed_at, y=1, yref='paper', text=f"模型 {version[:8]}",
+                                   showarrow=False)
+            st.plotly_chart(fig, use_container_width=True)
+
+            st.subheader("📊 延遲分布")
+            fig = px.box(df, x='detection_mode', y='total_ms', points=False,
+                         labels={'detection_mode': '檢測模式', 'total_ms': '總延遲 (ms)'})
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.dataframe(trend)
+
+        # 各階段平均耗時
+        st.subheader("🧩 各階段平均耗時 (ms)")
+        stages = ['queue_ms', 'preprocess_ms', 'detect_ms', 'pricing_ms', 'total_ms']
+        st.dataframe(df.groupby('detection_mode')[stages].mean().round(1))
+
+        if len(model_changes) > 1:
+            st.subheader("🔄 模型版本變更")
+            st.dataframe(model_changes.rename('首次出現').to_frame())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+價格歷史 - 每個類別按生效時間記錄價格，支持按時間點（as-of）查詢當時的價格
+"""
+
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.db_connection import get_connection_manager
+
+# 查詢鍵 = 類別索引 << 52 | 微秒時間戳（2^52 微秒約 142 年，足以覆蓋 1970-2112）
+_TIME_BITS = 52
+_TIME_MASK = (1 << _TIME_BITS) - 1
+
+
+def to_microseconds(timestamps) -> np.ndarray:
+    """將 ISO 字符串 / datetime / datetime64 轉為自 1970 年起的微秒數"""
+    if isinstance(timestamps, (str, datetime, np.datetime64)):
+        timestamps = [timestamps]
+    values = np.asarray(timestamps)
+    if values.dtype.kind != 'M':
+        values = values.astype('datetime64[us]')
+    return values.astype('datetime64[us]').astype(np.int64)
+
+
+class _HistoryIndex:
+    """價格歷史的不可變排序索引"""
+
+    __slots__ = ('categories', 'keys', 'prices', 'sources')
+
+    def __init__(self, rows: List[Tuple[str, str, float, Optional[str]]]):
+        self.categories: Dict[str, int] = {}
+        for category, _, _, _ in rows:
+            self.categories.setdefault(category, len(self.categories))
+
+        if rows:
+            codes = np.array([self.categories[row[0]] for row in rows], dtype=np.int64)
+            times = to_microseconds([row[1] for row in rows])
+            keys = (codes << _TIME_BITS) | (times & _TIME_MASK)
+            order = np.argsort(keys, kind='stable')
+            self.keys = keys[order]
+            self.prices = np.array([row[2] for row in rows], dtype=float)[order]
+            self.sources = [rows[i][3] for i in order]
+        else:
+            self.keys = np.empty(0, dtype=np.int64)
+            self.prices = np.empty(0, dtype=float)
+            self.sources = []
+
+
+class PriceHistory:
+    """價格歷史存儲：SQLite 持久化，內存中保存排序陣列，以二分搜索查詢"""
+
+    def __init__(self, db_path: str = "data/recycling_app.db"):
+        self.db_path = db_path
+        self.connections = get_connection_manager(db_path)
+        self._write_lock = threading.Lock()
+        self._init_table()
+        self._index = _HistoryIndex(self._load_rows())
+
+    def _init_table(self):
+        with self.connections.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS price_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    category TEXT NOT NULL,
+                    effective_at TEXT NOT NULL,
+                    price_per_kg REAL NOT NULL,
+                    source TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (category, effective_at)
+                )
+            ''')
+            conn.commit()
+
+    def _load_rows(self):
+        with self.connections.connection() as conn:
+            return conn.execute('''
+                SELECT category, effective_at, price_per_kg, source
+                FROM price_history
+                ORDER BY category, effective_at
+            ''').fetchall()
+
+    def reload(self):
+        """從數據庫重新載入（其他進程寫入的價格）"""
+        with self._write_lock:
+            self._index = _HistoryIndex(self._load_rows())
+
+    def latest_prices(self) -> Dict[str, float]:
+        """每個類別最新的價格"""
+        index = self._index
+        if not len(index.keys):
+            return {}
+        codes = index.keys >> _TIME_BITS
+        last = np.flatnonzero(np.append(codes[1:] != codes[:-1], True))
+        names = {code: category for category, code in index.categories.items()}
+        return {names[int(codes[i])]: float(index.prices[i]) for i in last}
+
+    def record_prices(self, prices: Dict[str, float], effective_at=None,
+                      source: Optional[str] = None, only_changes: bool = True) -> int:
+        """記錄一組價格（預設只記錄與最新價格不同的類別），返回寫入的條數"""
+        effective_at = effective_at or datetime.now()
+        if not isinstance(effective_at, str):
+            effective_at = effective_at.isoformat()
+
+        with self._write_lock:
+            if only_changes:
+                latest = self.latest_prices()
+                prices = {category: price for category, price in prices.items()
+                          if latest.get(category) != float(price)}
+            if not prices:
+                return 0
+
+            with self.connections.transaction() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO price_history (category, effective_at, price_per_kg, source)
+                    VALUES (?, ?, ?, ?)
+                ''', [(category, effective_at, float(price), source) for category, price in prices.items()])
+                conn.commit()
+
+            # 重建索引後原子替換，查詢方不需要加鎖
+            self._index = _HistoryIndex(self._load_rows())
+            return len(prices)
+
+    def _lookup(self, categories: Iterable[str], timestamps) -> Tuple[np.ndarray, np.ndarray]:
+        index = self._index
+        categories = list(categories)
+        times = to_microseconds(timestamps)
+        if times.size == 1 and len(categories) != 1:
+            times = np.full(len(categories), times[0], dtype=np.int64)
+
+        # 每個不同的類別名稱只查一次字典
+        unique: Dict[str, int] = {}
+        codes = np.array([unique.setdefault(category, len(unique)) for category in categories], dtype=np.int64)
+        unique_codes = np.array([index.categories.get(category, -1) for category in unique], dtype=np.int64)
+        codes = unique_codes[codes] if len(categories) else codes
+
+        keys = (np.maximum(codes, 0) << _TIME_BITS) | (times & _TIME_MASK)
+        positions = np.searchsorted(index.keys, keys, side='right') - 1
+        valid = (codes >= 0) & (positions >= 0)
+        safe_positions = np.where(valid, positions, 0)
+        if len(index.keys):
+            valid &= (index.keys[safe_positions] >> _TIME_BITS) == codes
+        return valid, safe_positions
+
+    def prices_as_of(self, categories: Iterable[str], timestamps) -> np.ndarray:
+        """批量查詢各類別在對應時間點生效的價格（一次向量化二分搜索）
+
+        timestamps 可為單個時間點或與 categories 等長的序列；沒有記錄的返回 NaN。
+        """
+        valid, positions = self._lookup(categories, timestamps)
+        if not len(self._index.prices):
+            return np.full(len(valid), np.nan)
+        return np.where(valid, self._index.prices[positions], np.nan)
+
+    def price_as_of(self, category: str, timestamp) -> Optional[float]:
+        """查詢某類別在某時間點生效的價格"""
+        price = self.prices_as_of([category], timestamp)[0]
+        return None if np.isnan(price) else float(price)
+
+    def get_history(self, category: str) -> List[Dict]:
+        """某類別的價格變更記錄（按時間升序）"""
+        with self.connections.connection() as conn:
+            rows = conn.execute('''
+                SELECT effective_at, price_per_kg, source
+                FROM price_history
+                WHERE category = ?
+                ORDER BY effective_at
+            ''', (category,)).fetchall()
+        return [{'effective_at': row[0], 'price_per_kg': row[1], 'source': row[2]} for row in rows]
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+價格來源 - 並發抓取多個價格網頁（連接池 + 條件請求 + 熔斷），增量解析後更新價格表
+"""
+
+import codecs
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_NUMBER_PATTERN = re.compile(r'\d+(?:,\d{3})*(?:\.\d+)?')
+_CHARSET_PATTERN = re.compile(r'charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+def _parse_number(text: str) -> Optional[float]:
+    match = _NUMBER_PATTERN.search(text or '')
+    return float(match.group(0).replace(',', '')) if match else None
+
+
+class PriceHTMLParser(HTMLParser):
+    """增量解析價格頁面（可分塊 feed）
+
+    支持兩種標記：
+    - 帶 data-item 的價格元素：<div class="price" data-item="鋁罐">26.5</div>（或 data-price 屬性）
+    - 表格行：<tr><td>鋁罐</td><td>26.5 元/公斤</td></tr>
+    """
+
+    def __init__(self, known_items: Optional[Iterable[str]] = None):
+        super().__init__(convert_charrefs=True)
+        self.known_items = set(known_items) if known_items is not None else None
+        self.prices: Dict[str, float] = {}
+        self._capture = None  # [類別, 標籤, 嵌套深度, 文字片段]
+        self._row: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+
+    def _record(self, item: str, text: str):
+        item = item.strip()
+        if not item or (self.known_items is not None and item not in self.known_items):
+            return
+        price = _parse_number(text)
+        if price is not None:
+            self.prices[item] = price
+
+    def handle_starttag(self, tag, attrs):
+        if self._capture is not None:
+            if tag == self._capture[1]:
+                self._capture[2] += 1
+        else:
+            attributes = dict(attrs)
+            item = attributes.get('data-item')
+            if item is not None:
+                if attributes.get('data-price') is not None:
+                    self._record(item, attributes['data-price'])
+                elif 'price' in (attributes.get('class') or '').split():
+                    self._capture = [item, tag, 0, []]
+
+        if tag == 'tr':
+            self._row = []
+        elif tag in ('td', 'th') and self._row is not None:
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if self._capture is not None and tag == self._capture[1]:
+            if self._capture[2] == 0:
+                self._record(self._capture[0], ''.join(self._capture[3]))
+                self._capture = None
+            else:
+                self._capture[2] -= 1
+
+        if tag in ('td', 'th') and self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            row, self._row = self._row, None
+            if len(row) >= 2:
+                for cell in row[1:]:
+                    if _parse_number(cell) is not None:
+                        self._record(row[0], cell)
+                        break
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._capture[3].append(data)
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+class PriceSource:
+    """價格來源配置"""
+
+    def __init__(self, name: str, url: str, timeout: float = 10.0, encoding: Optional[str] = None):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self.encoding = encoding
+
+
+class CircuitBreaker:
+    """連續失敗達到閾值後熔斷一段時間，之後允許一次試探請求"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """是否允許發出請求"""
+        with self._lock:
+            if self.state != 'half-open':
+                return self.state == 'closed'
+            # 半開狀態只放行一次試探請求
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class _SourceState:
+    """價格來源的抓取狀態（條件請求標頭、熔斷器、最近結果）"""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.last_status: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.last_fetch: Optional[str] = None
+        self.last_elapsed = 0.0
+        self.price_count = 0
+
+
+class PriceSourceFetcher:
+    """並發抓取價格來源，使用共享連接池，未變更的頁面以 304 跳過"""
+
+    USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, sources: Iterable[PriceSource] = (), price_table=None,
+                 known_items: Optional[Iterable[str]] = None, max_workers: int = 4,
+                 failure_threshold: int = 3, reset_timeout: float = 300.0):
+        # 爬蟲依賴只在實際抓取價格時載入
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.price_table = price_table
+        self.known_items = set(known_items) if known_items is not None else None
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = self.USER_AGENT
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='price-source')
+
+        self._lock = threading.Lock()
+        self._sources: "OrderedDict[str, PriceSource]" = OrderedDict()
+        self._states: Dict[str, _SourceState] = {}
+        for source in sources:
+            self.add_source(source)
+
+    @classmethod
+    def from_config(cls, price_table=None, known_items=None):
+        """按性能配置建立抓取器"""
+        from src.performance_config import get_performance_config
+
+        price_config = get_performance_config().get_price_config()
+        sources = [
+            PriceSource(entry['name'], entry['url'],
+                        timeout=entry.get('timeout', price_config['source_timeout']),
+                        encoding=entry.get('encoding'))
+            for entry in price_config['sources']
+        ]
+        return cls(sources, price_table=price_table, known_items=known_items,
+                   max_workers=price_config['fetch_workers'],
+                   failure_threshold=price_config['failure_threshold'],
+                   reset_timeout=price_config['reset_timeout'])
+
+    def add_source(self, source: PriceSource):
+        """添加（或替換）價格來源"""
+        with self._lock:
+            self._sources[source.name] = source
+            if source.name not in self._states:
+                self._states[source.name] = _SourceState(
+                    CircuitBreaker(self.failure_threshold, self.reset_timeout))
+
+    def _decode_charset(self, source: PriceSource, content_type: str) -> str:
+        if source.encoding:
+            return source.encoding
+        match = _CHARSET_PATTERN.search(content_type or '')
+        return match.group(1) if match else 'utf-8'
+
+    def fetch_source(self, name: str) -> Dict:
+        """抓取單個價格來源，返回 {source, status, prices, elapsed, error}
+
+        status: 'updated' / 'not_modified' / 'failed' / 'skipped'（熔斷中）
+        """
+        source = self._sources[name]
+        state = self._states[name]
+        result = {'source': name, 'status': None, 'prices': {}, 'elapsed': 0.0, 'error': None}
+
+        if not state.breaker.allow():
+            result['status'] = 'skipped'
+            result['error'] = '熔斷中'
+            state.last_status = 'skipped'
+            return result
+
+        headers = {}
+        if state.etag:
+            headers['If-None-Match'] = state.etag
+        if state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+
+        start_time = time.monotonic()
+        deadline = start_time + source.timeout
+        try:
+            with self.session.get(source.url, headers=headers, timeout=source.timeout,
+                                  stream=True) as response:
+                if response.status_code == 304:
+                    result['status'] = 'not_modified'
+                else:
+                    response.raise_for_status()
+
+                    # 邊下載邊解析，整體耗時超過來源的超時時間即放棄
+                    parser = PriceHTMLParser(self.known_items)
+                    decoder = codecs.getincrementaldecoder(
+                        self._decode_charset(source, response.headers.get('Content-Type')))(errors='replace')
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"超過 {source.timeout} 秒")
+                        parser.feed(decoder.decode(chunk))
+                    parser.feed(decoder.decode(b'', final=True))
+                    parser.close()
+
+                    if not parser.prices:
+                        raise ValueError("頁面中未解析到價格")
+
+                    result['status'] = 'updated'
+                    result['prices'] = parser.prices
+                    state.etag = response.headers.get('ETag')
+                    state.last_modified = response.headers.get('Last-Modified')
+                    state.price_count = len(parser.prices)
+            state.breaker.record_success()
+            state.last_error = None
+        except Exception as e:
+            state.breaker.record_failure()
+            result['status'] = 'failed'
+            result['error'] = str(e)
+            state.last_error = str(e)
+            logger.warning("價格來源 %s 抓取失敗: %s", name, e)
+
+        result['elapsed'] = time.monotonic() - start_time
+        state.last_status = result['status']
+        state.last_elapsed = result['elapsed']
+        state.last_fetch = datetime.now().isoformat()
+        return result
+
+    def fetch_all(self, names: Optional[Iterable[str]] = None) -> List[Dict]:
+        """並發抓取價格來源（預設全部），並把新價格按來源順序套用到價格表"""
+        names = list(self._sources) if names is None else list(names)
+        results = list(self._executor.map(self.fetch_source, names))
+
+        if self.price_table is not None:
+            today = datetime.now().strftime('%Y-%m-%d')
+            for result in results:
+                if result['status'] == 'updated':
+                    self.price_table.apply_source_prices(result['source'], {
+                        item: {"price_per_kg": price, "source": result['source'], "last_updated": today}
+                        for item, price in result['prices'].items()
+                    })
+        return results
+
+    def get_status(self) -> Dict[str, Dict]:
+        """各價格來源的狀態"""
+        return {
+            name: {
+                'url': self._sources[name].url,
+                'circuit': state.breaker.state,
+                'failures': state.breaker.failures,
+                'last_status': state.last_status,
+                'last_error': state.last_error,
+                'last_fetch': state.last_fetch,
+                'last_elapsed': state.last_elapsed,
+                'price_count': state.price_count,
+                'etag': state.etag
+            }
+            for name, state in self._states.items()
+        }
+
+    def close(self):
+        """關閉線程池和連接池"""
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+def main():
+    """抓取已配置的價格來源（或命令行指定的網址），顯示各來源的抓取結果"""
+    import argparse
+    from src.price_table import PriceTableManager
+    from src.recycling_price_calculator import DEFAULT_PRICE_DATA
+
+    parser = argparse.ArgumentParser(description="價格來源抓取")
+    parser.add_argument('urls', nargs='*', help="價格網頁網址（未提供時使用 PRICE_SOURCES 配置）")
+    parser.add_argument('--rounds', type=int, default=1, help="抓取輪數（第二輪起可觀察條件請求和熔斷）")
+    args = parser.parse_args()
+
+    table = PriceTableManager(DEFAULT_PRICE_DATA, path='', poll_interval=0)
+    if args.urls:
+        fetcher = PriceSourceFetcher([PriceSource(url, url) for url in args.urls],
+                                     price_table=table, known_items=DEFAULT_PRICE_DATA)
+    else:
+        fetcher = PriceSourceFetcher.from_config(price_table=table, known_items=DEFAULT_PRICE_DATA)
+    if not fetcher.get_status():
+        print("⚠️ 未配置價格來源（PRICE_SOURCES 為空），請在命令行提供網址")
+        fetcher.close()
+        return
+
+    try:
+        for round_number in range(1, args.rounds + 1):
+            print(f"第 {round_number} 輪:")
+            for result in fetcher.fetch_all():
+                print(f"  {result['source']:<6} {result['status']:<13} "
+                      f"{result['elapsed'] * 1000:7.1f} ms  {result['error'] or result['prices']}")
+        print(f"價格表版本: {table.version}")
+    finally:
+        fetcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+價格表管理 - 在背景監視價格文件，驗證後以不可變快照原子替換
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PriceSnapshot:
+    """不可變的價格表快照"""
+
+    __slots__ = ('version', 'prices', 'loaded_at', 'source')
+
+    def __init__(self, version: int, prices: Dict[str, Dict], source: str = "預設"):
+        self.version = version
+        self.prices: Mapping[str, Mapping] = MappingProxyType(
+            {item: MappingProxyType(dict(data)) for item, data in prices.items()}
+        )
+        self.loaded_at = time.time()
+        self.source = source
+
+    def __contains__(self, item):
+        return item in self.prices
+
+    def __getitem__(self, item):
+        return self.prices[item]
+
+
+def validate_price_file(data) -> Dict[str, Dict]:
+    """驗證價格文件內容，返回有效的 {類別: {price_per_kg, source, last_updated}}
+
+    整個文件格式錯誤時拋出 ValueError；個別無效條目會被跳過。
+    """
+    if not isinstance(data, dict):
+        raise ValueError("價格文件必須是 JSON 物件")
+
+    valid = {}
+    for item, entry in data.items():
+        try:
+            price = float(entry["price_per_kg"])
+        except (TypeError, KeyError, ValueError):
+            logger.warning("忽略無效的價格條目: %s", item)
+            continue
+        if price < 0 or price != price:
+            logger.warning("忽略無效的價格: %s = %s", item, entry["price_per_kg"])
+            continue
+        valid[item] = {
+            "price_per_kg": price,
+            "source": entry.get("source", "本地配置"),
+            "last_updated": entry.get("date", "未知")
+        }
+    return valid
+
+
+class PriceTableManager:
+    """管理價格表快照：讀取方無鎖獲取當前快照，更新方建立新快照後原子替換"""
+
+    def __init__(self, defaults: Dict[str, Dict], path: str = "recycling_prices.json",
+                 poll_interval: float = 5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._defaults = {item: dict(data) for item, data in defaults.items()}
+        self._snapshot = PriceSnapshot(0, self._defaults)
+        self._update_lock = threading.Lock()
+        self._file_state = None
+        # 價格層：預設值 < 價格文件 < 各價格來源（按註冊順序，後者優先）
+        self._file_prices: Dict[str, Dict] = {}
+        self._source_prices: Dict[str, Dict[str, Dict]] = {}
+        self._listeners: List[Callable[[PriceSnapshot], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def snapshot(self) -> PriceSnapshot:
+        """當前價格快照"""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def add_listener(self, callback: Callable[[PriceSnapshot], None]):
+        """註冊快照更新回調（在更新線程中調用）"""
+        self._listeners.append(callback)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """文件有變更（或 force=True）時重新載入，返回是否建立了新快照
+
+        文件缺失或內容無效時保留當前快照並拋出異常。
+        """
+        with self._update_lock:
+            state = self._stat()
+            if state is None:
+                raise FileNotFoundError(self.path)
+            if not force and state == self._file_state:
+                return False
+            # 無效文件也記錄狀態，避免在文件再次修改前重複報錯
+            self._file_state = state
+
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._file_prices = validate_price_file(json.load(f))
+
+            self._publish(self.path)
+            return True
+
+    def apply_source_prices(self, source: str, prices: Dict[str, Dict]) -> bool:
+        """套用價格來源的最新價格（覆蓋該來源之前的價格），返回是否建立了新快照"""
+        with self._update_lock:
+            if self._source_prices.get(source) == prices:
+                return False
+            self._source_prices[source] = {item: dict(data) for item, data in prices.items()}
+            self._publish(source)
+            return True
+
+    def _publish(self, source: str):
+        """合併各價格層並替換快照（調用方需持有更新鎖）"""
+        # 只更新已知類別的價格，其餘沿用預設值
+        prices = {item: dict(data) for item, data in self._defaults.items()}
+        for layer in [self._file_prices, *self._source_prices.values()]:
+            for item, data in layer.items():
+                if item in prices:
+                    prices[item].update(data)
+
+        self._snapshot = PriceSnapshot(self._snapshot.version + 1, prices, source=source)
+        logger.info("✅ 價格表已更新至版本 %d（%s）", self._snapshot.version, source)
+        for callback in self._listeners:
+            try:
+                callback(self._snapshot)
+            except Exception as e:
+                logger.warning("價格表更新回調失敗: %s", e)
+
+    def start(self):
+        """啟動背景文件監視線程"""
+        if self.poll_interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._watch, name="price-table-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止背景文件監視線程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            if self._stat() is None:
+                continue
+            try:
+                self.reload()
+            except Exception as e:
+                logger.warning("價格文件重新載入失敗，繼續使用版本 %d: %s", self.version, e)
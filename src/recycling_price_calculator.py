@@ -1,32 +1,56 @@
-import requests
-from bs4 import BeautifulSoup
-import json
-import time
-import re
-from datetime import datetime
+import logging
+import os
+import threading
+
+import numpy as np
+
+from src.category_registry import CLASS_MAPPING, get_category_registry
+from src.performance_config import get_performance_config
+from src.price_history import PriceHistory
+from src.price_table import PriceTableManager
+
+logger = logging.getLogger(__name__)
+
+# 預設回收物價格資料庫 (可以從網站爬取或手動更新)
+DEFAULT_PRICE_DATA = {
+    "塑膠瓶": {"price_per_kg": 8.5, "unit": "公斤"},
+    "鋁罐": {"price_per_kg": 26.0, "unit": "公斤"},
+    "鐵罐": {"price_per_kg": 3.8, "unit": "公斤"},
+    "紙類": {"price_per_kg": 2.8, "unit": "公斤"},
+    "玻璃瓶": {"price_per_kg": 1.2, "unit": "公斤"},
+    "寶特瓶": {"price_per_kg": 8.5, "unit": "公斤"},
+    "塑膠袋": {"price_per_kg": 5.5, "unit": "公斤"},
+    "紙箱": {"price_per_kg": 2.8, "unit": "公斤"},
+    "金屬": {"price_per_kg": 16.0, "unit": "公斤"},
+    "電子廢棄物": {"price_per_kg": 55.0, "unit": "公斤"},
+    "HDPEM": {"price_per_kg": 12.0, "unit": "公斤"},  # 高密度聚乙烯
+    "PET": {"price_per_kg": 8.5, "unit": "公斤"},      # 聚對苯二甲酸乙二醇酯
+    "PP": {"price_per_kg": 7.0, "unit": "公斤"},       # 聚丙烯
+    "PS": {"price_per_kg": 6.0, "unit": "公斤"},       # 聚苯乙烯
+    "PVC": {"price_per_kg": 5.0, "unit": "公斤"}       # 聚氯乙烯
+}
 
 class RecyclingPriceCalculator:
+    # 實心物品（金屬類、電子廢棄物等）
+    SOLID_OBJECTS = frozenset({"金屬", "鐵罐", "鋁罐", "電子廢棄物", "金屬罐"})
+    
+    # 空心物品（塑膠、玻璃、紙類等）
+    HOLLOW_OBJECTS = frozenset({"塑膠瓶", "玻璃瓶", "紙類", "寶特瓶", "塑膠袋", "紙箱",
+                                "HDPEM", "PET", "PP", "PS", "PVC"})
+    
+    # 重量係數倍數和最小重量 (kg)：實心 / 空心 / 未知
+    SOLID_MULTIPLIER, SOLID_MIN_WEIGHT = 8, 0.02
+    HOLLOW_MULTIPLIER, HOLLOW_MIN_WEIGHT = 1.5, 0.005
+    DEFAULT_MULTIPLIER, DEFAULT_MIN_WEIGHT = 2, 0.005
+    DEFAULT_WEIGHT_FACTOR = 0.02
+    
     def __init__(self):
         # 初始化價格計算器
         
-        # 回收物價格資料庫 (可以從網站爬取或手動更新)
-        self.price_data = {
-            "塑膠瓶": {"price_per_kg": 8.5, "unit": "公斤"},
-            "鋁罐": {"price_per_kg": 26.0, "unit": "公斤"},
-            "鐵罐": {"price_per_kg": 3.8, "unit": "公斤"},
-            "紙類": {"price_per_kg": 2.8, "unit": "公斤"},
-            "玻璃瓶": {"price_per_kg": 1.2, "unit": "公斤"},
-            "寶特瓶": {"price_per_kg": 8.5, "unit": "公斤"},
-            "塑膠袋": {"price_per_kg": 5.5, "unit": "公斤"},
-            "紙箱": {"price_per_kg": 2.8, "unit": "公斤"},
-            "金屬": {"price_per_kg": 16.0, "unit": "公斤"},
-            "電子廢棄物": {"price_per_kg": 55.0, "unit": "公斤"},
-            "HDPEM": {"price_per_kg": 12.0, "unit": "公斤"},  # 高密度聚乙烯
-            "PET": {"price_per_kg": 8.5, "unit": "公斤"},      # 聚對苯二甲酸乙二醇酯
-            "PP": {"price_per_kg": 7.0, "unit": "公斤"},       # 聚丙烯
-            "PS": {"price_per_kg": 6.0, "unit": "公斤"},       # 聚苯乙烯
-            "PVC": {"price_per_kg": 5.0, "unit": "公斤"}       # 聚氯乙烯
-        }
+        # 回收物價格資料庫：背景監視價格文件，以不可變快照原子替換（可以從網站爬取或手動更新）
+        price_config = get_performance_config().get_price_config()
+        self.price_table = PriceTableManager(DEFAULT_PRICE_DATA, path=price_config['path'],
+                                             poll_interval=price_config['reload_interval'])
         
         # 物件大小到重量的估算係數 (考慮空心結構，調整為更合理的值)
         self.size_to_weight_factors = {
@@ -47,147 +71,75 @@ class RecyclingPriceCalculator:
             "PVC": 0.03      # 聚氯乙烯
         }
         
-        # 類別名稱映射 (模型檢測的類別名稱 -> 價格資料庫中的名稱) - 改進版
-        self.class_mapping = {
-            # 自定義模型類別
-            "AluCan": "鋁罐",
-            "PlasticBottle": "塑膠瓶",
-            "IronCan": "鐵罐",
-            "Paper": "紙類",
-            "GlassBottle": "玻璃瓶",
-            
-            # 通用模型檢測到的類別
-            "plastic": "塑膠瓶",
-            "bottle": "塑膠瓶",
-            "can": "金屬罐",
-            "glass": "玻璃瓶",
-            "paper": "紙類",
-            "metal": "金屬",
-            
-            # 中文類別（直接映射）
-            "玻璃瓶": "玻璃瓶",
-            "塑膠瓶": "塑膠瓶",
-            "鋁罐": "鋁罐",
-            "鐵罐": "鐵罐",
-            "紙類": "紙類",
-            "金屬": "金屬",
-            
-            # 塑膠類型
-            "HDPEM": "HDPEM",
-            "PET": "PET",
-            "PP": "PP",
-            "PS": "PS",
-            "PVC": "PVC",
-            
-            # 其他映射
-            "金屬罐": "金屬",
-            "寶特瓶": "塑膠瓶",
-            "塑膠袋": "塑膠袋",
-            "紙箱": "紙箱",
-            "電子廢棄物": "電子廢棄物",
-            
-            # 常見誤判類別的修正映射
-            "electronics": "電子廢棄物",
-            "electronic": "電子廢棄物",
-            "device": "電子廢棄物",
-            "phone": "電子廢棄物",
-            "laptop": "電子廢棄物",
-            "computer": "電子廢棄物",
-            "tv": "電子廢棄物",
-            "television": "電子廢棄物",
-            "monitor": "電子廢棄物",
-            "screen": "電子廢棄物",
-            "cable": "電子廢棄物",
-            "wire": "電子廢棄物",
-            "battery": "電子廢棄物",
-            "charger": "電子廢棄物",
-            "adapter": "電子廢棄物",
-            
-            # 金屬相關映射
-            "steel": "金屬",
-            "iron": "金屬",
-            "aluminum": "金屬",
-            "copper": "金屬",
-            "brass": "金屬",
-            "bronze": "金屬",
-            "tin": "金屬",
-            "zinc": "金屬",
-            "nickel": "金屬",
-            "chrome": "金屬",
-            "stainless": "金屬",
-            "alloy": "金屬",
-            
-            # 塑膠相關映射
-            "polymer": "塑膠瓶",
-            "polyethylene": "塑膠瓶",
-            "polypropylene": "塑膠瓶",
-            "polystyrene": "塑膠瓶",
-            "polyvinyl": "塑膠瓶",
-            "nylon": "塑膠瓶",
-            "acrylic": "塑膠瓶",
-            "resin": "塑膠瓶",
-            
-            # 玻璃相關映射
-            "ceramic": "玻璃瓶",
-            "porcelain": "玻璃瓶",
-            "crystal": "玻璃瓶",
-            "mirror": "玻璃瓶",
-            
-            # 紙類相關映射
-            "cardboard": "紙箱",
-            "newspaper": "紙類",
-            "magazine": "紙類",
-            "book": "紙類",
-            "notebook": "紙類",
-            "envelope": "紙類",
-            "folder": "紙類",
-            "box": "紙箱"
-        }
+        # 類別名稱映射 (模型檢測的類別名稱 -> 價格資料庫中的名稱)，與檢測器共用類別註冊表
+        self.class_mapping = CLASS_MAPPING
+        self.category_registry = get_category_registry()
+        
+        # 價格來源抓取器（第一次更新網站價格時建立）
+        self._price_fetcher = None
+        self._price_fetcher_lock = threading.Lock()
         
-        # 嘗試載入已儲存的價格資料
+        # 批量計價使用的向量化價格表（價格快照或類別變更時重建）
+        self._pricing_arrays = None
+        
+        # 嘗試載入已儲存的價格資料，之後由背景線程自動重新載入
         self.load_saved_prices()
+        
+        # 價格歷史：記錄每次價格快照中變更的價格，用於按檢測時間計價
+        # （載入價格文件後才記錄，啟動時只寫入一次實際生效的價格）
+        self.price_history = None
+        self._recorded_price_version = None
+        if price_config['history_enable']:
+            try:
+                os.makedirs(os.path.dirname(price_config['history_path']) or '.', exist_ok=True)
+                self.price_history = PriceHistory(price_config['history_path'])
+                self._record_price_history(self.price_table.snapshot)
+                self.price_table.add_listener(self._record_price_history)
+            except Exception as e:
+                logger.warning("價格歷史初始化失敗: %s", e)
+        
+        self.price_table.start()
+    
+    def _record_price_history(self, snapshot):
+        """將價格快照中變更的價格寫入價格歷史（已記錄過的快照版本直接跳過）"""
+        if self._recorded_price_version is not None and snapshot.version <= self._recorded_price_version:
+            return
+        self._recorded_price_version = snapshot.version
+        self.price_history.record_prices(
+            {item: data["price_per_kg"] for item, data in snapshot.prices.items()},
+            source=snapshot.source
+        )
+    
+    @property
+    def price_data(self):
+        """當前價格快照（唯讀）"""
+        return self.price_table.snapshot.prices
+    
+    @property
+    def price_version(self):
+        """當前價格快照版本"""
+        return self.price_table.version
     
     def load_saved_prices(self):
         """載入已儲存的價格資料"""
         try:
-            # 嘗試從JSON文件載入價格資料
-            with open('recycling_prices.json', 'r', encoding='utf-8') as f:
-                saved_prices = json.load(f)
-                for item, data in saved_prices.items():
-                    if item in self.price_data:
-                        self.price_data[item]["price_per_kg"] = data["price_per_kg"]
-                        self.price_data[item]["source"] = data.get("source", "本地配置")
-                        self.price_data[item]["last_updated"] = data.get("date", "未知")
-                        
+            # 從JSON文件載入價格資料並替換當前快照
+            self.price_table.reload(force=True)
         except Exception as e:
-            print(f"載入價格資料時發生錯誤: {e}")
-            print("使用預設價格資料")
+            logger.warning("載入價格資料時發生錯誤: %s，使用預設價格資料", e)
     
     def scrape_recycling_prices(self):
         """載入回收物價格"""
         try:
-            print("🔄 正在載入回收物價格...")
+            logger.info("🔄 正在載入回收物價格...")
             
-            # 嘗試從JSON文件載入價格資料
-            with open('recycling_prices.json', 'r', encoding='utf-8') as f:
-                new_prices = json.load(f)
-                
-                if new_prices:
-                    # 更新價格資料
-                    for item, data in new_prices.items():
-                        if item in self.price_data:
-                            self.price_data[item]["price_per_kg"] = data["price_per_kg"]
-                            self.price_data[item]["source"] = data.get("source", "本地配置")
-                            self.price_data[item]["last_updated"] = data.get("date", "未知")
-                    
-                    print("✅ 價格資料已載入！")
-                    return True
-                else:
-                    print("⚠️ 無法載入價格，使用預設價格")
-                    return False
+            # 從JSON文件載入價格資料並替換當前快照
+            self.price_table.reload(force=True)
+            logger.info("✅ 價格資料已載入！（版本 %d）", self.price_version)
+            return True
                     
         except Exception as e:
-            print(f"載入價格時發生錯誤: {e}")
+            logger.warning("載入價格時發生錯誤: %s，使用預設價格", e)
             return False
     
     def calculate_object_area(self, bbox):
@@ -200,69 +152,209 @@ class RecyclingPriceCalculator:
     
     def estimate_weight(self, object_class, relative_area):
         """根據物件類型和相對面積估算重量 - 改進版"""
-        print(f"估算重量 - 物件類型: {object_class}, 相對面積: {relative_area}")
-        
-        # 定義實心物品（金屬類、電子廢棄物等）
-        solid_objects = {"金屬", "鐵罐", "鋁罐", "電子廢棄物", "金屬罐"}
-        
-        # 定義空心物品（塑膠、玻璃、紙類等）
-        hollow_objects = {"塑膠瓶", "玻璃瓶", "紙類", "寶特瓶", "塑膠袋", "紙箱", 
-                         "HDPEM", "PET", "PP", "PS", "PVC"}
-        
-        # 檢查是否為實心物品
-        is_solid = object_class in solid_objects
+        logger.debug("估算重量 - 物件類型: %s, 相對面積: %s", object_class, relative_area)
         
         # 獲取基礎係數
-        factor = self.size_to_weight_factors.get(object_class, 0.02)
+        factor = self.size_to_weight_factors.get(object_class, self.DEFAULT_WEIGHT_FACTOR)
         
-        if is_solid:
+        if object_class in self.SOLID_OBJECTS:
             # 實心物品使用較高的密度係數
-            weight = relative_area * factor * 8  # 實心物品使用更高係數
-            weight = max(weight, 0.02)  # 最小重量0.02kg
-            print(f"實心物品 - 使用係數: {factor}, 計算重量: {weight:.3f}kg")
+            weight = relative_area * factor * self.SOLID_MULTIPLIER
+            weight = max(weight, self.SOLID_MIN_WEIGHT)
+            logger.debug("實心物品 - 使用係數: %s, 計算重量: %.3fkg", factor, weight)
             return weight
-        elif object_class in hollow_objects:
+        elif object_class in self.HOLLOW_OBJECTS:
             # 空心物品使用較低的密度係數
-            weight = relative_area * factor * 1.5  # 空心物品使用較低係數
-            weight = max(weight, 0.005)  # 最小重量0.005kg
-            print(f"空心物品 - 使用係數: {factor}, 計算重量: {weight:.3f}kg")
+            weight = relative_area * factor * self.HOLLOW_MULTIPLIER
+            weight = max(weight, self.HOLLOW_MIN_WEIGHT)
+            logger.debug("空心物品 - 使用係數: %s, 計算重量: %.3fkg", factor, weight)
             return weight
         else:
             # 未知物品使用預設係數
-            weight = relative_area * factor * 2
-            weight = max(weight, 0.005)
-            print(f"未知物品 - 使用係數: {factor}, 計算重量: {weight:.3f}kg")
+            weight = relative_area * factor * self.DEFAULT_MULTIPLIER
+            weight = max(weight, self.DEFAULT_MIN_WEIGHT)
+            logger.debug("未知物品 - 使用係數: %s, 計算重量: %.3fkg", factor, weight)
             return weight
     
-    def calculate_price(self, object_class, relative_area):
-        """計算回收物價格"""
-        print(f"計算價格 - 物件類型: {object_class}, 相對面積: {relative_area}")
+    def get_price_as_of(self, object_class, as_of):
+        """查詢類別在指定時間生效的單價（早於價格歷史時使用當前價格，未知類別返回 None）"""
+        mapped_class = self.map_class_name(object_class)
+        if self.price_history is not None:
+            price = self.price_history.price_as_of(mapped_class, as_of)
+            if price is not None:
+                return price
+        snapshot = self.price_table.snapshot
+        return snapshot[mapped_class]["price_per_kg"] if mapped_class in snapshot else None
+    
+    def calculate_price(self, object_class, relative_area, as_of=None):
+        """計算回收物價格（as_of 指定時使用當時生效的單價）"""
+        logger.debug("計算價格 - 物件類型: %s, 相對面積: %s", object_class, relative_area)
+        
+        # 整個計算使用同一個價格快照
+        snapshot = self.price_table.snapshot
         
         # 映射類別名稱
         mapped_class = self.map_class_name(object_class)
         
-        if mapped_class not in self.price_data:
-            print(f"未找到 {mapped_class} 的價格資料")
-            return {"price": 0, "weight": 0, "unit_price": 0}
+        if mapped_class not in snapshot:
+            logger.debug("未找到 %s 的價格資料", mapped_class)
+            return {"price": 0, "weight": 0, "unit_price": 0, "price_version": snapshot.version}
         
         # 估算重量
         weight = self.estimate_weight(mapped_class, relative_area)
         
         # 計算價格
-        unit_price = self.price_data[mapped_class]["price_per_kg"]
+        data = snapshot[mapped_class]
+        unit_price = data["price_per_kg"]
+        if as_of is not None and self.price_history is not None:
+            historical_price = self.price_history.price_as_of(mapped_class, as_of)
+            if historical_price is not None:
+                unit_price = historical_price
         total_price = weight * unit_price
         
-        print(f"單價: {unit_price}, 總價: {total_price:.2f}")
+        logger.debug("單價: %s, 總價: %.2f", unit_price, total_price)
         
         return {
             "price": round(total_price, 2),
             "weight": round(weight, 3),
             "unit_price": unit_price,
-            "unit": self.price_data[mapped_class]["unit"],
-            "source": self.price_data[mapped_class].get("source", "預設"),
-            "last_updated": self.price_data[mapped_class].get("last_updated", "未知")
+            "unit": data["unit"],
+            "source": data.get("source", "預設"),
+            "last_updated": data.get("last_updated", "未知"),
+            "price_version": snapshot.version
         }
     
+    def _get_pricing_arrays(self):
+        """按類別ID建立係數、單價和實心/空心倍數的陣列（已包含檢測類別到價格類別的映射）"""
+        registry = self.category_registry
+        snapshot = self.price_table.snapshot
+        arrays = self._pricing_arrays
+        if (arrays is None or arrays['registry_version'] != registry.version
+                or arrays['snapshot'] is not snapshot):
+            version = registry.version
+            size = len(registry)
+            price_ids = registry.mapped_ids(np.arange(size))
+            known = np.zeros(size, dtype=bool)
+            factors = np.zeros(size, dtype=float)
+            unit_prices = np.zeros(size, dtype=float)
+            multipliers = np.zeros(size, dtype=float)
+            min_weights = np.zeros(size, dtype=float)
+            for category_id in range(size):
+                category = registry.name(int(price_ids[category_id]))
+                if category not in snapshot:
+                    continue
+                known[category_id] = True
+                factors[category_id] = self.size_to_weight_factors.get(category, self.DEFAULT_WEIGHT_FACTOR)
+                unit_prices[category_id] = snapshot[category]["price_per_kg"]
+                if category in self.SOLID_OBJECTS:
+                    multipliers[category_id] = self.SOLID_MULTIPLIER
+                    min_weights[category_id] = self.SOLID_MIN_WEIGHT
+                elif category in self.HOLLOW_OBJECTS:
+                    multipliers[category_id] = self.HOLLOW_MULTIPLIER
+                    min_weights[category_id] = self.HOLLOW_MIN_WEIGHT
+                else:
+                    multipliers[category_id] = self.DEFAULT_MULTIPLIER
+                    min_weights[category_id] = self.DEFAULT_MIN_WEIGHT
+            
+            arrays = self._pricing_arrays = {
+                'registry_version': version,
+                'snapshot': snapshot,
+                'price_ids': price_ids,
+                'known': known,
+                'factors': factors,
+                'unit_prices': unit_prices,
+                'multipliers': multipliers,
+                'min_weights': min_weights
+            }
+        return arrays
+    
+    def calculate_prices(self, classes, relative_areas, category_ids=None, as_of=None):
+        """批量計算價格：類別以整數ID索引價格陣列，重量和價格以 NumPy 一次算出
+        
+        category_ids 為檢測器輸出的類別ID（可選，省略時按類別名稱查詢）；
+        as_of 為單個時間點或每個物件的時間點，指定時使用當時生效的單價。
+        返回與輸入順序對應的價格資訊列表，格式與 calculate_price 相同。
+        """
+        if category_ids is None:
+            category_ids = self.category_registry.ids(classes)
+        category_ids = np.asarray(category_ids, dtype=np.intp)
+        if category_ids.size == 0:
+            return []
+        
+        arrays = self._get_pricing_arrays()
+        areas = np.asarray(relative_areas, dtype=float)
+        known = arrays['known'][category_ids]
+        
+        weights = np.maximum(areas * arrays['factors'][category_ids] * arrays['multipliers'][category_ids],
+                             arrays['min_weights'][category_ids])
+        unit_prices = arrays['unit_prices'][category_ids]
+        registry = self.category_registry
+        price_ids = arrays['price_ids'][category_ids]
+        if as_of is not None and self.price_history is not None:
+            # 一次向量化 as-of 查詢，早於價格歷史的物件沿用當前單價
+            unique_ids, inverse = np.unique(price_ids, return_inverse=True)
+            names = np.array([registry.name(int(i)) for i in unique_ids], dtype=object)[inverse]
+            historical = self.price_history.prices_as_of(names, as_of)
+            unit_prices = np.where(np.isnan(historical), unit_prices, historical)
+        prices = weights * unit_prices
+        logger.debug("批量計價 %d 個物件", len(category_ids))
+        
+        # 陣列與其價格快照一起建立，結果標記該快照的版本
+        snapshot = arrays['snapshot']
+        results = []
+        for i in range(len(category_ids)):
+            if not known[i]:
+                results.append({"price": 0, "weight": 0, "unit_price": 0, "price_version": snapshot.version})
+                continue
+            data = snapshot[registry.name(int(price_ids[i]))]
+            results.append({
+                "price": round(float(prices[i]), 2),
+                "weight": round(float(weights[i]), 3),
+                "unit_price": float(unit_prices[i]),
+                "unit": data["unit"],
+                "source": data.get("source", "預設"),
+                "last_updated": data.get("last_updated", "未知"),
+                "price_version": snapshot.version
+            })
+        return results
+    
+    def price_detections(self, detections, image_shape, as_of=None):
+        """為一張圖片的所有檢測結果計算相對面積和價格（as_of 指定時按當時的價格）"""
+        if not detections:
+            return []
+        
+        img_height, img_width = image_shape[:2]
+        bboxes = np.array([detection['bbox'] for detection in detections], dtype=float)
+        
+        # 計算相對面積
+        relative_areas = ((bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+                          / (img_width * img_height))
+        original_classes = [detection['class_name'] for detection in detections]
+        
+        # 檢測器已輸出類別ID時直接使用，否則按名稱查詢
+        registry = self.category_registry
+        if all('category_id' in detection for detection in detections):
+            category_ids = np.array([detection['category_id'] for detection in detections], dtype=np.intp)
+        else:
+            category_ids = registry.ids(original_classes)
+        price_infos = self.calculate_prices(original_classes, relative_areas, category_ids, as_of)
+        mapped_ids = registry.mapped_ids(category_ids)
+        
+        results = []
+        for detection, relative_area, price_info, mapped_id in zip(detections, relative_areas,
+                                                                   price_infos, mapped_ids):
+            results.append({
+                'bbox': detection['bbox'],
+                'original_class_name': detection['class_name'],  # 原始檢測類別
+                'class_name': registry.name(int(mapped_id)),  # 映射後的顯示類別
+                'category_id': int(mapped_id),
+                'confidence': detection['confidence'],
+                'source': detection['source'],
+                'relative_area': float(relative_area),
+                'price_info': price_info
+            })
+        return results
+    
     def get_price_info(self, object_class):
         """獲取物件價格資訊"""
         if object_class in self.price_data:
@@ -290,40 +382,43 @@ class RecyclingPriceCalculator:
         """獲取擴展的價格數據"""
         return self.price_data
     
+    def _get_price_fetcher(self):
+        """獲取價格來源抓取器（共享連接池和各來源的條件請求狀態）"""
+        if self._price_fetcher is None:
+            with self._price_fetcher_lock:
+                if self._price_fetcher is None:
+                    from src.price_sources import PriceSourceFetcher
+                    self._price_fetcher = PriceSourceFetcher.from_config(
+                        price_table=self.price_table, known_items=DEFAULT_PRICE_DATA)
+        return self._price_fetcher
+    
+    def update_prices_from_sources(self):
+        """並發抓取所有已配置的價格來源並更新價格表，返回各來源的抓取結果"""
+        try:
+            return self._get_price_fetcher().fetch_all()
+        except Exception as e:
+            logger.warning("更新價格時發生錯誤: %s", e)
+            return []
+    
     def update_prices_from_website(self, website_url):
         """從特定網站更新價格"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            response = requests.get(website_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # 這裡需要根據實際網站結構來解析價格
-            # 這是一個範例，實際需要根據目標網站調整
-            price_elements = soup.find_all('div', class_='price')  # 根據實際網站調整
+            from src.price_sources import PriceSource
             
-            for element in price_elements:
-                # 解析價格資料
-                pass
-            
-            return True
+            fetcher = self._get_price_fetcher()
+            if website_url not in fetcher.get_status():
+                fetcher.add_source(PriceSource(website_url, website_url))
+            result = fetcher.fetch_all([website_url])[0]
+            return result['status'] in ('updated', 'not_modified')
         except Exception as e:
-            print(f"更新價格時發生錯誤: {e}")
+            logger.warning("更新價格時發生錯誤: %s", e)
             return False
 
     def map_class_name(self, detected_class):
         """將檢測到的類別名稱映射到價格資料庫中的名稱（改進版）"""
-        if detected_class in self.class_mapping:
-            mapped_class = self.class_mapping[detected_class]
-            print(f"類別映射: {detected_class} -> {mapped_class}")
-            return mapped_class
-        else:
-            print(f"未找到 {detected_class} 的映射，使用原始名稱")
-            return detected_class
+        mapped_class = self.category_registry.map_name(detected_class)
+        logger.debug("類別映射: %s -> %s", detected_class, mapped_class)
+        return mapped_class
 
 # 使用範例
 if __name__ == "__main__":
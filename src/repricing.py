@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+檢測歷史重新計價 - 價格或重量係數變更後，分批流式重算 detection_history 的價格
+"""
+
+import json
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from src.database_manager import STORED_DETECTIONS, detection_item_rows
+from src.detection_codec import decode_stored, encode_for_storage
+
+
+class RepricingJob:
+    """按主鍵分頁流式讀取檢測記錄，批量向量化重新計價並分批寫回
+
+    每批在同一個事務中寫回價格和檢查點，中斷後可從上次的檢查點繼續；
+    批次之間短暫休眠，讓主應用的讀寫不被長時間阻塞。
+    """
+
+    CHECKPOINT_KEY = 'repricing_checkpoint'
+
+    def __init__(self, db_manager, price_calculator, chunk_size: int = 500,
+                 throttle: float = 0.05, as_of_record: bool = False):
+        """初始化重新計價任務
+
+        as_of_record=True 時使用每條記錄檢測時生效的價格（價格歷史），否則使用當前價格。
+        """
+        self.db_manager = db_manager
+        self.connections = db_manager.connections
+        self.price_calculator = price_calculator
+        self.chunk_size = chunk_size
+        self.throttle = throttle
+        self.as_of_record = as_of_record
+
+    def load_checkpoint(self) -> Optional[Dict]:
+        """讀取上次未完成的檢查點"""
+        with self.connections.connection() as conn:
+            row = conn.execute('SELECT value FROM system_settings WHERE key = ?',
+                               (self.CHECKPOINT_KEY,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def clear_checkpoint(self):
+        """刪除檢查點（下次從頭開始）"""
+        with self.connections.transaction() as conn:
+            conn.execute('DELETE FROM system_settings WHERE key = ?', (self.CHECKPOINT_KEY,))
+
+    def _reprice_chunk(self, rows) -> List[tuple]:
+        """重新計價一批記錄，返回 (detection_results, detection_blob, total_price, id, detection_item_rows)"""
+        records = []
+        classes, areas, timestamps, positions = [], [], [], []
+        for record_id, timestamp, stored in rows:
+            try:
+                results = decode_stored(stored)
+            except ValueError:
+                continue
+            records.append((record_id, results))
+            for item_index, item in enumerate(results):
+                if not isinstance(item, dict) or item.get('relative_area') is None:
+                    continue
+                classes.append(item.get('original_class_name') or item.get('class_name'))
+                areas.append(item['relative_area'])
+                timestamps.append(timestamp)
+                positions.append((len(records) - 1, item_index))
+
+        # 整批物件一次向量化計價
+        as_of = timestamps if self.as_of_record and timestamps else None
+        price_infos = self.price_calculator.calculate_prices(classes, areas, as_of=as_of)
+        for (record_index, item_index), price_info in zip(positions, price_infos):
+            records[record_index][1][item_index]['price_info'] = price_info
+
+        # 總價與主應用一致：各物件價格之和
+        detection_format = self.db_manager.detection_format
+        return [
+            (*encode_for_storage(results, detection_format),
+             sum(item.get('price_info', {}).get('price', 0) for item in results if isinstance(item, dict)),
+             record_id,
+             detection_item_rows(results))
+            for record_id, results in records
+        ]
+
+    def run(self, resume: bool = True, max_chunks: Optional[int] = None,
+            progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """執行重新計價，返回統計 {rows, chunks, last_id, max_id, completed, elapsed}"""
+        checkpoint = self.load_checkpoint() if resume else None
+
+        with self.connections.connection() as conn:
+            if checkpoint is None:
+                # 只處理開始時已存在的記錄，之後新增的記錄已按新價格計算
+                max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM detection_history').fetchone()[0]
+                checkpoint = {'last_id': 0, 'max_id': max_id, 'rows': 0,
+                              'started_at': datetime.now().isoformat()}
+
+        stats = {'rows': 0, 'chunks': 0, 'last_id': checkpoint['last_id'],
+                 'max_id': checkpoint['max_id'], 'completed': False}
+        start_time = time.time()
+
+        while max_chunks is None or stats['chunks'] < max_chunks:
+            with self.connections.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT id, timestamp, {STORED_DETECTIONS}
+                    FROM detection_history
+                    WHERE id > ? AND id <= ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (checkpoint['last_id'], checkpoint['max_id'], self.chunk_size)).fetchall()
+            if not rows:
+                self.clear_checkpoint()
+                stats['completed'] = True
+                break
+
+            updates = self._reprice_chunk(rows)
+            checkpoint['last_id'] = rows[-1][0]
+            checkpoint['rows'] += len(rows)
+
+            # 價格、檢測物件和檢查點在同一個事務中寫入；
+            # 讀取後被刪除的記錄不會被更新，也不會再寫入其檢測物件
+            with self.connections.transaction() as conn:
+                conn.executemany('''
+                    UPDATE detection_history
+                    SET detection_results = ?, detection_blob = ?, total_price = ?
+                    WHERE id = ?
+                ''', [update[:4] for update in updates])
+                self.db_manager.write_detection_items(
+                    conn, [(record_id, item_rows) for _, _, _, record_id, item_rows in updates])
+                conn.execute('''
+                    INSERT OR REPLACE INTO system_settings (key, value, updated_at)
+                    VALUES (?, ?, ?)
+                ''', (self.CHECKPOINT_KEY, json.dumps(checkpoint), datetime.now().isoformat()))
+
+            stats['rows'] += len(rows)
+            stats['chunks'] += 1
+            stats['last_id'] = checkpoint['last_id']
+            if progress is not None:
+                progress(dict(stats))
+            if self.throttle > 0:
+                time.sleep(self.throttle)
+
+        stats['elapsed'] = time.time() - start_time
+        return stats
+
+
+def main():
+    """命令行入口"""
+    import argparse
+    from src.database_manager import DatabaseManager
+    from src.recycling_price_calculator import RecyclingPriceCalculator
+
+    parser = argparse.ArgumentParser(description="重新計算檢測歷史的價格")
+    parser.add_argument('--db-path', default="data/recycling_app.db", help="數據庫路徑")
+    parser.add_argument('--chunk-size', type=int, default=500, help="每批記錄數")
+    parser.add_argument('--throttle', type=float, default=0.05, help="批次之間休眠的秒數")
+    parser.add_argument('--max-chunks', type=int, help="最多處理的批數（之後可繼續）")
+    parser.add_argument('--restart', action='store_true', help="忽略檢查點，從頭開始")
+    parser.add_argument('--as-of-record', action='store_true', help="使用記錄檢測時生效的價格")
+    args = parser.parse_args()
+
+    job = RepricingJob(DatabaseManager(args.db_path), RecyclingPriceCalculator(),
+                       chunk_size=args.chunk_size, throttle=args.throttle,
+                       as_of_record=args.as_of_record)
+
+    def report(stats):
+        print(f"🔄 已處理 {stats['rows']} 條記錄（最後ID {stats['last_id']} / {stats['max_id']}）")
+
+    stats = job.run(resume=not args.restart, max_chunks=args.max_chunks, progress=report)
+    state = "完成" if stats['completed'] else "已暫停，可再次運行以繼續"
+    print(f"✅ 重新計價{state}: {stats['rows']} 條記錄，耗時 {stats['elapsed']:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+數據保留 - 將保留期限之前的明細記錄匯總到每日統計表，歸檔後分批刪除，並增量回收空間
+"""
+
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from src.database_manager import STORED_DETECTIONS
+from src.detection_codec import stored_json
+
+_RATING = ("CASE WHEN json_valid(user_rating) "
+           "THEN CAST(json_extract(user_rating, '$.overall') AS REAL) END")
+
+# 每張明細表的欄位（歸檔用）
+_COLUMNS = {
+    'detection_history': ('id', 'timestamp', 'image_path', 'detection_mode', 'total_detections',
+                          'detection_results', 'total_price', 'created_at', 'image_digest'),
+    'user_feedback': ('id', 'timestamp', 'feedback_type', 'content', 'detection_results',
+                      'user_rating', 'created_at')
+}
+
+
+class RetentionJob:
+    """保留期限之前的記錄：匯總 -> 歸檔 -> 刪除，每批在一個事務中完成
+
+    statistics_summary 保存的是累計統計，刪除時會補回被刪記錄的數量，
+    因此 get_statistics 的結果不受保留策略影響；長期的分析改讀每日匯總表。
+    """
+
+    def __init__(self, db_manager, days: int, archive_dir: Optional[str] = "data/archive",
+                 chunk_size: int = 2000, vacuum_pages: int = 2000, throttle: float = 0.05,
+                 image_store=None):
+        self.db_manager = db_manager
+        self.connections = db_manager.connections
+        self.days = days
+        self.archive_dir = archive_dir
+        self.chunk_size = chunk_size
+        self.vacuum_pages = vacuum_pages
+        self.throttle = throttle
+        # 圖片存儲（可選）：刪除記錄後清理不再被引用的圖片
+        self.image_store = image_store
+
+    @classmethod
+    def from_config(cls, db_manager, **overrides):
+        """按性能配置創建保留任務"""
+        from src.performance_config import get_performance_config
+
+        from src.image_store import get_image_store
+
+        config = get_performance_config().get_retention_config()
+        config.pop('interval')
+        config['image_store'] = get_image_store()
+        config.update(overrides)
+        return cls(db_manager, **config)
+
+    def cutoff(self, now: Optional[datetime] = None) -> str:
+        """保留期限的起點（取整到當天零點，每天的記錄要麼全部保留，要麼全部匯總）"""
+        now = now or datetime.now()
+        start = (now - timedelta(days=self.days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return start.isoformat()
+
+    def _archive(self, table: str, rows: List[tuple], archive_file: Optional[str]):
+        """刪除前先將原始記錄追加寫入 gzip 壓縮的 JSONL（二進制檢測結果轉為 JSON）"""
+        if archive_file is None or not rows:
+            return
+        columns = _COLUMNS[table]
+        with gzip.open(archive_file, 'at', encoding='utf-8') as f:
+            for row in rows:
+                record = dict(zip(columns, row))
+                if table == 'detection_history':
+                    record['detection_results'] = stored_json(record['detection_results'])
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _purge_detections(self, conn, ids: str):
+        # 記錄層級的匯總（按日期和檢測模式）
+        conn.execute('''
+            INSERT INTO detection_daily (day, detection_mode, record_count, detections_sum, value_sum)
+            SELECT substr(timestamp, 1, 10), COALESCE(detection_mode, ''), COUNT(*),
+                   COALESCE(SUM(total_detections), 0), COALESCE(SUM(total_price), 0)
+            FROM detection_history
+            WHERE id IN (SELECT value FROM json_each(?))
+            GROUP BY 1, 2
+            ON CONFLICT (day, detection_mode) DO UPDATE SET
+                record_count = record_count + excluded.record_count,
+                detections_sum = detections_sum + excluded.detections_sum,
+                value_sum = value_sum + excluded.value_sum
+        ''', (ids,))
+        # 物件層級的匯總（按日期和類別）
+        conn.execute('''
+            INSERT INTO detection_category_daily (day, category_id, item_count, total_weight, total_value)
+            SELECT substr(h.timestamp, 1, 10), i.category_id, COUNT(*),
+                   COALESCE(SUM(i.weight), 0), COALESCE(SUM(i.price), 0)
+            FROM detection_items AS i
+            JOIN detection_history AS h ON h.id = i.record_id
+            WHERE i.record_id IN (SELECT value FROM json_each(?))
+            GROUP BY 1, 2
+            ON CONFLICT (day, category_id) DO UPDATE SET
+                item_count = item_count + excluded.item_count,
+                total_weight = total_weight + excluded.total_weight,
+                total_value = total_value + excluded.total_value
+        ''', (ids,))
+
+        totals = conn.execute('''
+            SELECT COUNT(*), COUNT(total_detections), COALESCE(SUM(total_detections), 0),
+                   COALESCE(SUM(total_price), 0)
+            FROM detection_history WHERE id IN (SELECT value FROM json_each(?))
+        ''', (ids,)).fetchone()
+
+        conn.execute('DELETE FROM detection_items WHERE record_id IN (SELECT value FROM json_each(?))', (ids,))
+        conn.execute('DELETE FROM detection_history WHERE id IN (SELECT value FROM json_each(?))', (ids,))
+
+        # 刪除觸發器扣減了累計統計，補回
+        conn.execute('''
+            UPDATE statistics_summary SET
+                detection_count = detection_count + ?,
+                detections_count = detections_count + ?,
+                detections_sum = detections_sum + ?,
+                value_sum = value_sum + ?
+            WHERE id = 1
+        ''', totals)
+
+    def _purge_feedback(self, conn, ids: str):
+        conn.execute(f'''
+            INSERT INTO feedback_daily (day, feedback_type, feedback_count, rating_count, rating_sum)
+            SELECT substr(timestamp, 1, 10), feedback_type, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0)
+            FROM (
+                SELECT timestamp, feedback_type, {_RATING} AS rating
+                FROM user_feedback WHERE id IN (SELECT value FROM json_each(?))
+            )
+            GROUP BY 1, 2
+            ON CONFLICT (day, feedback_type) DO UPDATE SET
+                feedback_count = feedback_count + excluded.feedback_count,
+                rating_count = rating_count + excluded.rating_count,
+                rating_sum = rating_sum + excluded.rating_sum
+        ''', (ids,))
+
+        totals = conn.execute(f'''
+            SELECT COUNT(*), COUNT({_RATING}), COALESCE(SUM({_RATING}), 0)
+            FROM user_feedback WHERE id IN (SELECT value FROM json_each(?))
+        ''', (ids,)).fetchone()
+        type_counts = conn.execute('''
+            SELECT feedback_type, COUNT(*) FROM user_feedback
+            WHERE id IN (SELECT value FROM json_each(?))
+            GROUP BY feedback_type
+        ''', (ids,)).fetchall()
+
+        conn.execute('DELETE FROM user_feedback WHERE id IN (SELECT value FROM json_each(?))', (ids,))
+
+        # 刪除觸發器扣減了累計統計，補回
+        conn.execute('''
+            UPDATE statistics_summary SET
+                feedback_count = feedback_count + ?,
+                rating_count = rating_count + ?,
+                rating_sum = rating_sum + ?
+            WHERE id = 1
+        ''', totals)
+        conn.executemany('''
+            INSERT INTO feedback_type_counts (feedback_type, count) VALUES (?, ?)
+            ON CONFLICT (feedback_type) DO UPDATE SET count = count + excluded.count
+        ''', type_counts)
+
+    def _purge_table(self, table: str, cutoff: str, archive_file: Optional[str],
+                     progress: Optional[Callable[[Dict], None]]) -> int:
+        columns = ', '.join(STORED_DETECTIONS if column == 'detection_results' and table == 'detection_history'
+                            else column for column in _COLUMNS[table])
+        purged = 0
+        while True:
+            with self.connections.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT {columns} FROM {table}
+                    WHERE timestamp < ?
+                    ORDER BY timestamp, id
+                    LIMIT ?
+                ''', (cutoff, self.chunk_size)).fetchall()
+            if not rows:
+                return purged
+
+            # 先歸檔再刪除：中途失敗最多在歸檔中重複，不會丟失記錄
+            self._archive(table, rows, archive_file)
+            ids = json.dumps([row[0] for row in rows])
+            with self.connections.transaction() as conn:
+                if table == 'detection_history':
+                    self._purge_detections(conn, ids)
+                else:
+                    self._purge_feedback(conn, ids)
+
+            purged += len(rows)
+            if progress is not None:
+                progress({'table': table, 'purged': purged})
+            if self.throttle > 0:
+                time.sleep(self.throttle)
+
+    def incremental_vacuum_enabled(self) -> bool:
+        """數據庫是否已啟用 auto_vacuum=INCREMENTAL"""
+        with self.connections.connection() as conn:
+            return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+    def enable_incremental_vacuum(self) -> bool:
+        """將數據庫轉換為 auto_vacuum=INCREMENTAL，返回是否執行了轉換
+
+        轉換需要一次完整 VACUUM（重寫整個數據庫文件並阻塞所有寫入），
+        只應在維護時通過命令行執行一次：python -m src.retention --enable-incremental-vacuum
+        """
+        if self.incremental_vacuum_enabled():
+            return False
+        with self.connections.connection() as conn:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+        return True
+
+    def vacuum(self) -> int:
+        """增量回收已刪除記錄佔用的頁，返回釋放的頁數
+
+        數據庫未啟用 auto_vacuum=INCREMENTAL 時跳過（不在定時任務中執行完整 VACUUM）。
+        """
+        if not self.incremental_vacuum_enabled():
+            print("ℹ️ 數據庫未啟用增量 VACUUM，跳過空間回收"
+                  "（維護時執行 python -m src.retention --enable-incremental-vacuum）")
+            return 0
+
+        freed = 0
+        with self.connections.connection() as conn:
+            while True:
+                free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if not free_pages:
+                    return freed
+                conn.execute(f'PRAGMA incremental_vacuum({min(free_pages, self.vacuum_pages)})').fetchall()
+                freed += min(free_pages, self.vacuum_pages)
+                if self.throttle > 0:
+                    time.sleep(self.throttle)
+
+    def run(self, now: Optional[datetime] = None, progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """執行一次保留策略，返回 {cutoff, detections, feedback, archive, vacuum_pages, orphan_images, elapsed}"""
+        start_time = time.time()
+        cutoff = self.cutoff(now)
+        stats = {'cutoff': cutoff, 'detections': 0, 'feedback': 0, 'archive': None, 'vacuum_pages': 0,
+                 'orphan_images': 0}
+
+        archive_files = {}
+        if self.archive_dir:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            archive_files = {table: os.path.join(self.archive_dir, f"{table}_{stamp}.jsonl.gz")
+                             for table in _COLUMNS}
+            stats['archive'] = self.archive_dir
+
+        stats['detections'] = self._purge_table('detection_history', cutoff,
+                                                archive_files.get('detection_history'), progress)
+        stats['feedback'] = self._purge_table('user_feedback', cutoff,
+                                              archive_files.get('user_feedback'), progress)
+        if stats['detections'] or stats['feedback']:
+            stats['vacuum_pages'] = self.vacuum()
+        if self.image_store is not None:
+            stats['orphan_images'] = self.image_store.cleanup_orphans(self.db_manager.referenced_image_digests)
+
+        stats['elapsed'] = time.time() - start_time
+        return stats
+
+
+class RetentionScheduler:
+    """在背景線程中定期執行保留策略"""
+
+    def __init__(self, job: RetentionJob, interval: float = 86400.0):
+        self.job = job
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_stats: Optional[Dict] = None
+
+    def start(self):
+        """啟動背景線程（啟動後先執行一次）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.last_stats = self.job.run()
+                if self.last_stats['detections'] or self.last_stats['feedback']:
+                    print(f"🗄️ 已匯總並刪除 {self.last_stats['cutoff'][:10]} 之前的 "
+                          f"{self.last_stats['detections']} 條檢測記錄和 {self.last_stats['feedback']} 條反饋")
+                if self.last_stats['orphan_images']:
+                    print(f"🗄️ 已刪除 {self.last_stats['orphan_images']} 張無記錄引用的圖片")
+            except Exception as e:
+                print(f"⚠️ 執行數據保留策略失敗: {e}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        """停止背景線程"""
+        self._stop.set()
+
+
+def start_retention_scheduler(db_manager) -> Optional[RetentionScheduler]:
+    """按配置啟動保留策略（RETENTION_DAYS 為 0 時不啟動）"""
+    from src.performance_config import get_performance_config
+
+    config = get_performance_config().get_retention_config()
+    if config['days'] <= 0:
+        return None
+    scheduler = RetentionScheduler(RetentionJob.from_config(db_manager), config['interval'])
+    scheduler.start()
+    return scheduler
+
+
+def main():
+    """命令行入口"""
+    import argparse
+    from src.database_manager import DatabaseManager
+    from src.image_store import get_image_store
+
+    parser = argparse.ArgumentParser(description="匯總並刪除保留期限之前的檢測記錄和反饋")
+    parser.add_argument('--days', type=int, help="保留天數")
+    parser.add_argument('--db-path', default="data/recycling_app.db", help="數據庫路徑")
+    parser.add_argument('--archive-dir', default="data/archive", help="歸檔目錄")
+    parser.add_argument('--no-archive', action='store_true', help="刪除前不歸檔")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="每批記錄數")
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help="一次性將數據庫轉換為增量 VACUUM（完整 VACUUM，期間阻塞寫入）")
+    args = parser.parse_args()
+    if args.days is None and not args.enable_incremental_vacuum:
+        parser.error("需要 --days 或 --enable-incremental-vacuum")
+
+    job = RetentionJob(DatabaseManager(args.db_path), args.days or 0,
+                       archive_dir=None if args.no_archive else args.archive_dir,
+                       chunk_size=args.chunk_size, image_store=get_image_store())
+
+    if args.enable_incremental_vacuum:
+        print("🔧 正在轉換為增量 VACUUM（完整 VACUUM）...")
+        if job.enable_incremental_vacuum():
+            print("✅ 已啟用增量 VACUUM")
+        else:
+            print("✅ 數據庫已啟用增量 VACUUM，無需轉換")
+    if args.days is None:
+        return
+
+    def report(progress):
+        print(f"🗄️ {progress['table']}: 已處理 {progress['purged']} 條記錄")
+
+    stats = job.run(progress=report)
+    print(f"✅ 完成: 刪除 {stats['detections']} 條檢測記錄、{stats['feedback']} 條反饋"
+          f"（{stats['cutoff'][:10]} 之前）、{stats['orphan_images']} 張無引用的圖片，"
+          f"耗時 {stats['elapsed']:.1f} 秒")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+延後寫入 - 檢測記錄和用戶反饋先放入隊列，由背景線程分組批量寫入數據庫
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from src.batch_writer import BatchWriter
+
+
+class WriteBehindWriter(BatchWriter):
+    """有界隊列 + 背景批量寫入；頁面渲染只需把記錄放入隊列
+
+    隊列已滿時改為同步寫入（不丟失記錄，重試後仍失敗時向調用方拋出異常）；
+    檢測記錄和反饋分別在各自的事務中寫入，一類失敗重試時不會重複寫入另一類。
+    """
+
+    thread_name = "write-behind"
+
+    def __init__(self, db_manager, batch_size: int = 200, flush_interval: float = 0.5,
+                 max_queue: int = 5000, max_retries: int = 3, retry_backoff: float = 0.2):
+        super().__init__(batch_size=batch_size, flush_interval=flush_interval, max_queue=max_queue,
+                         max_retries=max_retries, retry_backoff=retry_backoff)
+        self.db_manager = db_manager
+        self._stats['sync_writes'] = 0
+
+    def _submit(self, kind: str, record: Dict) -> bool:
+        """放入隊列，返回是否為延後寫入（False 表示隊列已滿、已同步寫入）"""
+        record.setdefault('timestamp', datetime.now().isoformat())
+        if self._enqueue((kind, record)):
+            return True
+        self._count('sync_writes')
+        self._write_sync([(kind, record)])
+        return False
+
+    def submit_detection(self, detection_mode: str, total_detections: int, detection_results: List[Dict],
+                         total_price: float, image_path: Optional[str] = None,
+                         image_digest: Optional[str] = None) -> bool:
+        """提交檢測記錄（參數與 DatabaseManager.save_detection_record 相同）"""
+        return self._submit('detection', {
+            'detection_mode': detection_mode,
+            'total_detections': total_detections,
+            'detection_results': detection_results,
+            'total_price': total_price,
+            'image_path': image_path,
+            'image_digest': image_digest
+        })
+
+    def submit_feedback(self, feedback_type: str, content: str, detection_results: Optional[Dict] = None,
+                        user_rating: Optional[Dict] = None) -> bool:
+        """提交用戶反饋（參數與 DatabaseManager.save_feedback 相同）"""
+        return self._submit('feedback', {
+            'feedback_type': feedback_type,
+            'content': content,
+            'detection_results': detection_results,
+            'user_rating': user_rating
+        })
+
+    def _partition(self, entries):
+        detections = [entry for entry in entries if entry[0][0] == 'detection']
+        feedback = [entry for entry in entries if entry[0][0] == 'feedback']
+        return [group for group in (detections, feedback) if group]
+
+    def _write_batch(self, items):
+        detections = [record for kind, record in items if kind == 'detection']
+        feedback = [record for kind, record in items if kind == 'feedback']
+        if detections:
+            self.db_manager.save_detection_records(detections)
+        if feedback:
+            self.db_manager.save_feedback_batch(feedback)
@@ -0,0 +1,76 @@
+import http.server
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# 測試直接導入 src 下的模組
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STUB_PAGE = ('<html><body><table>'
+             '<tr><th>品項</th><th>價格</th></tr>'
+             '<tr><td>鋁罐</td><td>27.5 元/公斤</td></tr>'
+             '<tr><td>紙類</td><td>3.1 元/公斤</td></tr>'
+             '</table><div class="price" data-item="寶特瓶">9.2</div>'
+             '</body></html>')
+STUB_ETAG = '"stub-v1"'
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    """價格頁面樁服務器
+
+    /prices 支持 ETag；/error 返回 500；/slow 延遲 2 秒才響應；
+    /big5 以 Big5 編碼返回同一頁面；/trickle 分塊慢速傳送（每塊間隔 0.3 秒）。
+    """
+
+    def do_GET(self):
+        if self.path == '/error':
+            self.send_error(500)
+            return
+        if self.path == '/slow':
+            time.sleep(2)
+        if self.path == '/trickle':
+            self._send_trickle()
+            return
+        if self.headers.get('If-None-Match') == STUB_ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        charset = 'big5' if self.path == '/big5' else 'utf-8'
+        page = STUB_PAGE.encode(charset)
+        self.send_response(200)
+        self.send_header('Content-Type', f'text/html; charset={charset}')
+        self.send_header('Content-Length', str(len(page)))
+        self.send_header('ETag', STUB_ETAG)
+        self.end_headers()
+        self.wfile.write(page)
+
+    def _send_trickle(self):
+        from src.price_sources import PriceSourceFetcher
+
+        chunk = b' ' * PriceSourceFetcher.CHUNK_SIZE
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(chunk) * 10))
+        self.end_headers()
+        try:
+            for _ in range(10):
+                self.wfile.write(chunk)
+                self.wfile.flush()
+                time.sleep(0.3)
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope='session')
+def price_stub_url():
+    """本地價格頁面樁服務器的基礎網址"""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+類別註冊表測試 - 兩個註冊表綁定同一個數據庫，模擬多個進程共用類別ID
+"""
+
+import pytest
+
+from src.category_registry import UNKNOWN_CATEGORY_ID, CategoryRegistry
+from src.database_manager import DatabaseManager
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DatabaseManager(str(tmp_path / "categories.db"))
+
+
+@pytest.fixture
+def registries(store):
+    first, second = CategoryRegistry(), CategoryRegistry()
+    assert first.bind(store) and second.bind(store)
+    return first, second
+
+
+def test_name_reloads_categories_added_by_other_process(registries):
+    first, second = registries
+    category_id = first.intern("OtherProcessItem")
+
+    assert second.get_id("OtherProcessItem") is None
+    assert second.name(category_id) == "OtherProcessItem"
+    assert second.get_id("OtherProcessItem") == category_id
+
+
+def test_mapped_id_reloads_and_links_mapping_target(registries):
+    first, second = registries
+    # 映射表中的名稱會連同其價格類別一起分配
+    first._mapping["OtherProcessBottle"] = "寶特瓶"
+    second._mapping["OtherProcessBottle"] = "寶特瓶"
+    category_id = first.intern("OtherProcessBottle")
+
+    assert second.mapped_id(category_id) == second.get_id("寶特瓶")
+    assert second.mapped_ids([category_id]).tolist() == [second.get_id("寶特瓶")]
+
+
+def test_intern_loads_ids_allocated_by_other_process(registries):
+    first, second = registries
+    skipped_id = first.intern("FirstOnly")
+    own_id = second.intern("SecondOnly")
+
+    # 分配到的ID跳過了其他進程的類別，跳過的ID也能解析
+    assert own_id > skipped_id
+    assert second.name(skipped_id) == "FirstOnly"
+    assert second.ids(["FirstOnly", "SecondOnly"]).tolist() == [skipped_id, own_id]
+
+
+def test_unknown_id_and_none_name(registries):
+    first, _ = registries
+    assert first.name(len(first) + 100) is None
+    assert first.mapped_id(len(first) + 100) == UNKNOWN_CATEGORY_ID
+    with pytest.raises(ValueError):
+        first.intern(None)
+    with pytest.raises(ValueError):
+        first.ids(["寶特瓶", None])
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+價格來源抓取測試 - 使用 conftest.py 中的本地樁服務器
+"""
+
+import time
+
+import pytest
+
+from src.price_sources import CircuitBreaker, PriceSource, PriceSourceFetcher
+from src.price_table import PriceTableManager
+from src.recycling_price_calculator import DEFAULT_PRICE_DATA
+
+STUB_PRICES = {'鋁罐': 27.5, '紙類': 3.1, '寶特瓶': 9.2}
+
+
+@pytest.fixture
+def base_url(price_stub_url):
+    return price_stub_url
+
+
+@pytest.fixture
+def table():
+    return PriceTableManager(DEFAULT_PRICE_DATA, path='', poll_interval=0)
+
+
+@pytest.fixture
+def make_fetcher():
+    fetchers = []
+
+    def make(sources, **kwargs):
+        kwargs.setdefault('known_items', DEFAULT_PRICE_DATA)
+        fetcher = PriceSourceFetcher(sources, **kwargs)
+        fetchers.append(fetcher)
+        return fetcher
+
+    yield make
+    for fetcher in fetchers:
+        fetcher.close()
+
+
+def test_not_modified_skips_parsing_and_table_update(base_url, table, make_fetcher):
+    fetcher = make_fetcher([PriceSource('stub', f"{base_url}/prices")], price_table=table)
+
+    first = fetcher.fetch_all()[0]
+    assert first['status'] == 'updated'
+    assert first['prices'] == STUB_PRICES
+    assert fetcher.get_status()['stub']['etag'] == '"stub-v1"'
+    version = table.version
+
+    second = fetcher.fetch_all()[0]
+    assert second['status'] == 'not_modified'
+    assert second['prices'] == {}
+    assert table.version == version
+    assert table.snapshot['鋁罐']['price_per_kg'] == 27.5
+
+
+def test_circuit_opens_after_failures_and_half_open_allows_one_probe(base_url, make_fetcher):
+    fetcher = make_fetcher([PriceSource('flaky', f"{base_url}/error")],
+                           failure_threshold=2, reset_timeout=0.2)
+
+    assert [fetcher.fetch_source('flaky')['status'] for _ in range(2)] == ['failed', 'failed']
+    assert fetcher.get_status()['flaky']['circuit'] == 'open'
+    skipped = fetcher.fetch_source('flaky')
+    assert skipped['status'] == 'skipped'
+
+    time.sleep(0.25)
+    assert fetcher.get_status()['flaky']['circuit'] == 'half-open'
+    # 試探請求成功後熔斷器關閉
+    fetcher.add_source(PriceSource('flaky', f"{base_url}/prices"))
+    assert fetcher.fetch_source('flaky')['status'] == 'updated'
+    status = fetcher.get_status()['flaky']
+    assert status['circuit'] == 'closed'
+    assert status['failures'] == 0
+
+
+def test_half_open_breaker_lets_a_single_request_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+def test_slow_response_fails_on_socket_timeout(base_url, make_fetcher):
+    fetcher = make_fetcher([PriceSource('slow', f"{base_url}/slow", timeout=0.3)])
+
+    result = fetcher.fetch_source('slow')
+    assert result['status'] == 'failed'
+    assert result['elapsed'] < 1.5
+
+
+def test_trickling_body_fails_on_overall_deadline(base_url, make_fetcher):
+    # 每塊間隔都短於超時時間，只有整體截止時間能中斷下載
+    fetcher = make_fetcher([PriceSource('trickle', f"{base_url}/trickle", timeout=0.5)])
+
+    result = fetcher.fetch_source('trickle')
+    assert result['status'] == 'failed'
+    assert '超過' in result['error']
+    assert result['elapsed'] < 1.5
+
+
+def test_charset_from_content_type(base_url, make_fetcher):
+    fetcher = make_fetcher([PriceSource('big5', f"{base_url}/big5")])
+
+    result = fetcher.fetch_source('big5')
+    assert result['status'] == 'updated'
+    assert result['prices'] == STUB_PRICES
+
+
+def test_configured_encoding_overrides_content_type(base_url, make_fetcher):
+    fetcher = make_fetcher([PriceSource('big5', f"{base_url}/big5", encoding='utf-8')])
+
+    result = fetcher.fetch_source('big5')
+    # 按 UTF-8 解碼 Big5 頁面時類別名稱無法匹配
+    assert result['status'] == 'failed'
+    assert result['prices'] == {}
+
+
+def test_apply_source_prices_layers_over_defaults(table):
+    listener_versions = []
+    table.add_listener(lambda snapshot: listener_versions.append(snapshot.version))
+    version = table.version
+    prices = {'鋁罐': {'price_per_kg': 30.0, 'source': 'a'},
+              '不存在的類別': {'price_per_kg': 1.0, 'source': 'a'}}
+
+    assert table.apply_source_prices('a', prices)
+    assert table.version == version + 1
+    assert listener_versions == [version + 1]
+    assert table.snapshot['鋁罐']['price_per_kg'] == 30.0
+    assert '不存在的類別' not in table.snapshot
+
+    # 相同價格不建立新快照
+    assert not table.apply_source_prices('a', prices)
+    assert table.version == version + 1
+
+    # 後套用的來源覆蓋前一個來源，來源更新時替換該來源之前的價格
+    assert table.apply_source_prices('b', {'鋁罐': {'price_per_kg': 31.0, 'source': 'b'}})
+    assert table.snapshot['鋁罐']['price_per_kg'] == 31.0
+    assert table.apply_source_prices('a', {'紙類': {'price_per_kg': 4.0, 'source': 'a'}})
+    assert table.snapshot['鋁罐']['price_per_kg'] == 31.0
+    assert table.snapshot['紙類']['price_per_kg'] == 4.0
+
+
+def test_fetch_all_applies_sources_in_order(base_url, table, make_fetcher):
+    fetcher = make_fetcher([PriceSource('stub', f"{base_url}/prices"),
+                            PriceSource('error', f"{base_url}/error")], price_table=table)
+
+    results = fetcher.fetch_all()
+    assert [result['status'] for result in results] == ['updated', 'failed']
+    assert table.snapshot['寶特瓶']['price_per_kg'] == 9.2
+    assert table.snapshot['寶特瓶']['source'] == 'stub'
@@ -1,16 +1,30 @@
+from src.import_profiler import start_startup_profiling
+
+# 記錄啟動時各模組的導入耗時
+startup_profiler = start_startup_profiling()
+
 import streamlit as st
-import cv2
 import numpy as np
 from PIL import Image
-import io
-from ultralytics import YOLO
 from src.recycling_price_calculator import RecyclingPriceCalculator
 from src.enhanced_detection import EnhancedRecyclingDetector
 from src.database_manager import DatabaseManager
 from src.feedback_system import FeedbackSystem
-from src.performance_config import get_performance_config
+from src.performance_config import get_performance_config, preprocess_image
+from src.inference_admission import AdmissionRejected, get_inference_admission
+from src.performance_monitor import PerformanceDashboard, PerformanceRecorder
+from src.write_behind import WriteBehindWriter
+from src.data_export import (DATASETS, EXPORT_FORMATS, MIME_TYPES, export_filename, export_path,
+                             export_to_file)
+from src.retention import start_retention_scheduler
+from src.analytics_mirror import start_mirror_scheduler
+from src.detection_cache import image_digest
+from src.image_store import get_image_store
+import os
+import shlex
 import time
-from functools import lru_cache
+import uuid
+from datetime import date, timedelta
 
 # 頁面設定
 st.set_page_config(
@@ -31,35 +45,44 @@ def load_systems():
         detector = EnhancedRecyclingDetector()
         price_calculator = RecyclingPriceCalculator()
         db_manager = DatabaseManager()
-        feedback_system = FeedbackSystem()
-        return detector, price_calculator, db_manager, feedback_system
+        # 按 RETENTION_DAYS 定期匯總並刪除舊記錄（預設不啟用）
+        start_retention_scheduler(db_manager)
+        # 檢測記錄和反饋在背景批量寫入，不阻塞頁面渲染
+        write_behind = WriteBehindWriter(db_manager, **performance_config.get_write_behind_config())
+        feedback_system = FeedbackSystem(db_manager, write_behind)
+        return detector, price_calculator, db_manager, feedback_system, write_behind
     except Exception as e:
         st.error(f"載入系統時發生錯誤: {e}")
-        return None, None, None, None
+        return None, None, None, None, None
 
 # 載入系統組件
-detector, price_calculator, db_manager, feedback_system = load_systems()
+detector, price_calculator, db_manager, feedback_system, write_behind = load_systems()
 
-def preprocess_image(image_array):
-    """預處理圖片以提高檢測速度"""
-    # 獲取預處理配置
-    preprocessing_config = performance_config.get_preprocessing_config()
-    
-    if not preprocessing_config['enable']:
-        return image_array
-    
-    # 調整圖片大小以加快處理速度
-    height, width = image_array.shape[:2]
-    max_size = preprocessing_config['max_size']
-    
-    # 如果圖片太大，縮小到合適的尺寸
-    if max(height, width) > max_size:
-        scale = max_size / max(height, width)
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        image_array = cv2.resize(image_array, (new_width, new_height))
-    
-    return image_array
+@st.cache_resource
+def load_mirror_scheduler():
+    """按 ANALYTICS_MIRROR_INTERVAL 定期把新記錄同步到 Parquet 分析鏡像（預設不啟用，返回 None）"""
+    if db_manager is None:
+        return None
+    return start_mirror_scheduler(db_manager)
+
+mirror_scheduler = load_mirror_scheduler()
+
+@st.cache_resource
+def report_startup():
+    """輸出啟動導入報告（每個進程只輸出一次）"""
+    startup_profiler.stop()
+    report = startup_profiler.get_report()
+    print(report)
+    return report
+
+startup_report = report_startup()
+
+@st.cache_resource
+def load_performance_recorder():
+    """載入性能指標記錄器（背景批量寫入）"""
+    return PerformanceRecorder(db_manager) if db_manager else None
+
+performance_recorder = load_performance_recorder()
 
 def process_image(image, detection_mode="增強檢測 (推薦)"):
     """處理圖片並檢測回收物 - 優化版"""
@@ -77,63 +100,68 @@ def process_image(image, detection_mode="增強檢測 (推薦)"):
         
         # 預處理圖片以提高速度
         processed_image = preprocess_image(image_np)
+        preprocess_done = time.time()
         
-        # 根據檢測模式選擇檢測方法
-        if detection_mode == "自定義模型 (5類回收物)":
-            # 只使用自定義模型
-            detections = detector.detect_with_custom_model(processed_image)
-        elif detection_mode == "通用模型":
-            # 只使用通用模型
-            detections = detector.detect_with_general_model(processed_image)
-        else:
-            # 增強檢測（推薦）
-            detections = detector.detect_recycling_objects(processed_image)
+        # 內容摘要同時作為圖片存儲的文件名和檢測緩存鍵，只計算一次
+        digest = image_digest(processed_image)
+        st.session_state.last_image_digest = None
         
-        # 處理檢測結果
-        results = []
-        for detection in detections:
-            bbox = detection['bbox']
-            original_class_name = detection['class_name']
-            confidence = detection['confidence']
-            source = detection['source']
-            
-            # 計算相對面積
-            img_height, img_width = processed_image.shape[:2]
-            
-            x1, y1, x2, y2 = bbox
-            width = x2 - x1
-            height = y2 - y1
-            object_area = width * height
-            total_image_area = img_width * img_height
-            relative_area = object_area / total_image_area
+        # 通過准入控制排隊，避免突發請求造成線程爭用
+        session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex)
+        with get_inference_admission().admit(session_id) as ticket:
+            if ticket.degraded:
+                st.info("⏳ 系統忙碌中，已使用快速檢測模式")
             
-            # 計算價格（使用映射後的類別名稱）
-            price_info = price_calculator.calculate_price(original_class_name, relative_area)
-            
-            # 獲取映射後的類別名稱用於顯示
-            mapped_class_name = price_calculator.map_class_name(original_class_name)
-            
-            results.append({
-                'bbox': bbox,
-                'original_class_name': original_class_name,  # 原始檢測類別
-                'class_name': mapped_class_name,  # 映射後的顯示類別
-                'confidence': confidence,
-                'source': source,
-                'relative_area': relative_area,
-                'price_info': price_info
-            })
+            detect_start = time.time()
+            # 根據檢測模式選擇檢測方法
+            if detection_mode == "自定義模型 (5類回收物)":
+                # 只使用自定義模型
+                detections = detector.detect_with_custom_model(processed_image, digest=digest)
+            elif detection_mode == "通用模型":
+                # 只使用通用模型
+                detections = detector.detect_with_general_model(processed_image, digest=digest)
+            else:
+                # 增強檢測（推薦）
+                detections = detector.detect_recycling_objects(processed_image, degraded=ticket.degraded,
+                                                               digest=digest)
+            detect_done = time.time()
+        # 通過准入並完成檢測後才記下摘要，圖片在檢測記錄提交後才保存（見 display_price_info）
+        st.session_state.last_image_digest = digest
+        
+        # 處理檢測結果（計算相對面積和價格）
+        results = price_calculator.price_detections(detections, processed_image.shape)
         
         processing_time = time.time() - start_time
         print(f"圖片處理總時間: {processing_time:.3f}秒")
         
+        # 記錄性能指標（背景批量寫入，不阻塞頁面）
+        if performance_recorder is not None:
+            cache_status = detector.last_cache_status()
+            performance_recorder.record(
+                detection_mode=detection_mode,
+                image_width=processed_image.shape[1],
+                image_height=processed_image.shape[0],
+                detection_count=len(results),
+                cache_hit=None if cache_status is None else cache_status != 'miss',
+                queue_ms=ticket.wait_time * 1000,
+                preprocess_ms=(preprocess_done - start_time) * 1000,
+                detect_ms=(detect_done - detect_start) * 1000,
+                pricing_ms=(time.time() - detect_done) * 1000,
+                total_ms=processing_time * 1000,
+                model_version=detector.model_version
+            )
+        
         return processed_image, results
     
+    except AdmissionRejected as e:
+        st.warning(f"⚠️ {e}")
+        return None, []
     except Exception as e:
         st.error(f"處理圖片時發生錯誤: {e}")
         return None, []
 
-def display_price_info(price_info_list):
-    """顯示價格資訊"""
+def display_price_info(price_info_list, image=None):
+    """顯示價格資訊並保存檢測記錄（image 為檢測用的圖片，記錄提交後保存到圖片存儲）"""
     if not price_info_list:
         st.warning("無法估算價格，請檢查檢測結果")
         return
@@ -162,16 +190,23 @@ def display_price_info(price_info_list):
             st.write(f"**${price_info['price']:.2f}**")
     
     # 保存檢測記錄到數據庫
-    if db_manager:
+    if write_behind:
+        image_store = get_image_store()
+        digest = st.session_state.get('last_image_digest') if image_store and image is not None else None
         try:
-            db_manager.save_detection_record(
+            write_behind.submit_detection(
                 detection_mode=st.session_state.get('current_detection_mode', '未知'),
                 total_detections=len(price_info_list),
                 detection_results=price_info_list,
-                total_price=total_price
+                total_price=total_price,
+                image_digest=digest
             )
         except Exception as e:
             st.error(f"保存檢測記錄時出錯: {e}")
+            return
+        # 圖片在背景寫入，檢測記錄只保存摘要
+        if digest:
+            image_store.put(image, digest)
 
 def show_feedback_section(detection_results=None):
     """顯示反饋區域"""
@@ -179,7 +214,119 @@ def show_feedback_section(detection_results=None):
         st.markdown("---")
         feedback_system.create_feedback_form(detection_results)
 
+def show_export_sidebar():
+    """側邊欄的數據匯出（寫入 data/exports，小文件可直接下載）"""
+    if db_manager is None:
+        return
+    with st.sidebar.expander("📤 匯出數據", expanded=False):
+        dataset = st.selectbox("數據集", list(DATASETS),
+                               format_func=lambda name: {'detections': "檢測歷史", 'feedback': "用戶反饋"}[name])
+        fmt = st.selectbox("格式", EXPORT_FORMATS)
+        date_range = st.date_input("日期範圍（可選）", value=())
+        mode = st.text_input("檢測模式 / 反饋類型（可選）").strip() or None
+        
+        filters = {'mode': mode}
+        if len(date_range) == 2:
+            filters['since'] = date_range[0].isoformat()
+            filters['until'] = (date_range[1] + timedelta(days=1)).isoformat()
+        
+        if st.button("準備匯出"):
+            # 分批寫入 data/exports 下的文件，匯出過程中不在內存中累積所有記錄
+            export_config = performance_config.get_export_config()
+            file_name = export_filename(dataset, fmt, filters)
+            try:
+                path = export_path(export_config['directory'], file_name)
+                with st.spinner("正在匯出..."):
+                    count = export_to_file(db_manager, dataset, fmt, path, **filters)
+            except (ImportError, ValueError) as e:
+                st.error(str(e))
+                return
+            st.success(f"已匯出 {count} 條記錄到 `{path}`")
+            
+            size = os.path.getsize(path)
+            if size <= export_config['download_max_bytes']:
+                with open(path, 'rb') as exported:
+                    st.download_button(f"⬇️ 下載 {count} 條記錄", data=exported.read(),
+                                       file_name=file_name, mime=MIME_TYPES[fmt])
+            else:
+                # 大文件讀入內存下載會佔用大量內存，改為直接從服務器取得文件
+                command = f"python -m src.data_export {dataset} --format {fmt}" + ''.join(
+                    f" --{key} {shlex.quote(value)}" for key, value in filters.items() if value)
+                st.info(f"文件較大（{size / 1024 / 1024:.0f} MB），請直接從服務器取得，"
+                        f"或用命令行匯出：`{command}`")
+
+def show_performance_page():
+    """顯示性能監控頁面"""
+    st.title("♻️ 資源回收物分類檢測系統")
+    if db_manager is None:
+        st.error("數據庫未載入")
+        return
+    PerformanceDashboard(db_manager).show_performance_dashboard()
+
+def show_trends_page():
+    """顯示檢測趨勢頁面（分桶統計結果有緩存，只在相關時段有新記錄時重新查詢）"""
+    import pandas as pd
+    
+    st.title("♻️ 資源回收物分類檢測系統")
+    if db_manager is None:
+        st.error("數據庫未載入")
+        return
+    st.subheader("📊 檢測趨勢")
+    
+    buckets = {"每小時": 'hour', "每日": 'day', "每週": 'week'}
+    bucket = buckets[st.selectbox("時間粒度", list(buckets), index=1)]
+    date_range = st.date_input("日期範圍", value=(date.today() - timedelta(days=30), date.today()))
+    since = until = None
+    if len(date_range) == 2:
+        since = date_range[0].isoformat()
+        until = (date_range[1] + timedelta(days=1)).isoformat()
+    
+    # 分析鏡像已啟用且最近同步過時從 Parquet 讀取，不與應用爭用 SQLite；否則查詢數據庫
+    series = None
+    if mirror_scheduler is not None and mirror_scheduler.is_fresh():
+        try:
+            series = mirror_scheduler.mirror.detection_series(bucket, since, until)
+            st.caption(f"數據來自分析鏡像（{time.time() - mirror_scheduler.last_sync:.0f} 秒前同步）")
+        except Exception as e:
+            print(f"⚠️ 讀取分析鏡像失敗，改為查詢數據庫: {e}")
+    if series is None:
+        series = db_manager.get_detection_series(bucket, since, until)
+    if not series:
+        st.info("所選範圍內沒有檢測記錄")
+        return
+    
+    df = pd.DataFrame(series).set_index('bucket')
+    col1, col2, col3 = st.columns(3)
+    col1.metric("檢測次數", int(df['records'].sum()))
+    col2.metric("檢測物件", int(df['detections'].sum()))
+    col3.metric("總價值", f"${df['total_value'].sum():.2f}")
+    st.line_chart(df[['total_value', 'cumulative_value']])
+    
+    st.subheader("🏷️ 各類別價值")
+    categories = pd.DataFrame(db_manager.get_category_value_series(bucket, since, until))
+    if not categories.empty:
+        categories['category'] = categories['category'].fillna(categories['category_id'].astype(str))
+        st.bar_chart(categories.pivot_table(index='bucket', columns='category', values='total_value',
+                                            aggfunc='sum', fill_value=0))
+    
+    st.subheader("🔀 檢測模式分布")
+    modes = pd.DataFrame(db_manager.get_mode_mix_series(bucket, since, until))
+    st.bar_chart(modes.pivot_table(index='bucket', columns='detection_mode', values='share',
+                                   aggfunc='sum', fill_value=0))
+    
+    cache_stats = db_manager.get_analytics_cache_stats()
+    st.caption(f"查詢緩存: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}")
+
 def main():
+    # 頁面選擇
+    page = st.sidebar.radio("頁面", ["♻️ 回收物檢測", "📊 檢測趨勢", "📈 性能監控"])
+    if page == "📈 性能監控":
+        show_performance_page()
+        return
+    if page == "📊 檢測趨勢":
+        show_trends_page()
+        return
+    
     st.title("♻️ 資源回收物分類檢測系統")
     
     # 初始化會話狀態
@@ -240,7 +387,33 @@ def main():
         value=0.5,
         step=0.1
     )
-    
+
+    # 啟動導入報告
+    with st.sidebar.expander("📦 啟動導入報告", expanded=False):
+        st.code(startup_report)
+
+    # 檢測器運行指標
+    if detector is not None:
+        with st.sidebar.expander("📊 檢測指標", expanded=False):
+            metrics = detector.get_metrics()
+            st.write(f"檢測請求: {metrics['requests']}")
+            st.write(f"合併重複請求: {metrics['coalesced_requests']} ({metrics['duplicate_rate']:.1%})")
+            st.write(f"緩存命中: 內存 {metrics['memory_hits']} / 磁碟 {metrics['disk_hits']}")
+            admission_stats = get_inference_admission().get_stats()
+            st.write(f"排隊中: {admission_stats['queue_depth']}，"
+                     f"拒絕: {admission_stats['rejected_queue_full'] + admission_stats['rejected_timeout']}")
+            if write_behind is not None:
+                writer_stats = write_behind.get_stats()
+                st.write(f"待寫入記錄: {writer_stats['queue_depth']}，"
+                         f"寫入耗時: 平均 {writer_stats['avg_flush_ms']:.1f}ms / 最長 {writer_stats['max_flush_ms']:.1f}ms")
+            image_store = get_image_store()
+            if image_store is not None:
+                store_stats = image_store.get_stats()
+                st.write(f"圖片存儲: 新增 {store_stats['stored']}，重複 {store_stats['deduplicated']}，"
+                         f"待寫入 {store_stats['pending']}")
+
+    show_export_sidebar()
+
     # 主要內容區域
     col1, col2 = st.columns([1, 1])
     
@@ -300,7 +473,7 @@ def main():
                                         st.warning("⚠️ 此結果可能不準確，建議使用自定義模型重新檢測")
                             
                             # 顯示價格資訊
-                            display_price_info(filtered_detections)
+                            display_price_info(filtered_detections, processed_image)
                             
                             # 顯示反饋區域
                             show_feedback_section(filtered_detections)
@@ -368,7 +541,7 @@ def main():
                                     st.write(f"**相對面積:** {detection['relative_area']:.3f}")
                             
                             # 顯示價格資訊
-                            display_price_info(filtered_detections)
+                            display_price_info(filtered_detections, processed_image)
                             
                             # 顯示反饋區域
                             show_feedback_section(filtered_detections)